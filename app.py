@@ -1,14 +1,34 @@
 from dash import Dash, dcc, html, page_container
 import dash
+import flask
 import warnings
 
 # Initialize the app
 app = Dash(__name__, use_pages=True, suppress_callback_exceptions=True)
 app.title = "DEXA Dashboard"
+# WSGI entry point: gunicorn -c gunicorn.conf.py app:server
+server = app.server
 
 # Import pages here
 from pages import overview, body_part_trend
 
+from dexa import store
+
+from dexa import figure_cache, metrics, profiling
+
+# Figure cache hit/miss counters
+@app.server.route('/cache-stats')
+def cache_stats():
+    return flask.jsonify(figure_cache.stats())
+
+# Opt-in cProfile + flamegraph stacks of single callbacks (DEXA_PROFILE, DEXA_PROFILE_TOKEN).
+# Installed first: Flask runs after_request hooks in reverse, so the metrics
+# below stop their clock before a profile is written
+profiling.install(app)
+# Per-phase callback timings, data load timings and a log line per callback
+# at /metrics (Prometheus text format)
+metrics.instrument(app)
+
 # App Layout
 app.layout = html.Div([
     # Header
@@ -25,7 +45,8 @@ app.layout = html.Div([
         dcc.Link("Overview", href="/", className='nav-link'),
         dcc.Link("Body Part Trends", href="/body-part-trend", className='nav-link'),
         dcc.Link("Composition Indices", href="/dexa-dashboard", className='nav-link'),
-        dcc.Link("Symmetry", href="/symmetry", className='nav-link')
+        dcc.Link("Symmetry", href="/symmetry", className='nav-link'),
+        dcc.Link("Cohort", href="/cohort", className='nav-link')
     ], style={
         'textAlign': 'center',
         'padding': '1rem',
@@ -116,4 +137,7 @@ app.index_string = '''
 
 # Run the app
 if __name__ == '__main__':
+    # Pick up new scans without restarting (local and SQLite modes; under
+    # gunicorn each worker starts its own watcher, see gunicorn.conf.py)
+    store.start_watching()
     app.run_server(debug=False, host='0.0.0.0', port=8080)  # Production configuration
@@ -0,0 +1,143 @@
+// Clientside callbacks for pages/body_part_trend.py.
+// The selected patient's series arrive once per patient change in the
+// 'body-part-data' store; button toggling and chart rendering happen here, so
+// clicking a body part never calls the server. This mirrors toggle_selection
+// and build_charts in the page module, which serve DEXA_BODY_PART_RENDERING=server.
+
+function bodyPartButton(selected) {
+    return selected ? 'body-part-btn selected' : 'body-part-btn';
+}
+
+function isSelected(className) {
+    return (className || '').indexOf('selected') !== -1;
+}
+
+// Apply a click on button triggeredIndex to the current classes
+function toggleSelection(parts, currentClasses, triggeredIndex) {
+    const totalIndex = parts.indexOf('Total');
+    const switchingFromTotal = isSelected(currentClasses[totalIndex]) && triggeredIndex !== totalIndex;
+
+    return parts.map(function (part, i) {
+        if (switchingFromTotal) {
+            // Selecting another part while Total is selected deselects everything else
+            return bodyPartButton(i === triggeredIndex);
+        }
+        const wasSelected = isSelected(currentClasses[i]);
+        return bodyPartButton(i === triggeredIndex ? !wasSelected : wasSelected);
+    });
+}
+
+// A missing value arrives as null; the server path formats it as NaN does
+function formatRatio(fat, lean) {
+    if (fat == null || lean == null) {
+        return 'nan:1';
+    }
+    const ratio = fat / lean;
+    const denominator = ratio < 1 ? Math.round(1 / ratio) : 1;
+    return (ratio * denominator).toFixed(1) + ':' + denominator;
+}
+
+function formatGrams(value) {
+    return value == null ? 'nan' : value.toLocaleString('en-US', {maximumFractionDigits: 0});
+}
+
+function component(type, children, style) {
+    const props = {children: children};
+    if (style) {
+        props.style = style;
+    }
+    return {namespace: 'dash_html_components', type: type, props: props};
+}
+
+// A fresh copy of a figure shell, since Plotly writes into the layouts it draws
+function withData(shell, data) {
+    const layout = JSON.parse(JSON.stringify(shell.layout));
+    return {data: data, layout: layout};
+}
+
+function buildCharts(series, selectedParts, shells) {
+    const colors = shells.colors;
+    const massTraces = [];
+    const ratioTraces = [];
+    selectedParts.forEach(function (part, i) {
+        const partData = series[part] || {dates: [], fat: [], lean: []};
+        massTraces.push({
+            type: 'scatter', x: partData.dates, y: partData.fat, name: part + ' - Fat',
+            line: {color: colors[i], width: 3, dash: 'dot'}, mode: 'lines+markers', xaxis: 'x', yaxis: 'y'
+        });
+        massTraces.push({
+            type: 'scatter', x: partData.dates, y: partData.lean, name: part + ' - Lean',
+            line: {color: colors[i], width: 3}, mode: 'lines+markers', xaxis: 'x', yaxis: 'y2'
+        });
+        ratioTraces.push({
+            type: 'scatter', x: partData.dates,
+            y: partData.fat.map(function (fat, j) {
+                const lean = partData.lean[j];
+                return fat === null || lean === null ? null : fat / lean;
+            }),
+            name: part, line: {color: colors[i], width: 3}, mode: 'lines+markers'
+        });
+    });
+
+    // Stats card: every selected part measured on the latest scan date
+    let latestDate = null;
+    selectedParts.forEach(function (part) {
+        const dates = series[part] ? series[part].dates : [];
+        if (dates.length && (latestDate === null || dates[dates.length - 1] > latestDate)) {
+            latestDate = dates[dates.length - 1];
+        }
+    });
+    const statsCard = [component('H4', 'Latest Measurements', {marginBottom: '15px'})];
+    selectedParts.forEach(function (part) {
+        const partData = series[part];
+        const j = partData ? partData.dates.indexOf(latestDate) : -1;
+        if (j === -1) {
+            return;
+        }
+        const fat = partData.fat[j];
+        const lean = partData.lean[j];
+        statsCard.push(
+            component('H5', part, {marginTop: '10px', marginBottom: '5px'}),
+            component('P', 'Fat Mass: ' + formatGrams(fat) + 'g'),
+            component('P', 'Lean Mass: ' + formatGrams(lean) + 'g'),
+            component('P', 'Fat:Lean Ratio: ' + formatRatio(fat, lean))
+        );
+    });
+
+    return [withData(shells.mass, massTraces), withData(shells.ratio, ratioTraces), statsCard];
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    bodyPartTrend: {
+        updateCharts: function (nClicks, series, currentClasses, shells) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!series || !shells) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate];
+            }
+            const ctx = window.dash_clientside.callback_context;
+            const parts = ctx.inputs_list[0].map(function (input) { return input.id.index; });
+
+            let newClasses = currentClasses.map(function (className) { return className || 'body-part-btn'; });
+            const triggered = ctx.triggered.length ? ctx.triggered[0].prop_id : '';
+            if (triggered.indexOf('body-part-button') !== -1) {
+                const triggeredId = JSON.parse(triggered.slice(0, triggered.lastIndexOf('.')));
+                newClasses = toggleSelection(parts, currentClasses, parts.indexOf(triggeredId.index));
+            }
+            // A patient change (new series) keeps the current selection
+
+            let selectedParts = parts.filter(function (part, i) { return isSelected(newClasses[i]); });
+
+            // If no parts are selected, default to Total
+            if (!selectedParts.length) {
+                selectedParts = ['Total'];
+                newClasses = parts.map(function (part) { return bodyPartButton(part === 'Total'); });
+            }
+
+            if (!selectedParts.some(function (part) { return series[part]; })) {
+                const empty = {data: [], layout: {}};
+                return [empty, empty, [component('P', 'No data available')], newClasses];
+            }
+            return buildCharts(series, selectedParts, shells).concat([newClasses]);
+        }
+    }
+});
@@ -0,0 +1,98 @@
+"""Loaders, derived tables and page callbacks at 1k, 10k and 100k scans.
+
+The callbacks are timed through the ``build_*`` function each one runs on a
+figure cache miss, against a snapshot of the synthetic tables, so every round
+does the full work. Each benchmark also checks its output.
+"""
+import os
+
+from dexa import catalog, columnar, rollups, store, symmetry
+
+# Loading and rebuilding the 100k tables takes seconds: a few rounds are enough
+SLOW = dict(rounds=3, iterations=1)
+
+TREND_PARTS = ["Total", "Left Arm", "Right Arm", "Left Leg", "Right Leg"]
+
+
+def scan_count(frame):
+    return frame["Unique ID"].nunique()
+
+
+def test_load_master_csv(benchmark, dataset):
+    master = benchmark.pedantic(lambda: catalog.parse_frame(catalog.read_csv(dataset.master_path)), **SLOW)
+    assert scan_count(master) == scan_count(dataset.snapshot.master)
+    assert len(master) == len(dataset.snapshot.master)
+
+
+def test_load_composition_csv(benchmark, dataset):
+    composition = benchmark.pedantic(lambda: catalog.parse_frame(catalog.read_csv(dataset.composition_path)), **SLOW)
+    assert len(composition) == len(dataset.snapshot.composition)
+
+
+def test_load_master_columnar(benchmark, dataset):
+    path = os.path.join(dataset.directory, "master_dexa_data.store")
+    if not os.path.exists(path):
+        columnar.write(dataset.snapshot.master, path)
+    master = benchmark.pedantic(lambda: columnar.read(path), **SLOW)
+    assert master["Lean (g)"].equals(dataset.snapshot.master["Lean (g)"])
+
+
+def test_build_derived(benchmark, dataset):
+    snapshot = dataset.snapshot
+    derived = benchmark.pedantic(lambda: store._build_derived(snapshot.master, snapshot.composition), **SLOW)
+    assert derived.keys() == snapshot.derived.keys()
+
+
+def test_calculate_symmetry(benchmark, dataset):
+    scores = benchmark.pedantic(lambda: symmetry.calculate_symmetry(dataset.snapshot.master), **SLOW)
+    assert len(scores) == scan_count(dataset.snapshot.master)
+
+
+def test_build_rollup(benchmark, dataset):
+    rollup = benchmark.pedantic(lambda: rollups.Rollup.build(dataset.snapshot.master), **SLOW)
+    assert len(rollup.scan_ids) == scan_count(dataset.snapshot.master)
+    assert rollup.select().patients == dataset.snapshot.master["Patient Name"].nunique()
+
+
+def test_add_to_rollup(benchmark, dataset):
+    # One ingestion run's worth of scans appended to the rest
+    master = dataset.snapshot.master
+    appended = master["Unique ID"].isin(master["Unique ID"].unique()[:20])
+    previous = rollups.Rollup.build(master[~appended])
+    rollup = benchmark(previous.add, master[appended])
+    assert len(rollup.scan_ids) == scan_count(master)
+
+
+def test_update_page_content(benchmark, dataset, pages):
+    result = benchmark(pages.overview.build_page_content, dataset.snapshot, dataset.patient)
+    main_fig = result[4]
+    total = dataset.snapshot.derived["master_index"].part(dataset.patient, "Total")
+    assert len(main_fig["data"][0]["x"]) == len(total)
+
+
+def test_update_charts(benchmark, dataset, pages):
+    main_fig, ratio_fig, _ = benchmark(pages.body_part_trend.build_charts, dataset.snapshot, dataset.patient,
+                                       TREND_PARTS)
+    assert len(ratio_fig["data"]) == len(TREND_PARTS)
+
+
+def test_update_graphs(benchmark, dataset, pages):
+    graphs = benchmark(pages.dexa_dashboard.build_graphs, dataset.snapshot, dataset.patient)
+    assert len(graphs) == 1
+
+
+def test_update_graphs_grid(benchmark, dataset, pages):
+    graphs = benchmark(pages.dexa_dashboard.build_graphs, dataset.snapshot, dataset.patient, "grid")
+    assert len(graphs) > 1
+
+
+def test_update_symmetry_graphs(benchmark, dataset, pages):
+    *_, table = benchmark(pages.symmetry.build_symmetry_graphs, dataset.snapshot, dataset.patient, "Lean")
+    assert len(table) == len(dataset.snapshot.derived["symmetry"].patient(dataset.patient))
+
+
+def test_update_cohort(benchmark, dataset, pages):
+    months = dataset.snapshot.derived["cohort_rollup"].months()
+    summary, box, histogram, table = benchmark(pages.cohort.build_cohort, dataset.snapshot, "Lean (g)", ["Female"],
+                                               ["40-49", "50-59", "60-69"], months, "Total")
+    assert len(table) == len(dataset.snapshot.derived["cohort_rollup"].parts)
@@ -0,0 +1,103 @@
+"""Peak memory of streaming ingestion as the archive grows.
+
+Reports are ingested a batch at a time (``dexa.ingest.pipeline``), so the
+peak should not grow with the number of rows. Some state does grow with the
+archive: the manifests' entries and the store's categories (one Unique ID per
+scan). The test therefore compares growth. Going from ``N_SMALL`` to
+``N_LARGE`` reports must add well under a quarter of what ingesting the large
+folder as a single batch adds. The reports' text is read from a text cache
+filled beforehand, so the traced runs measure the pipeline, not pdfminer.
+
+A reprocess stages every row and merges them back, which needs the staged
+keys: the merge must hold them as compact hashes, a few dozen bytes a row.
+"""
+import contextlib
+import filecmp
+import io
+import os
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from dexa.ingest import text_cache, writer
+from dexa.ingest.reports import update_csvs
+
+N_SMALL, N_LARGE = 60, 240
+BATCH_SIZE = 20
+OUTPUTS = ("master_dexa_data.csv", "composition_indices.csv")
+
+
+def ingest(folder, output, batch_size):
+    """ Fill both CSVs in ``output`` from ``folder``; returns the peak traced memory in bytes. """
+    os.makedirs(output)
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            update_csvs(folder, *(os.path.join(output, filename) for filename in OUTPUTS),
+                        workers=1, batch_size=batch_size)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture(scope="module")
+def folders(tmp_path_factory):
+    """ A folder of ``N_LARGE`` reports and one linking to the first ``N_SMALL``, their text cached. """
+    tmp = tmp_path_factory.mktemp("memory")
+    paths = synthetic.write_reports(str(tmp / "large"), N_LARGE)
+    small = tmp / "small"
+    small.mkdir()
+    for path in paths[:N_SMALL]:
+        os.symlink(path, small / os.path.basename(path))
+    cache_dir, text_cache.CACHE_DIR = text_cache.CACHE_DIR, str(tmp / "text_cache")
+    (tmp / "warm").mkdir()
+    with contextlib.redirect_stdout(io.StringIO()):
+        update_csvs(str(tmp / "large"), *(str(tmp / "warm" / filename) for filename in OUTPUTS))
+    yield str(small), str(tmp / "large")
+    text_cache.CACHE_DIR = cache_dir
+
+
+def test_ingest_peak_memory_is_flat(folders, tmp_path, monkeypatch):
+    small, large = folders
+    # Read the CSVs back in chunks smaller than the test archive, as a real archive would be
+    monkeypatch.setattr(writer, "CHUNK_ROWS", 500)
+    small_peak = ingest(small, str(tmp_path / "small"), BATCH_SIZE)
+    large_peak = ingest(large, str(tmp_path / "large"), BATCH_SIZE)
+    one_batch_peak = ingest(large, str(tmp_path / "one_batch"), N_LARGE)
+
+    for filename in OUTPUTS:
+        assert filecmp.cmp(tmp_path / "large" / filename, tmp_path / "one_batch" / filename, shallow=False)
+    print(f"\npeak MB: {N_SMALL} reports {small_peak / 1e6:.2f}, {N_LARGE} reports {large_peak / 1e6:.2f}, "
+          f"{N_LARGE} in one batch {one_batch_peak / 1e6:.2f}")
+    assert large_peak - small_peak < (one_batch_peak - small_peak) / 4
+
+
+
+def merge_peak(directory, n_rows):
+    """ Peak traced memory of merging ``n_rows`` staged rows over a CSV of the same ``n_rows`` keys. """
+    csv_path = os.path.join(directory, f"{n_rows}.csv")
+    frame = pd.DataFrame({"Unique ID": [f"PATIENT_{i // 14:06d}_01-01-2020" for i in range(n_rows)],
+                          "Body Part": [synthetic.BODY_PARTS[i % 14] for i in range(n_rows)],
+                          "Scan Date": "01-01-2020", "Lean (g)": "1000"})
+    frame.to_csv(csv_path, index=False)
+    table_writer = writer.TableWriter(csv_path, ["Unique ID", "Body Part"])
+    for start in range(0, n_rows, BATCH_SIZE * 14):
+        table_writer.write(frame[start:start + BATCH_SIZE * 14].copy())
+    tracemalloc.start()
+    try:
+        assert table_writer._merge_staged() == n_rows
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_merge_peak_memory_per_staged_row(tmp_path, monkeypatch):
+    # A reprocess stages every row, so what the merge keeps per staged key bounds its memory:
+    # about 60 bytes a row for the hashes and their sort, against about 170 for a dict of key tuples
+    monkeypatch.setattr(writer, "CHUNK_ROWS", 500)
+    small, large = 5_000, 50_000
+    per_row = (merge_peak(str(tmp_path), large) - merge_peak(str(tmp_path), small)) / (large - small)
+    print(f"\nmerge: {per_row:.0f} bytes per staged row")
+    assert per_row < 96
@@ -0,0 +1,68 @@
+"""Report parsing throughput: composition indices, regional rows and whole reports.
+
+Each benchmark also checks its output, so a faster parser that reads
+different values fails instead of passing.
+"""
+import re
+
+from dexa.ingest import body_parts, composition, text_cache
+from dexa.ingest.reports import parse_report
+from dexa.ingest.text import report_pages
+
+# A fixed scan header, so the composition benchmarks time only the index parsing
+HEADER = ("PATIENT_000001_01-02-2020", "PATIENT_000001", "01-02-2020")
+
+def search_each_field(text, unique_id, patient_name, scan_date):
+    """ The composition indices as read before the tokenizer: one search per field. """
+    indices_data = {"Unique ID": unique_id, "Patient Name": patient_name, "Scan Date": scan_date}
+    for field, friendly_name in composition.COMPOSITION_INDICES_FIELDS.items():
+        match = re.search(rf"{field}\s+([\d.]+)", text)
+        indices_data[friendly_name] = float(match.group(1)) if match else None
+    return indices_data
+
+
+def parse_indices(extract, texts):
+    return [extract(text, *HEADER) for text in texts]
+
+
+def test_composition_tokenizer_page(benchmark, page_texts):
+    rows = benchmark(parse_indices, composition.extract_composition_indices, page_texts)
+    assert rows == parse_indices(search_each_field, page_texts)
+
+
+def test_composition_search_each_field_page(benchmark, page_texts):
+    benchmark(parse_indices, search_each_field, page_texts)
+
+
+def test_composition_tokenizer_block(benchmark, indices_texts):
+    rows = benchmark(parse_indices, composition.extract_composition_indices, indices_texts)
+    assert rows == parse_indices(search_each_field, indices_texts)
+
+
+def test_composition_labels_do_not_overlap():
+    # The tokenizer relies on no label matching inside another label
+    labels = [label.replace("\\", "") for label in composition.COMPOSITION_INDICES_FIELDS]
+    for field in composition.COMPOSITION_INDICES_FIELDS:
+        assert [label for label in labels if re.search(field, label[1:])] == []
+
+
+def test_body_part_page_rows(benchmark, report_pages):
+    rows = benchmark(lambda: [body_parts.page_rows(page) for pages in report_pages for page in pages])
+    assert sum(len(page_rows) for page_rows in rows) == len(report_pages) * len(body_parts.BODY_PARTS)
+
+
+def test_page_lines(benchmark, report_pdfs):
+    pages = benchmark.pedantic(lambda: [list(report_pages(path)) for path in report_pdfs], rounds=5)
+    assert all(len(report) == 2 for report in pages)
+
+
+def test_report_pages_cached(benchmark, report_pdfs, tmp_path, monkeypatch):
+    monkeypatch.setattr(text_cache, "CACHE_DIR", str(tmp_path))
+    extracted = [list(report_pages(path)) for path in report_pdfs]
+    assert benchmark(lambda: [list(report_pages(path)) for path in report_pdfs]) == extracted
+
+
+def test_parse_report(benchmark, report_pdfs):
+    reports = benchmark.pedantic(lambda: [parse_report(path) for path in report_pdfs], rounds=5)
+    assert all(len(rows.body_parts) == len(body_parts.BODY_PARTS) and len(rows.composition) == 1
+               for rows in reports)
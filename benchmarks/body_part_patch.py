@@ -0,0 +1,108 @@
+"""Body Part Trends server path: Patch responses versus full figures.
+
+    DEXA_DATA_SOURCE=local python benchmarks/body_part_patch.py
+
+For selections of 1 to 9 parts, adds one more part and reports the response
+size of the full figures and stats card (build_charts) and of the partial
+update (patch_charts), both for a part added last and for one added first,
+which also recolors every other part. It also adds Total to a part whose row
+is missing from the patient's newest scan, so the stats card's latest date
+moves. Applying each patch to the previous full response must give the new
+full response; exits non-zero otherwise.
+"""
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DEXA_BODY_PART_RENDERING", "server")
+
+# Importing the app registers the pages and the store's derived tables
+import app  # noqa: F401
+from dexa import store
+from pages import body_part_trend
+
+PARTS = [part for parts in body_part_trend.BODY_PART_GROUPS.values() for part in parts if part != 'Total']
+
+
+def apply_patch(figure, patch):
+    """ Apply Patch operations the way the Dash renderer does. """
+    for operation in patch["operations"]:
+        location, params = operation["location"], operation["params"]
+        if operation["operation"] == "Insert":
+            target = figure
+            for key in location:
+                target = target[key]
+            target.insert(params["index"], params["value"])
+            continue
+        target = figure
+        for key in location[:-1]:
+            target = target[key]
+        if operation["operation"] == "Delete":
+            del target[location[-1]]
+        elif operation["operation"] == "Assign":
+            target[location[-1]] = params["value"]
+        else:
+            raise ValueError(f"Unexpected patch operation {operation['operation']}")
+    return figure
+
+
+class MissingFromLatest:
+    """ A master index in which ``part`` has no row on ``patient``'s newest scan. """
+
+    def __init__(self, index, patient, part):
+        self.index, self.patient, self.missing_part = index, patient, part
+        self.latest = index.part(patient, 'Total')['Scan Date'].max()
+
+    def part(self, patient, part):
+        part_data = self.index.part(patient, part)
+        if (patient, part) == (self.patient, self.missing_part):
+            part_data = part_data[part_data['Scan Date'] < self.latest]
+        return part_data
+
+
+def matches(snapshot, patient, before, after):
+    """ Whether applying the patch from before to after to the full response for before gives the one for after. """
+    full_before = json.loads(to_json_plotly(body_part_trend.build_charts(snapshot, patient, before)))
+    full_after = to_json_plotly(body_part_trend.build_charts(snapshot, patient, after))
+    patch = to_json_plotly(body_part_trend.patch_charts(snapshot, patient, before, after))
+
+    # The stats card is sent in full when the latest scan date changes
+    patched = [apply_patch(value, update) if "__dash_patch_update" in update else update
+               for value, update in zip(full_before, json.loads(patch))]
+    if patched != json.loads(full_after):
+        print(f"MISMATCH going from {before} to {after}")
+        return False, len(full_after), len(patch)
+    return True, len(full_after), len(patch)
+
+
+def main():
+    snapshot = store.snapshot()
+    index = snapshot.derived["master_index"]
+    # A patient with at least two scans, so an older one is left once the newest loses a part
+    patient = next(patient for patient in index.patients() if len(index.part(patient, 'Total')) > 1)
+    mismatches = 0
+    print(f"{'selected':>8}{'full':>12}{'patch (last)':>14}{'patch (first)':>15}")
+    for n in range(1, len(body_part_trend.COLORS)):
+        sizes = []
+        for before in (PARTS[:n], PARTS[1:n + 1]):
+            ok, full_size, patch_size = matches(snapshot, patient, before, PARTS[:n + 1])
+            mismatches += not ok
+            sizes.append(patch_size)
+        print(f"{n:>8}{full_size / 1024:>10.1f}kB{sizes[0] / 1024:>12.1f}kB{sizes[1] / 1024:>13.1f}kB")
+
+    missing = SimpleNamespace(derived={"master_index": MissingFromLatest(index, patient, PARTS[0])})
+    ok, _, _ = matches(missing, patient, [PARTS[0]], [PARTS[0], 'Total'])
+    mismatches += not ok
+
+    if mismatches:
+        sys.exit(1)
+    print("All patches match")
+
+
+if __name__ == "__main__":
+    main()
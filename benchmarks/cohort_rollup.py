@@ -0,0 +1,134 @@
+"""Cohort rollup: incremental updates, accuracy and filter latency.
+
+    python benchmarks/cohort_rollup.py [--scans 100000] [--appended 200] [--repeat 5]
+
+Builds the rollup (``dexa.rollups``) of a synthetic master table without its
+last ``--appended`` scans, then adds them as the store does after an ingestion
+run, and once more with one of them carrying a value beyond the bins, which
+must widen them. For a few filters (sex, age bands, a window of months) it
+checks the cohort equals that of a rollup built from the whole table with the
+same bins, compares its patient count, medians and means with pandas on the
+raw rows (each patient's latest scan in the window) and times the cohort
+page's ``build_cohort``. Exits non-zero if the rollups differ or the bins do
+not widen, a count or a mean differs, a median is off by more than one bin, or
+a filter change takes 100 ms or more.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+
+LIMIT_MS = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=100_000)
+    parser.add_argument("--appended", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DEXA_DATA_SOURCE="local", DEXA_DATA_DIR=tmp, DEXA_CACHE_DIR=os.path.join(tmp, "cache"),
+                          DEXA_RELOAD_INTERVAL="0")
+        synthetic.write(tmp, args.scans, missing=0.02)
+        # Importing the app registers the pages and the store's derived tables
+        import app  # noqa: F401
+        from dexa import rollups, store
+        from pages import cohort
+
+        snapshot = store.snapshot()
+        master = snapshot.master
+        scan_ids = master["Unique ID"].unique()
+        appended = master["Unique ID"].isin(scan_ids[-args.appended:])
+
+        start = time.perf_counter()
+        previous = rollups.Rollup.build(master[~appended])
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        rollup = rollups.update(previous, master, snapshot.composition, {"master": master[appended]})
+        update_time = time.perf_counter() - start
+        scratch = rollups.Rollup.empty(previous.parts, previous.edges).add(master)
+        print(f"{args.scans} scans, {len(master)} master rows: "
+              f"{(rollup.bins.nbytes + rollup.values.nbytes) / 1e6:.1f} MB of bins and values")
+        print(f"build {build_time * 1000:.0f} ms, add {args.appended} scans {update_time * 1000:.1f} ms")
+        incremental = rollup
+        ok = True
+
+        # A value past every bin edge: the bins must widen and match a rollup of the same rows from scratch
+        outlier = master[appended].copy()
+        outlier.iloc[0, outlier.columns.get_loc("Lean (g)")] = master["Lean (g)"].max() * 2
+        widened = rollups.update(previous, master, snapshot.composition, {"master": outlier})
+        rebuilt = rollups.Rollup.empty(previous.parts, previous.edges).add(pd.concat([master[~appended], outlier]))
+        added, built = widened.select(), rebuilt.select()
+        if np.array_equal(widened.edges, previous.edges, equal_nan=True) or not (
+                np.array_equal(widened.edges, rebuilt.edges) and np.array_equal(added.counts, built.counts)):
+            print("MISMATCH: an appended value beyond the bins did not widen them as a rebuild would")
+            ok = False
+
+        rollup = snapshot.derived["cohort_rollup"]
+        first, last = rollup.months()
+        month = rollups.month_number(master["Scan Date"])
+        band = np.array(rollups.AGE_BANDS)[rollups._age_codes(master["Age"])]
+        filters = [
+            (rollups.SEXES, rollups.AGE_BANDS, (first, last)),
+            (["Female"], rollups.AGE_BANDS, (first, last)),
+            (["Male"], ["40-49", "50-59"], (first + 12, first + 29)),
+            (["Female", "Male"], ["20-29"], (last - 5, last)),
+        ]
+        print(f"\n{'filter':<44}{'patients':>9}{'median error':>14}{'build_cohort':>14}")
+        for sexes, bands, months in filters:
+            in_window = master[(month >= months[0]) & (month <= months[1])]
+            latest = in_window.drop_duplicates("Unique ID").sort_values("Scan Date", kind="mergesort") \
+                .groupby("Patient Name", observed=True).tail(1)["Unique ID"]
+            chosen = master["Unique ID"].isin(latest) & (month >= months[0]) & (month <= months[1])
+            rows = master[chosen & master["Sex"].isin(sexes) & np.isin(band, bands)]
+            selected = rollup.select(sexes=sexes, bands=bands, months=months)
+            added, built = (r.select(sexes=sexes, bands=bands, months=months) for r in (incremental, scratch))
+            if not (np.array_equal(added.counts, built.counts) and np.allclose(added.sums, built.sums)
+                    and added.patients == built.patients):
+                print(f"MISMATCH: the incremental rollup differs from one built from scratch for {sexes}, {bands}")
+                ok = False
+            errors = []
+            for m, metric in enumerate(rollups.METRICS):
+                grouped = rows.groupby("Body Part", observed=True)[metric]
+                medians = grouped.median().reindex(selected.parts).to_numpy()
+                means = grouped.mean().reindex(selected.parts).to_numpy()
+                width = (rollup.edges[:, m, 1] - rollup.edges[:, m, 0]) / rollups.BINS
+                # In bins: how far the interpolated median is from the exact one
+                errors.append(np.nanmax(np.abs(selected.quantile(metric, 0.5) - medians) / width))
+                if not np.allclose(selected.mean(metric), means, equal_nan=True):
+                    print(f"MISMATCH: mean of {metric} for {sexes}, {bands}")
+                    ok = False
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                cohort.build_cohort(snapshot, "Lean (g)", sexes, bands, list(months), "Total")
+                times.append((time.perf_counter() - start) * 1000)
+            label = f"{'+'.join(sexes)}, {len(bands)} age bands, {months[1] - months[0] + 1} months"
+            print(f"{label:<44}{rows['Patient Name'].nunique():>9}{max(errors):>11.2f} bins{min(times):>11.1f} ms")
+            if selected.patients != rows["Patient Name"].nunique():
+                print(f"MISMATCH: {selected.patients} patients counted for {sexes}, {bands}")
+                ok = False
+            if max(errors) > 1:
+                print(f"Median more than one bin off for {sexes}, {bands}")
+                ok = False
+            if min(times) >= LIMIT_MS:
+                print(f"Filter change took {min(times):.0f} ms for {sexes}, {bands}")
+                ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("Rollups match and every filter change stays under 100 ms")
+
+
+if __name__ == "__main__":
+    main()
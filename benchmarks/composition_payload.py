@@ -0,0 +1,90 @@
+"""Composition Indices response: one small-multiples figure versus separate graphs.
+
+    DEXA_DATA_SOURCE=local python benchmarks/composition_payload.py [--patients 5] [--repeat 20]
+
+For each view mode of pages/dexa_dashboard.py, reports what one patient's
+callback response costs: build and serialization time on the server, the size
+of the JSON payload (raw and gzipped), and how many Plotly graphs and traces
+the browser has to create from it. Client render time grows with the number of
+Plotly instances, so the graph count is the client-side number to compare.
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app registers the pages and the store's derived tables
+import app  # noqa: F401
+from dexa import store
+from pages import dexa_dashboard
+
+MODES = ("grid", "combined")
+
+
+def figures_in(children):
+    """ Every figure in a callback's children, as Dash will send them. """
+    found = []
+
+    def walk(node):
+        if isinstance(node, (list, tuple)):
+            for child in node:
+                walk(child)
+        elif hasattr(node, "to_plotly_json"):
+            props = node.to_plotly_json()["props"]
+            if "figure" in props:
+                found.append(props["figure"])
+            walk(props.get("children"))
+
+    walk(children)
+    return found
+
+
+def measure(snapshot, patient, mode, repeat):
+    # The first call builds the cached layouts
+    dexa_dashboard.build_graphs(snapshot, patient, mode)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        children = dexa_dashboard.build_graphs(snapshot, patient, mode)
+    build_ms = (time.perf_counter() - start) / repeat * 1000
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        payload = to_json_plotly(children)
+    json_ms = (time.perf_counter() - start) / repeat * 1000
+
+    figs = figures_in(children)
+    return {
+        "build_ms": build_ms,
+        "json_ms": json_ms,
+        "bytes": len(payload.encode()),
+        "gzip_bytes": len(gzip.compress(payload.encode())),
+        "graphs": len(figs),
+        "traces": sum(len(fig["data"]) for fig in figs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    snapshot = store.snapshot()
+    patients = snapshot.derived["composition_index"].patients()[:args.patients]
+    print(f"{len(patients)} patients, mean per response")
+    print(f"{'mode':<10}{'build':>10}{'json':>10}{'payload':>12}{'gzipped':>12}{'graphs':>8}{'traces':>8}")
+    for mode in MODES:
+        results = [measure(snapshot, patient, mode, args.repeat) for patient in patients]
+        mean = {name: sum(r[name] for r in results) / len(results) for name in results[0]}
+        print(f"{mode:<10}{mean['build_ms']:>8.2f}ms{mean['json_ms']:>8.2f}ms"
+              f"{mean['bytes'] / 1024:>10.1f}kB{mean['gzip_bytes'] / 1024:>10.1f}kB"
+              f"{mean['graphs']:>8.0f}{mean['traces']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
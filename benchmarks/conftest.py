@@ -0,0 +1,84 @@
+"""Fixtures for the pytest-benchmark suite: synthetic reports and their page
+text, and synthetic tables with the pages that read them.
+
+The table benchmarks run at every size in ``DEXA_BENCH_SCANS`` (comma-separated
+scan counts, default 1000,10000,100000).
+"""
+import os
+from types import SimpleNamespace
+
+import pdfplumber
+import pytest
+
+# Time text extraction itself, not the text cache (bench_parsing has its own)
+os.environ["DEXA_TEXT_CACHE_DIR"] = ""
+
+from benchmarks import synthetic
+from dexa import catalog, store
+from dexa.ingest.composition import INDICES_PATTERN
+from dexa.ingest.text import block, page_lines
+
+N_REPORTS = 20
+
+SCANS = [int(n) for n in os.environ.get("DEXA_BENCH_SCANS", "1000,10000,100000").split(",")]
+
+# Fraction of the synthetic measurements left blank, as on real reports
+MISSING = 0.02
+
+
+@pytest.fixture(scope="session")
+def report_pdfs(tmp_path_factory):
+    """ Paths of synthetic reports: the tables on page 1, then a page with neither. """
+    return synthetic.write_reports(str(tmp_path_factory.mktemp("reports")), N_REPORTS, extra_pages=1)
+
+
+@pytest.fixture(scope="session")
+def report_pages(report_pdfs):
+    """ The text lines of every page of every report. """
+    pages = []
+    for path in report_pdfs:
+        with pdfplumber.open(path) as pdf:
+            pages.append([page_lines(page) for page in pdf.pages])
+    return pages
+
+
+@pytest.fixture(scope="session")
+def page_texts(report_pages):
+    """ The full text of each report's first page. """
+    return ["\n".join(pages[0]) for pages in report_pages]
+
+
+@pytest.fixture(scope="session")
+def indices_texts(report_pages):
+    """ The composition indices block of each report. """
+    return [block(pages[0], INDICES_PATTERN, INDICES_PATTERN, after=1) for pages in report_pages]
+
+
+@pytest.fixture(scope="session")
+def pages(tmp_path_factory):
+    """ The page modules, imported with the app's store on a small local dataset. """
+    directory = str(tmp_path_factory.mktemp("app_data"))
+    synthetic.write(directory, 100)
+    catalog.DATA_SOURCE, catalog.DATA_DIR, catalog.CACHE_DIR = "local", directory, os.path.join(directory, "cache")
+    # Importing the app registers the pages and the store's derived tables
+    import app  # noqa: F401
+    from pages import Symmetry, body_part_trend, cohort, dexa_dashboard, overview
+    return SimpleNamespace(overview=overview, body_part_trend=body_part_trend, dexa_dashboard=dexa_dashboard,
+                           symmetry=Symmetry, cohort=cohort)
+
+
+@pytest.fixture(scope="session", params=SCANS, ids=lambda n: f"{n}scans")
+def dataset(request, tmp_path_factory, pages):
+    """
+    Synthetic CSVs of ``n`` scans, their tables and a snapshot with every
+    derived table, and a patient with a typical number of scans.
+    """
+    n = request.param
+    directory = str(tmp_path_factory.mktemp(f"scans{n}"))
+    master_path, composition_path = synthetic.write(directory, n, missing=MISSING)
+    master = catalog.parse_frame(catalog.read_csv(master_path))
+    composition = catalog.parse_frame(catalog.read_csv(composition_path))
+    snapshot = store.Snapshot(1, master, composition, store._build_derived(master, composition))
+    patients = snapshot.derived["master_index"].patients()
+    return SimpleNamespace(scans=n, directory=directory, master_path=master_path, composition_path=composition_path,
+                           snapshot=snapshot, patient=patients[len(patients) // 2])
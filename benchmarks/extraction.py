@@ -0,0 +1,107 @@
+"""Per-report latency of targeted block extraction against full-page text.
+
+    python benchmarks/extraction.py [--reports 50] [--extra-pages 3]
+
+Writes synthetic one-page reports, and the same reports with
+``--extra-pages`` pages holding neither table, then times ``parse_report``
+against the previous extraction (``page.extract_text()`` on every page, the
+regional table read from the first page, composition indices from each
+page) and against reading the lines back from the text cache.
+``page_lines`` must give the same lines as ``page.extract_text()``,
+``parse_report`` must match the previous rows on one-page reports, and
+neither the extra pages nor the cache may change its rows; exits non-zero
+otherwise.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pdfplumber
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Time text extraction itself, not the text cache
+os.environ["DEXA_TEXT_CACHE_DIR"] = ""
+
+from benchmarks import synthetic
+from dexa.ingest import body_parts, composition, text_cache
+from dexa.ingest.reports import ReportRows, parse_report
+from dexa.ingest.text import page_lines, scan_header
+
+
+def full_text_report(pdf_path):
+    """ The rows of one report as extracted before targeted extraction. """
+    with pdfplumber.open(pdf_path) as pdf:
+        texts = [page.extract_text() for page in pdf.pages]
+    regional = body_parts.body_part_rows(texts[0], *scan_header(texts[0])) if texts else []
+    indices = [composition.extract_composition_indices(text, *scan_header(text)) for text in texts]
+    return ReportRows(regional, indices)
+
+
+def per_report(parse, paths):
+    """ Mean milliseconds per report, and the rows of each. """
+    start = time.perf_counter()
+    rows = [parse(path) for path in paths]
+    return (time.perf_counter() - start) / len(paths) * 1000, rows
+
+
+def same_lines(paths):
+    for path in paths:
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                if page_lines(page) != page.extract_text().split("\n"):
+                    return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=50)
+    parser.add_argument("--extra-pages", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single = synthetic.write_reports(os.path.join(tmp, "single"), args.reports)
+        multi = synthetic.write_reports(os.path.join(tmp, "multi"), args.reports, extra_pages=args.extra_pages)
+        # Load pdfminer's fonts and caches before timing anything
+        full_text_report(single[0])
+
+        print(f"{args.reports} reports ({os.cpu_count()} CPUs), ms per report")
+        print(f"{'pages':>6}{'full text':>11}{'targeted':>10}{'speedup':>9}{'cached':>8}{'index rows':>12}")
+        results = {}
+        ok = True
+        for pages, paths in ((1, single), (1 + args.extra_pages, multi)):
+            full_ms, full_rows = per_report(full_text_report, paths)
+            targeted_ms, targeted_rows = per_report(parse_report, paths)
+            # Filled by the first run, read by the second
+            text_cache.CACHE_DIR = os.path.join(tmp, "text_cache")
+            per_report(parse_report, paths)
+            cached_ms, cached_rows = per_report(parse_report, paths)
+            text_cache.CACHE_DIR = None
+            results[pages] = full_rows, targeted_rows
+            ok = ok and cached_rows == targeted_rows
+            print(f"{pages:>6}{full_ms:>11.1f}{targeted_ms:>10.1f}{full_ms / targeted_ms:>8.2f}x{cached_ms:>8.1f}"
+                  f"{sum(len(rows.composition) for rows in full_rows):>6} -> "
+                  f"{sum(len(rows.composition) for rows in targeted_rows)}")
+
+        if not ok:
+            print("MISMATCH: rows read from the text cache differ")
+        if not same_lines(single + multi[:5]):
+            ok = False
+            print("MISMATCH: page_lines differs from page.extract_text()")
+        full_rows, targeted_rows = results[1]
+        if targeted_rows != full_rows:
+            print("MISMATCH: targeted rows differ from full-text rows on one-page reports")
+            ok = False
+        if results[1 + args.extra_pages][1] != targeted_rows:
+            print("MISMATCH: pages without either table changed the targeted rows")
+            ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("Targeted extraction reads the same lines and rows as full-page text")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""Plain-dict figure builders versus the validated plotly objects they replace.
+
+    DEXA_DATA_SOURCE=local python benchmarks/figures.py [--patients 5] [--repeat 20]
+
+For every figure the pages build, checks that the dict built by the page is
+JSON-equivalent to the ``go.Figure`` the page used to build (the ``legacy_*``
+functions below are the previous page code), then times building and
+serializing both with the encoder Dash uses for responses. Exits non-zero if
+any figure differs. Set ``DEXA_JSON_ENGINE`` to compare "json" and "orjson".
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+from plotly.subplots import make_subplots
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app registers the pages and the store's derived tables
+import app  # noqa: F401
+from dexa import store, symmetry
+from pages import Symmetry, body_part_trend, dexa_dashboard, overview
+
+
+def legacy_overview_figures(total_df, patient_composition_df):
+    # Main trends graph
+    main_fig = make_subplots(specs=[[{"secondary_y": True}]])
+    main_fig.add_trace(go.Scatter(x=total_df['Scan Date'], y=total_df['Total Mass (kg)'],
+                                  name="Total Weight", line=dict(color='#2C3E50', width=3)),
+                       secondary_y=False)
+    main_fig.add_trace(go.Scatter(x=total_df['Scan Date'], y=total_df['Lean (g)']/1000,
+                                  name="Lean Mass", line=dict(color='#E74C3C', width=3)),
+                       secondary_y=True)
+    main_fig.update_layout(
+        title="Weight and Lean Mass Trends",
+        height=400,
+        template="plotly_white",
+        showlegend=True,
+    )
+    
+    # Visceral fat graph
+    visceral_fig = px.line(patient_composition_df, x='Scan Date', y='Visceral Fat Area (cm²)',
+                          title="Visceral Fat Area Trend")
+    
+    # Body composition graph
+    comp_fig = go.Figure()
+    comp_fig.add_trace(go.Scatter(x=patient_composition_df['Scan Date'], 
+                                  y=patient_composition_df['Total Body Fat (%)'], name="Fat %"))
+    comp_fig.add_trace(go.Scatter(x=patient_composition_df['Scan Date'], 
+                                  y=patient_composition_df['Total Lean Body (%)'], name="Lean %"))
+    
+    return main_fig, visceral_fig, comp_fig
+
+
+def legacy_body_part_figures(part_frames, selected_parts):
+    # Create main trends figure with dual y-axis
+    main_fig = make_subplots(specs=[[{"secondary_y": True}]])
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', 
+              '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+    
+    for i, part in enumerate(selected_parts):
+        part_data = part_frames[part]
+        
+        # Fat mass on primary y-axis
+        main_fig.add_trace(
+            go.Scatter(
+                x=part_data['Scan Date'],
+                y=part_data['Fat (g)'],
+                name=f"{part} - Fat",
+                line=dict(color=colors[i], width=3, dash='dot'),
+                mode='lines+markers'
+            ),
+            secondary_y=False
+        )
+        
+        # Lean mass on secondary y-axis
+        main_fig.add_trace(
+            go.Scatter(
+                x=part_data['Scan Date'],
+                y=part_data['Lean (g)'],
+                name=f"{part} - Lean",
+                line=dict(color=colors[i], width=3),
+                mode='lines+markers'
+            ),
+            secondary_y=True
+        )
+    
+    main_fig.update_layout(
+        title="Fat Mass and Lean Mass Trends",
+        template="plotly_white",
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False, title="Fat Mass (g)"),
+        yaxis2=dict(showgrid=False, title="Lean Mass (g)"),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    
+    # Create ratio trend figure
+    ratio_fig = go.Figure()
+    
+    for i, part in enumerate(selected_parts):
+        part_data = part_frames[part]
+        ratio = part_data['Fat (g)'] / part_data['Lean (g)']
+        
+        ratio_fig.add_trace(
+            go.Scatter(
+                x=part_data['Scan Date'],
+                y=ratio,
+                name=f"{part}",
+                line=dict(color=colors[i], width=3),
+                mode='lines+markers'
+            )
+        )
+    
+    ratio_fig.update_layout(
+        title="Fat-to-Lean Mass Ratio Trend",
+        template="plotly_white",
+        yaxis_title="Fat:Lean Mass Ratio",
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False)
+    )
+    
+    return main_fig, ratio_fig
+
+
+def legacy_create_symmetry_plot(df, symmetry_type):
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatter(
+        x=df["Scan Date"],
+        y=df[symmetry_type],
+        mode='lines+markers',
+        name=symmetry_type,
+        line=dict(width=2),
+        marker=dict(size=8)
+    ))
+
+    fig.update_layout(
+        title={
+            'text': f"{symmetry_type}",
+            'x': 0.5,
+            'xanchor': 'center'
+        },
+        xaxis_title="Date",
+        yaxis_title="Symmetry Score",
+        yaxis_range=[-0.5, 0.5],
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        showlegend=False,
+        xaxis=dict(
+            showline=True,
+            showgrid=False,
+            linecolor='black',
+            linewidth=1,
+            mirror=True
+        ),
+        yaxis=dict(
+            showgrid=False,
+            linecolor='black',
+            linewidth=1,
+            mirror=True
+        ),
+        height=300,
+        margin=dict(l=50, r=50, t=50, b=50),
+        annotations=[
+            dict(x=0.02, y=0.98, xref="paper", yref="paper",
+                 text="Right side dominant →", showarrow=False),
+            dict(x=0.02, y=0.02, xref="paper", yref="paper",
+                 text="← Left side dominant", showarrow=False)
+        ],
+        shapes=[
+            # Border rectangle
+            dict(
+                type='rect',
+                xref='paper',
+                yref='paper',
+                x0=0,
+                y0=0,
+                x1=1,
+                y1=1,
+                line=dict(
+                    color='black',
+                    width=1,
+                ),
+                layer='below'
+            ),
+            # Red shading for left dominance (negative values)
+            dict(
+                type='rect',
+                xref='paper',
+                yref='y',
+                x0=0,
+                y0=-0.5,
+                x1=1,
+                y1=0,
+                fillcolor='rgba(255,0,0,0.05)',
+                line=dict(width=0),
+                layer='below'
+            ),
+            # Green shading for right dominance (positive values)
+            dict(
+                type='rect',
+                xref='paper',
+                yref='y',
+                x0=0,
+                y0=0,
+                x1=1,
+                y1=0.5,
+                fillcolor='rgba(0,255,0,0.05)',
+                line=dict(width=0),
+                layer='below'
+            ),
+            # Zero line
+            dict(
+                type='line',
+                xref='paper',
+                yref='y',
+                x0=0,
+                y0=0,
+                x1=1,
+                y1=0,
+                line=dict(
+                    color='black',
+                    width=1,
+                    dash='dash'
+                ),
+                layer='below'
+            )
+        ]
+    )
+    
+    return fig
+
+
+def legacy_create_time_series(df, metric):
+    df = df.copy()
+    missing_mask = df[metric].isna()
+    mean_value = df[metric].mean()
+    df[metric].fillna(mean_value, inplace=True)
+
+    fig = go.Figure()
+
+    # Main time series line
+    fig.add_trace(go.Scatter(
+        x=df["Scan Date"],
+        y=df[metric],
+        mode='lines+markers',
+        line=dict(width=2),
+        marker=dict(size=8),
+        name='Actual Data'
+    ))
+
+    # Highlight filled values
+    if missing_mask.any():
+        fig.add_trace(go.Scatter(
+            x=df.loc[missing_mask, "Scan Date"],
+            y=df.loc[missing_mask, metric],
+            mode='markers',
+            marker=dict(color='red', symbol='x', size=10),
+            name='Filled Data (Mean)'
+        ))
+
+    fig.update_layout(
+        title={
+            'text': metric,
+            'x': 0.5,
+            'xanchor': 'center',
+            'y': 0.95
+        },
+        xaxis_title="Date",
+        yaxis_title=metric,
+        showlegend=True,
+        height=250,
+        margin=dict(l=50, r=50, t=50, b=50),
+        xaxis=dict(
+            showgrid=False,
+            zeroline=True,
+            linecolor='black',
+            linewidth=1,
+            mirror=False,
+            showline=True,
+            showspikes=False
+        ),
+        yaxis=dict(
+            showgrid=False,
+            zeroline=False,
+            linecolor='black',
+            linewidth=1,
+            mirror=False,
+            showline=True,
+            showspikes=False
+        ),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=0.85,
+            xanchor="center",
+            x=0.5,
+            bgcolor='rgba(255,255,255,0)',
+            font=dict(size=8)
+        ),
+        # Remove borders
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+
+    return fig
+
+
+def to_dict(fig):
+    """ The figure as the browser receives it. """
+    return json.loads(to_json_plotly(fig))
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def cases(snapshot, patient):
+    """ (name, legacy builder, new builder) for every figure the pages draw for ``patient``. """
+    master_index = snapshot.derived["master_index"]
+    composition_df = snapshot.derived["composition_index"].patient(patient)
+    total_df = master_index.part(patient, 'Total')
+    parts = ['Left Arm', 'Right Arm', 'Trunk']
+    part_frames = {part: master_index.part(patient, part) for part in parts}
+    symmetry_df = snapshot.derived["symmetry"].patient(patient)
+    symmetry_column = symmetry.symmetry_column("Arm", "Lean")
+
+    yield ("overview",
+           lambda: legacy_overview_figures(total_df, composition_df),
+           lambda: overview.build_page_content(snapshot, patient)[4:])
+    yield ("body part trend",
+           lambda: legacy_body_part_figures(part_frames, parts),
+           lambda: body_part_trend.build_charts(snapshot, patient, parts)[:2])
+    yield ("symmetry",
+           lambda: [legacy_create_symmetry_plot(symmetry_df, symmetry_column)],
+           lambda: [Symmetry.create_symmetry_plot(symmetry_df, symmetry_column)])
+    yield ("composition time series",
+           lambda: [legacy_create_time_series(composition_df, metric) for metric in dexa_dashboard.METRICS],
+           lambda: [dexa_dashboard.create_time_series(composition_df, metric) for metric in dexa_dashboard.METRICS])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    snapshot = store.snapshot()
+    patients = snapshot.derived["master_index"].patients()[:args.patients]
+    totals = {}
+    mismatches = 0
+    for patient in patients:
+        for name, legacy, new in cases(snapshot, patient):
+            legacy_figs, new_figs = legacy(), new()
+            for legacy_fig, new_fig in zip(legacy_figs, new_figs):
+                if to_dict(legacy_fig) != to_dict(new_fig):
+                    print(f"MISMATCH: {name} figure for {patient}")
+                    mismatches += 1
+
+            build_old, legacy_figs = timed(legacy, args.repeat)
+            build_new, new_figs = timed(new, args.repeat)
+            json_old, _ = timed(lambda: [to_json_plotly(fig) for fig in legacy_figs], args.repeat)
+            json_new, _ = timed(lambda: [to_json_plotly(fig) for fig in new_figs], args.repeat)
+            total = totals.setdefault(name, [0.0, 0.0, 0.0, 0.0])
+            for i, ms in enumerate((build_old, build_new, json_old, json_new)):
+                total[i] += ms / len(patients)
+
+    print(f"JSON engine: {pio.json.config.default_engine}, {len(patients)} patients")
+    print(f"{'figures':<26}{'build (go)':>12}{'build (dict)':>14}{'json (go)':>12}{'json (dict)':>13}")
+    for name, (build_old, build_new, json_old, json_new) in totals.items():
+        print(f"{name:<26}{build_old:>10.2f}ms{build_new:>12.2f}ms{json_old:>10.2f}ms{json_new:>11.2f}ms")
+
+    if mismatches:
+        print(f"{mismatches} figures differ")
+        sys.exit(1)
+    print("All figures match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Incremental ingestion: a few new reports on top of a large backlog.
+
+    python benchmarks/incremental_ingest.py [--reports 500] [--new 5]
+
+Ingests ``--reports`` synthetic reports into both CSVs, then times a rerun
+with nothing new (every report skipped on a stat), a run after ``--new``
+reports are added (only those are parsed and appended) and a run after the
+existing reports are copied under new names (hashed, recognized, skipped).
+The CSVs and columnar copies must equal those of one ingest of every report
+from scratch, and re-ingesting a changed report must still replace its rows;
+exits non-zero otherwise.
+"""
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Time text extraction itself, not the text cache
+os.environ["DEXA_TEXT_CACHE_DIR"] = ""
+
+from benchmarks import synthetic
+from dexa import catalog, columnar
+from dexa.ingest.reports import parse_report, update_csvs
+
+CSVS = ["master_dexa_data.csv", "composition_indices.csv"]
+KEYS = {"master_dexa_data.csv": ["Unique ID", "Body Part"], "composition_indices.csv": ["Unique ID"]}
+
+
+def ingest(folder, output, **kwargs):
+    """ Run ``update_csvs`` quietly; return seconds taken. """
+    os.makedirs(output, exist_ok=True)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        update_csvs(folder, *[os.path.join(output, filename) for filename in CSVS], workers=1, **kwargs)
+    return time.perf_counter() - start
+
+
+def same_tables(output, reference):
+    """ Whether both CSVs and their columnar copies in ``output`` match ``reference``. """
+    ok = True
+    for filename in CSVS:
+        csv_path, reference_csv = os.path.join(output, filename), os.path.join(reference, filename)
+        if not filecmp.cmp(csv_path, reference_csv, shallow=False):
+            print(f"MISMATCH: {filename}")
+            ok = False
+        store, reference_store = columnar.store_path(csv_path), columnar.store_path(reference_csv)
+        if not columnar.is_fresh(store, csv_path):
+            print(f"STALE: {store}")
+            ok = False
+        try:
+            pd.testing.assert_frame_equal(columnar.read(store), columnar.read(reference_store))
+        except AssertionError as e:
+            print(f"MISMATCH: {store}\n{e}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=500)
+    parser.add_argument("--new", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        every_report = synthetic.write_reports(os.path.join(tmp, "all"), args.reports + args.new)
+        parse_report(every_report[0])
+        folder = os.path.join(tmp, "reports")
+        os.makedirs(folder)
+        for path in every_report[:args.reports]:
+            shutil.copy2(path, folder)
+
+        output = os.path.join(tmp, "incremental")
+        print(f"{args.reports} reports, then {args.new} new ({os.cpu_count()} CPUs, 1 worker)")
+        print(f"{'run':<28}{'seconds':>10}")
+        print(f"{'first ingest':<28}{ingest(folder, output):>10.2f}")
+        print(f"{'rerun, nothing new':<28}{ingest(folder, output):>10.3f}")
+        # Named to sort after the existing reports, as a from-scratch run would order them
+        for path in every_report[args.reports:]:
+            shutil.copy2(path, os.path.join(folder, "new-" + os.path.basename(path)))
+        incremental = ingest(folder, output)
+        print(f"{f'{args.new} new reports':<28}{incremental:>10.3f}")
+
+        reference = os.path.join(tmp, "reference")
+        full = ingest(folder, reference)
+        print(f"{'everything from scratch':<28}{full:>10.2f}{full / incremental:>9.1f}x slower")
+        ok = same_tables(output, reference)
+
+        for path in every_report[:args.reports]:
+            shutil.copy(path, os.path.join(folder, "copy-" + os.path.basename(path)))
+        print(f"{'same reports, new names':<28}{ingest(folder, output):>10.3f}")
+        ok = same_tables(output, reference) and ok
+
+        # A re-exported report (same scan, other numbers) replaces that scan's rows
+        for path in every_report[:args.reports]:
+            os.remove(os.path.join(folder, "copy-" + os.path.basename(path)))
+        reexported = synthetic.write_reports(os.path.join(tmp, "reexported"), args.reports + args.new, value_seed=1)
+        shutil.copy(reexported[0], every_report[0].replace(os.path.join(tmp, "all"), folder))
+        ingest(folder, output)
+        shutil.rmtree(reference)
+        ingest(folder, reference)
+        # The rewrite reads the CSV back, so compare parsed values rather than number formatting
+        for filename in CSVS:
+            frames = [catalog.parse_frame(catalog.read_csv(os.path.join(directory, filename)))
+                      .sort_values(KEYS[filename]).reset_index(drop=True) for directory in (output, reference)]
+            try:
+                pd.testing.assert_frame_equal(*frames)
+            except AssertionError as e:
+                print(f"MISMATCH: {filename} after re-ingesting a report\n{e}")
+                ok = False
+
+    if not ok:
+        print("Incremental ingestion differs from ingesting every report from scratch")
+        sys.exit(1)
+    print("Incremental runs match ingesting every report from scratch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Serial versus process-pool PDF ingestion, two passes versus one.
+
+    python benchmarks/ingest.py [--reports 200] [--workers 1 2 4] [--chunksize N]
+
+Writes synthetic one-page reports (plus one corrupt file) to a temporary
+folder and fills both CSVs with each worker count, either with the two
+per-table jobs (every report read twice) or with ``reports.update_csvs``
+(read once). The CSVs written by every run must be byte-identical to the
+serial two-pass ones, and the corrupt file must be skipped without aborting
+the batch; exits non-zero otherwise.
+"""
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Time text extraction itself, not the text cache
+os.environ["DEXA_TEXT_CACHE_DIR"] = ""
+
+from benchmarks import synthetic
+from dexa.ingest.body_parts import update_master_csv
+from dexa.ingest.composition import update_composition_indices_csv
+from dexa.ingest.reports import parse_report, update_csvs
+
+JOBS = {
+    "master_dexa_data.csv": update_master_csv,
+    "composition_indices.csv": update_composition_indices_csv,
+}
+
+
+def run(folder, output, workers, chunksize, single_pass):
+    """ Fill both CSVs in ``output``; return (seconds, paths of skipped files). """
+    os.makedirs(output)
+    paths = [os.path.join(output, filename) for filename in JOBS]
+    skipped = set()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if single_pass:
+            failed = update_csvs(folder, *paths, workers=workers, chunksize=chunksize)
+        else:
+            failed = [result for job, path in zip(JOBS.values(), paths)
+                      for result in job(folder, path, workers=workers, chunksize=chunksize)]
+    skipped.update(result.path for result in failed)
+    return time.perf_counter() - start, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, os.cpu_count() or 1])
+    parser.add_argument("--chunksize", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "reports")
+        paths = synthetic.write_reports(folder, args.reports)
+        # Load pdfminer's fonts and caches before timing anything
+        parse_report(paths[0])
+        corrupt = os.path.join(folder, "corrupt.pdf")
+        with open(corrupt, "wb") as f:
+            f.write(b"%PDF-1.4 not really a pdf")
+        n_files = len(os.listdir(folder))
+
+        print(f"{n_files} reports ({os.cpu_count()} CPUs), both CSVs")
+        print(f"{'passes':>7}{'workers':>9}{'seconds':>10}{'reports/s':>11}{'speedup':>9}")
+        reference = os.path.join(tmp, "two-1")
+        ok = True
+        serial_seconds = None
+        for single_pass in (False, True):
+            for workers in [1] + sorted(set(args.workers) - {1}):
+                output = os.path.join(tmp, f"{'one' if single_pass else 'two'}-{workers}")
+                seconds, skipped = run(folder, output, workers, args.chunksize, single_pass)
+                serial_seconds = serial_seconds or seconds
+                print(f"{'one' if single_pass else 'two':>7}{workers:>9}{seconds:>10.2f}"
+                      f"{n_files / seconds:>11.1f}{serial_seconds / seconds:>8.2f}x")
+                for filename in JOBS:
+                    if not filecmp.cmp(os.path.join(reference, filename), os.path.join(output, filename), shallow=False):
+                        print(f"MISMATCH: {filename} with {workers} workers")
+                        ok = False
+                ok = ok and skipped == {corrupt}
+
+    if not ok:
+        print("Output differs from the serial two-pass run or the corrupt report was not isolated")
+        sys.exit(1)
+    print("Every run matches the serial two-pass output; the corrupt report was skipped")
+
+
+if __name__ == "__main__":
+    main()
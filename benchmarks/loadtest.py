@@ -0,0 +1,347 @@
+"""Concurrent dashboard users: callback latency and throughput under load.
+
+    python benchmarks/loadtest.py [--users 24] [--duration 30] [--think 0] [--scans 10000]
+    python benchmarks/loadtest.py --gunicorn 4 ...           # served by gunicorn.conf.py with 4 workers
+    python benchmarks/loadtest.py --url http://host:8080 ...  # a dashboard already running
+
+Each user is a thread that replays what a clinician's browser sends to
+``/_dash-update-component``. It opens a page at random (the page routing
+callback, then the callbacks the new layout fires), then changes the page's
+controls: patient switches on every page, body part toggles on Body Part
+Trends, the tissue and view selectors, and the cohort filters. Each change sends the server
+callbacks it triggers, as the Dash renderer would, and the responses update
+the user's copy of the page. Clientside callbacks run in the browser and send
+nothing: body part toggles only reach the server with
+``DEXA_BODY_PART_RENDERING=server``.
+
+By default the app runs in this process on werkzeug's threaded server over
+``--scans`` synthetic scans; ``--gunicorn N`` serves the same data with N
+gunicorn workers. Other ``DEXA_*`` settings (e.g. ``DEXA_FIGURE_CACHE_SIZE=0``
+to time every callback uncached) are passed through. Reports throughput,
+latency percentiles per callback, a latency histogram and the error rate;
+exits non-zero if any request failed.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from benchmarks.server import free_port, gunicorn
+
+# Page -> the controls a user changes there: (component id, property, weight)
+PAGES = {
+    "/": [("patient-selector", "value", 1)],
+    "/body-part-trend": [("body-part-patient-selector", "value", 1), ({"type": "body-part-button"}, "n_clicks", 3)],
+    "/dexa-dashboard": [("patient-selector", "value", 3), ("composition-view-mode", "value", 1)],
+    "/symmetry": [("symmetry-patient-dropdown", "value", 3), ("symmetry-tissue-selector", "value", 1)],
+    "/cohort": [("cohort-metric", "value", 2), ("cohort-part", "value", 2), ("cohort-sex", "value", 1),
+                ("cohort-age-band", "value", 1), ("cohort-months", "value", 1)],
+}
+
+# Callbacks by their first output
+LABELS = {
+    "_pages_content": "page load",
+    "latest-scan-info": "overview",
+    "body-part-data": "body part trend",
+    "mass-trends": "body part trend (server)",
+    "graphs-container": "composition indices",
+    "arm-symmetry-graph": "symmetry",
+    "cohort-summary": "cohort",
+}
+
+HISTOGRAM_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+TIMEOUT = 60
+
+
+def id_key(component_id):
+    """ A component id as Dash writes it in callback specs: dict ids as sorted, compact JSON. """
+    if isinstance(component_id, dict):
+        return json.dumps(component_id, sort_keys=True, separators=(",", ":"))
+    return component_id
+
+
+def parse_id(spec_id):
+    return json.loads(spec_id) if spec_id.startswith("{") else spec_id
+
+
+def is_wildcard(pattern):
+    return isinstance(pattern, dict) and any(value == ["ALL"] for value in pattern.values())
+
+
+def matches(pattern, component_id):
+    """ Whether ``component_id`` matches a callback's id, where dict ids may use ALL. """
+    if not isinstance(pattern, dict):
+        return pattern == component_id
+    return isinstance(component_id, dict) and pattern.keys() == component_id.keys() and \
+        all(value in (["ALL"], component_id[key]) for key, value in pattern.items())
+
+
+def output_specs(output):
+    """ [(id, property)] of a callback's output string. """
+    parts = output[2:-2].split("...") if output.startswith("..") else [output]
+    return [(parse_id(part.rsplit(".", 1)[0]), part.rsplit(".", 1)[1]) for part in parts]
+
+
+def components(layout, found=None):
+    """ {id key: (id, props)} of every component with an id in a layout's JSON. """
+    found = {} if found is None else found
+    if isinstance(layout, list):
+        for item in layout:
+            components(item, found)
+    elif isinstance(layout, dict) and "props" in layout and "type" in layout:
+        props = layout["props"]
+        if "id" in props:
+            found[id_key(props["id"])] = (props["id"], props)
+        for value in props.values():
+            components(value, found)
+    return found
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Session:
+    def __init__(self, url, dependencies, layout, rng, record):
+        parsed = urllib.parse.urlsplit(url)
+        self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=TIMEOUT)
+        self.callbacks = [callback for callback in dependencies if callback.get("clientside_function") is None]
+        self.base = components(layout)
+        self.components = dict(self.base)
+        self.rng = rng
+        self.record = record
+
+    def matching(self, pattern):
+        return [(component_id, props) for component_id, props in self.components.values()
+                if matches(pattern, component_id)]
+
+    def present(self, callback):
+        return all(self.matching(parse_id(spec["id"])) or is_wildcard(parse_id(spec["id"]))
+                   for spec in callback["inputs"])
+
+    def value(self, spec):
+        """ The request entry of an input or state ``spec`` from the user's copy of the page. """
+        pattern = parse_id(spec["id"])
+        entries = [{"id": component_id, "property": spec["property"], "value": props.get(spec["property"])}
+                   for component_id, props in self.matching(pattern)]
+        return entries if is_wildcard(pattern) else entries[0]
+
+    def send(self, callback, changed):
+        """ POST one callback and apply its response; returns the (id, property) pairs it changed. """
+        specs = output_specs(callback["output"])
+        outputs = [[{"id": component_id, "property": prop} for component_id, _ in self.matching(pattern)]
+                   if is_wildcard(pattern) else {"id": pattern, "property": prop} for pattern, prop in specs]
+        body = json.dumps({
+            "output": callback["output"],
+            "outputs": outputs if callback["output"].startswith("..") else outputs[0],
+            "inputs": [self.value(spec) for spec in callback["inputs"]],
+            "state": [self.value(spec) for spec in callback["state"]],
+            "changedPropIds": [f"{id_key(component_id)}.{prop}" for component_id, prop in changed],
+        })
+        label = LABELS.get(specs[0][0], str(specs[0][0]))
+        start = time.perf_counter()
+        try:
+            self.connection.request("POST", "/_dash-update-component", body, {"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.connection.close()
+            self.record(label, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            return []
+        self.record(label, time.perf_counter() - start, None if response.status < 400 else f"HTTP {response.status}")
+        if response.status != 200:
+            return []
+        return self.apply(json.loads(data)["response"])
+
+    def apply(self, response):
+        changed, initial = [], []
+        for key, props in response.items():
+            component_id = parse_id(key)
+            for prop, value in props.items():
+                if isinstance(value, dict) and "__dash_patch_update" in value:
+                    continue
+                if key == "_pages_content" and prop == "children":
+                    # A new page replaces the previous page's components
+                    self.components = dict(self.base)
+                if prop == "children":
+                    new = components(value)
+                    self.components.update(new)
+                    initial.extend(component_id for component_id, _ in new.values())
+                if key in self.components:
+                    self.components[key][1][prop] = value
+                changed.append((component_id, prop))
+        if initial:
+            self.fire([(component_id, None) for component_id in initial], initial=True)
+        return changed
+
+    def fire(self, changed, initial=False):
+        """ Send the server callbacks that ``changed`` ((id, property) pairs; property None for new components) triggers. """
+        for callback in self.callbacks:
+            if initial and callback.get("prevent_initial_call"):
+                continue
+            triggers = [(component_id, prop) for component_id, prop in changed for spec in callback["inputs"]
+                        if matches(parse_id(spec["id"]), component_id) and prop in (None, spec["property"])]
+            if triggers and self.present(callback):
+                self.fire(self.send(callback, [] if initial else triggers))
+
+    def set(self, component_id, prop, value):
+        self.components[id_key(component_id)][1][prop] = value
+        self.fire([(component_id, prop)])
+
+    def navigate(self, path):
+        location = self.components["_pages_location"][1]
+        location["search"] = ""
+        self.set("_pages_location", "pathname", path)
+
+    def act(self, path):
+        """ Change one of the page's controls, as a clinician would. """
+        controls = [control for control in PAGES[path] if self.matching(control[0])]
+        if not controls:
+            return
+        pattern, prop, _ = self.rng.choices(controls, weights=[control[2] for control in controls])[0]
+        component_id, props = self.rng.choice(self.matching(pattern))
+        if prop == "n_clicks":
+            value = (props.get("n_clicks") or 0) + 1
+        elif "min" in props and "max" in props:
+            # A range slider: pick a new window
+            value = sorted(self.rng.randint(props["min"], props["max"]) for _ in range(2))
+        elif isinstance(props.get(prop), list):
+            # A checklist: tick or untick one option
+            options = [option["value"] if isinstance(option, dict) else option for option in props.get("options", [])]
+            option = self.rng.choice(options)
+            value = [value for value in props[prop] if value != option] if option in props[prop] \
+                else props[prop] + [option]
+        else:
+            options = [option["value"] if isinstance(option, dict) else option for option in props.get("options", [])]
+            value = self.rng.choice([option for option in options if option != props.get(prop)] or options)
+        self.set(component_id, prop, value)
+
+
+def run_user(url, dependencies, layout, seed, think, actions, deadline, record):
+    rng = random.Random(seed)
+    session = Session(url, dependencies, layout, rng, record)
+    while time.perf_counter() < deadline:
+        path = rng.choice(list(PAGES))
+        session.navigate(path)
+        for _ in range(actions):
+            if time.perf_counter() >= deadline:
+                break
+            time.sleep(think * rng.uniform(0.5, 1.5))
+            session.act(path)
+
+
+def load(url, users, duration, think, actions, seed):
+    """ Run ``users`` concurrent users against ``url`` for ``duration`` seconds; returns [(label, seconds, error)]. """
+    # The first request registers the page routing callback
+    connection = http.client.HTTPConnection(*urllib.parse.urlsplit(url)[1].split(":"), timeout=TIMEOUT)
+    for path in ("/", "/_dash-layout", "/_dash-dependencies"):
+        connection.request("GET", path)
+        response = connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path}: HTTP {response.status}")
+        if path == "/_dash-layout":
+            layout = json.loads(body)
+    dependencies = json.loads(body)
+    connection.close()
+
+    results = []
+    lock = threading.Lock()
+
+    def record(label, seconds, error):
+        with lock:
+            results.append((label, seconds, error))
+
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=run_user, args=(url, dependencies, layout, seed + user, think, actions,
+                                                       deadline, record), daemon=True) for user in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(results, duration):
+    latencies = [seconds * 1000 for _, seconds, _ in results]
+    errors = [error for _, _, error in results if error]
+    print(f"{len(results)} requests in {duration:.0f}s: {len(results) / duration:.1f} requests/s, "
+          f"{len(errors)} errors ({100 * len(errors) / max(1, len(results)):.2f}%)")
+    print(f"\n{'callback':<26}{'requests':>9}{'errors':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for label in sorted({label for label, _, _ in results}):
+        rows = [(seconds * 1000, error) for name, seconds, error in results if name == label]
+        times = [ms for ms, _ in rows]
+        print(f"{label:<26}{len(rows):>9}{sum(1 for _, error in rows if error):>8}"
+              + "".join(f"{percentile(times, q):>9.1f}" for q in (50, 90, 99)) + f"{max(times):>9.1f}")
+
+    print("\nLatency histogram (all callbacks)")
+    counts = [0] * (len(HISTOGRAM_MS) + 1)
+    for ms in latencies:
+        counts[next((i for i, bound in enumerate(HISTOGRAM_MS) if ms < bound), len(HISTOGRAM_MS))] += 1
+    for i, count in enumerate(counts):
+        bucket = f"< {HISTOGRAM_MS[i]} ms" if i < len(HISTOGRAM_MS) else f">= {HISTOGRAM_MS[-1]} ms"
+        print(f"{bucket:>11} {count:>7}  {'#' * round(50 * count / max(1, max(counts)))}")
+
+    if errors:
+        print("\nErrors:")
+        for error in sorted(set(errors)):
+            print(f"  {errors.count(error):>5}  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=24, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--think", type=float, default=0, help="mean seconds a user waits between actions")
+    parser.add_argument("--actions", type=int, default=6, help="actions on each page before opening another")
+    parser.add_argument("--scans", type=int, default=10_000, help="synthetic scans to serve")
+    parser.add_argument("--gunicorn", type=int, metavar="WORKERS", help="serve with gunicorn and this many workers")
+    parser.add_argument("--url", help="load an already running dashboard instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def run(url, where):
+        print(f"{args.users} users for {args.duration:g}s against {where} (think time {args.think:g}s)")
+        results = load(url, args.users, args.duration, args.think, args.actions, args.seed)
+        report(results, args.duration)
+        return not any(error for _, _, error in results)
+
+    if args.url:
+        ok = run(args.url, args.url)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            synthetic.write(tmp, args.scans, missing=0.02)
+            # No log line per callback unless asked for: it would interleave with the report
+            env = dict(DEXA_DATA_SOURCE="local", DEXA_DATA_DIR=tmp, DEXA_CACHE_DIR=os.path.join(tmp, "cache"),
+                       DEXA_CALLBACK_LOG_MS=os.environ.get("DEXA_CALLBACK_LOG_MS", "off"))
+            if args.gunicorn:
+                with gunicorn(args.gunicorn, **env) as (_, port):
+                    ok = run(f"http://127.0.0.1:{port}", f"gunicorn with {args.gunicorn} workers, {args.scans} scans")
+            else:
+                os.environ.update(env)
+                from werkzeug.serving import make_server
+
+                import app
+                logging.getLogger("werkzeug").setLevel(logging.ERROR)
+                server = make_server("127.0.0.1", free_port(), app.server, threaded=True)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                ok = run(f"http://127.0.0.1:{server.port}", f"the app in this process, {args.scans} scans")
+                server.shutdown()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
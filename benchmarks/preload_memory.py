@@ -0,0 +1,112 @@
+"""Memory of the gunicorn workers with the data preloaded in the master versus loaded per worker.
+
+    python benchmarks/preload_memory.py [--scans 20000] [--workers 3] [--requests 30]
+
+Writes a synthetic dataset, then serves it with ``gunicorn -c gunicorn.conf.py
+app:server`` twice, with ``DEXA_PRELOAD=1`` and ``DEXA_PRELOAD=0``. Once every
+worker is up, sends ``--requests`` overview callbacks for different patients
+(so every worker reads the tables), then sums the proportional set size (PSS:
+shared pages split between the processes sharing them) of the master and its
+workers from ``/proc/*/smaps_rollup``. Exits non-zero if a request fails or
+preloading does not use less memory.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from benchmarks.server import TIMEOUT, gunicorn
+
+OVERVIEW_OUTPUTS = [("latest-scan-info", "children"), ("ratios-info", "children"), ("composition-info", "children"),
+                    ("records-info", "children"), ("main-trends-graph", "figure"), ("visceral-fat-graph", "figure"),
+                    ("body-composition-graph", "figure")]
+
+
+def memory_kb(pid):
+    """ {field: kB} from ``/proc/<pid>/smaps_rollup``. """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def overview(port, patient):
+    """ POST the overview page's callback for ``patient`` and return the HTTP status. """
+    body = {
+        "output": ".." + "...".join(f"{id}.{prop}" for id, prop in OVERVIEW_OUTPUTS) + "..",
+        "outputs": [{"id": id, "property": prop} for id, prop in OVERVIEW_OUTPUTS],
+        "inputs": [{"id": "patient-selector", "property": "value", "value": patient}],
+        "changedPropIds": ["patient-selector.value"],
+        "state": [],
+    }
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/_dash-update-component", json.dumps(body).encode(),
+                                     {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        return response.status
+
+
+def serve(data_dir, preload, workers, patients):
+    """ Start gunicorn, send the callbacks and return (master kB, [worker kB], failed requests). """
+    env = dict(DEXA_THREADS="1", DEXA_PRELOAD="1" if preload else "0", DEXA_DATA_SOURCE="local",
+               DEXA_DATA_DIR=data_dir, DEXA_CACHE_DIR=tempfile.mkdtemp(dir=data_dir), DEXA_FIGURE_CACHE_SIZE="0")
+    with gunicorn(workers, **env) as (server, port):
+        failed = 0
+        for patient in patients:
+            try:
+                failed += overview(port, patient) != 200
+            except OSError as e:
+                print(f"Request failed: {e}")
+                failed += 1
+        master = memory_kb(server.pid)
+        return master, [memory_kb(pid) for pid in children(server.pid)], failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic.write(tmp, args.scans)
+        names = synthetic.scans(args.scans)["Patient Name"].unique()
+        patients = [names[i % len(names)] for i in range(0, args.requests * 7, 7)]
+
+        print(f"{args.scans} scans, {args.workers} workers, {args.requests} overview callbacks")
+        print(f"{'':<12}{'master PSS':>12}{'worker PSS':>14}{'worker private':>16}{'total PSS':>12}")
+        totals, ok = {}, True
+        for preload in (True, False):
+            master, workers, failed = serve(tmp, preload, args.workers, patients)
+            worker_pss = sum(worker["Pss"] for worker in workers) / len(workers)
+            private = sum(worker["Private_Clean"] + worker["Private_Dirty"] for worker in workers) / len(workers)
+            totals[preload] = master["Pss"] + sum(worker["Pss"] for worker in workers)
+            print(f"{'preload' if preload else 'per worker':<12}{master['Pss'] / 1024:>10.0f}MB"
+                  f"{worker_pss / 1024:>12.0f}MB{private / 1024:>14.0f}MB{totals[preload] / 1024:>10.0f}MB")
+            if failed:
+                print(f"{failed} requests failed")
+                ok = False
+
+    if totals[True] >= totals[False]:
+        print("Preloading did not reduce memory")
+        ok = False
+    if not ok:
+        sys.exit(1)
+    print(f"Preloading saves {(totals[False] - totals[True]) / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
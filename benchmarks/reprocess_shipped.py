@@ -0,0 +1,77 @@
+"""Reprocessing on top of the shipped data: every table keeps every row.
+
+    python benchmarks/reprocess_shipped.py [--reports 20]
+
+Copies the CSVs under ``Data/`` to a temporary directory, migrates them into
+``dexa.sqlite3`` (``dexa.database.migrate``) and ingests ``--reports``
+synthetic reports, then ingests them again with ``reprocess=True``, which
+merges and rewrites both CSVs. After each run the CSV (rows read and rows with
+a scan date), its columnar copy and the database must hold the same number of
+rows, and every shipped row must still be there; exits non-zero otherwise.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from dexa import catalog, columnar, database
+from dexa.ingest.reports import update_csvs
+
+SOURCES = {"master": "master_dexa_data.csv", "composition": "composition_indices.csv"}
+
+
+def row_counts(directory, name):
+    """ {table: rows} of source ``name`` in the CSV, its columnar copy and the database in ``directory``. """
+    csv_path = os.path.join(directory, SOURCES[name])
+    raw = catalog.read_csv(csv_path)
+    return {
+        "csv": len(raw),
+        "csv, dated": len(catalog.parse_frame(raw)),
+        "columnar": len(columnar.read(columnar.store_path(csv_path))),
+        "sqlite": len(database.read_columns(name, ["Unique ID"], database.path_for(csv_path))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "Data")
+        os.makedirs(data)
+        for filename in SOURCES.values():
+            shutil.copy2(os.path.join(catalog.ROOT_DIR, "Data", filename), data)
+        csv_paths = {name: os.path.join(data, filename) for name, filename in SOURCES.items()}
+        shipped = {name: len(catalog.parse_frame(catalog.read_csv(path))) for name, path in csv_paths.items()}
+        database.migrate(csv_paths, database.path_for(csv_paths["master"]))
+        folder = os.path.join(tmp, "reports")
+        synthetic.write_reports(folder, args.reports)
+
+        ok = True
+        print(f"{'run':<12}{'table':<14}{'csv':>6}{'csv, dated':>12}{'columnar':>10}{'sqlite':>8}")
+        for run, reprocess in (("ingest", False), ("reprocess", True)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                update_csvs(folder, csv_paths["master"], csv_paths["composition"], workers=1, reprocess=reprocess)
+            for name in SOURCES:
+                counts = row_counts(data, name)
+                print(f"{run:<12}{name:<14}" + "".join(f"{count:>{width}}" for count, width in
+                                                       zip(counts.values(), (6, 12, 10, 8))))
+                expected = shipped[name] + args.reports * (len(synthetic.BODY_PARTS) if name == "master" else 1)
+                if set(counts.values()) != {expected}:
+                    print(f"MISMATCH: {name} should have {expected} rows everywhere after {run}")
+                    ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("The CSVs, columnar copies and database hold every shipped and ingested row")
+
+
+if __name__ == "__main__":
+    main()
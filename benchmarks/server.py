@@ -0,0 +1,47 @@
+"""Run the dashboard under gunicorn for the benchmarks that measure the served app."""
+import contextlib
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMEOUT = 300
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def gunicorn(workers, **env):
+    """
+    Serve ``app:server`` with ``gunicorn.conf.py`` and ``workers`` workers (and
+    the environment variables ``env``) until the block exits; yields
+    (process, port) once every worker has booted.
+    """
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), **env)
+    with tempfile.TemporaryFile(mode="w+") as log:
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:server"],
+                                  cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            start = time.perf_counter()
+            while True:
+                log.seek(0)
+                if log.read().count("ready") >= workers:
+                    break
+                if server.poll() is not None or time.perf_counter() - start > TIMEOUT:
+                    log.seek(0)
+                    raise RuntimeError(f"gunicorn did not start:\n{log.read()}")
+                time.sleep(0.2)
+            yield server, port
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(TIMEOUT)
@@ -0,0 +1,133 @@
+"""Dashboard start-up and callback latency: loaded tables versus the SQLite database.
+
+    python benchmarks/sqlite_backend.py [--scans 100000] [--patients 20] [--repeat 3]
+
+Writes a synthetic dataset of ``--scans`` scans to a temporary directory,
+migrates it into ``dexa.sqlite3`` (``dexa.database.migrate``) and starts the
+dashboard's store in local mode (CSVs loaded, then indexed in memory) and in
+SQLite mode (nothing loaded, one query per callback). Then times the page
+builders each callback runs for ``--patients`` patients spread over the
+clinic (first call, when SQLite mode queries the patient's rows, and best of
+``--repeat``) and the cohort page for two filters (its first call in SQLite
+mode builds the rollup from the database), and checks both backends return
+the same figures and tables; exits non-zero otherwise.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(func, repeat):
+    """ The first and the best of ``repeat`` calls to ``func`` in ms, and its last result. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return times[0] * 1000, min(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=100_000)
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DEXA_DATA_SOURCE="local", DEXA_DATA_DIR=tmp, DEXA_CACHE_DIR=os.path.join(tmp, "cache"),
+                          DEXA_RELOAD_INTERVAL="0")
+        from plotly.io.json import to_json_plotly
+
+        from benchmarks import synthetic
+        from dexa import catalog, database, store
+
+        master_path, composition_path = synthetic.write(tmp, args.scans)
+        start = time.perf_counter()
+        rows = database.migrate({"master": master_path, "composition": composition_path})
+        migrate_time = time.perf_counter() - start
+        database_mb = os.path.getsize(database.default_path()) / 1e6
+
+        # Importing the app registers the pages and the store's derived tables
+        start = time.perf_counter()
+        import app  # noqa: F401
+        from dexa import rollups
+        from pages import Symmetry, body_part_trend, cohort, dexa_dashboard, overview
+        local_start = time.perf_counter() - start
+
+        def start_store(mode):
+            catalog.DATA_SOURCE = mode
+            catalog._frames.clear()
+            store._snapshot = None
+            store._files.clear()
+            return store.snapshot()
+
+        snapshots = {"local": store.snapshot()}
+        _, warm_time, _ = timed(lambda: start_store("local"), args.repeat)
+        snapshots["local"] = store.snapshot()
+        _, sqlite_time, snapshots["sqlite"] = timed(lambda: start_store("sqlite"), args.repeat)
+
+        patients = snapshots["local"].derived["master_index"].patients()
+        patients = patients[::max(1, len(patients) // args.patients)][:args.patients]
+        callbacks = {
+            "overview": lambda snapshot, patient: overview.build_page_content(snapshot, patient),
+            "body part trend": lambda snapshot, patient: body_part_trend.build_charts(
+                snapshot, patient, ["Total", "Arms", "Legs", "Trunk"]),
+            "composition dashboard": lambda snapshot, patient: dexa_dashboard.build_graphs(snapshot, patient),
+            "symmetry": lambda snapshot, patient: Symmetry.build_symmetry_graphs(snapshot, patient, "Lean"),
+        }
+
+        totals = {}
+        mismatches = 0
+        for patient in patients:
+            for name, callback in callbacks.items():
+                results = {}
+                for mode, snapshot in snapshots.items():
+                    # Each callback's first call queries the database, as for a newly selected patient
+                    for index in snapshot.derived.values():
+                        getattr(index, "_rows", {}).clear()
+                    first, best, result = timed(lambda: callback(snapshot, patient), args.repeat)
+                    totals.setdefault(name, {}).setdefault(mode, []).append((first, best))
+                    results[mode] = to_json_plotly(result)
+                if results["local"] != results["sqlite"]:
+                    print(f"MISMATCH: {name} differs for {patient}")
+                    mismatches += 1
+
+        # The cohort page reads the rollup: built on first use in SQLite mode
+        months = snapshots["local"].derived["cohort_rollup"].months()
+        filters = [(rollups.SEXES, rollups.AGE_BANDS, months), (["Female"], ["40-49", "50-59"], months)]
+        for sexes, bands, window in filters:
+            results = {}
+            for mode, snapshot in snapshots.items():
+                first, best, result = timed(
+                    lambda: cohort.build_cohort(snapshot, "Lean (g)", sexes, bands, window, "Total"), args.repeat)
+                totals.setdefault("cohort", {}).setdefault(mode, []).append((first, best))
+                results[mode] = to_json_plotly(result)
+            if results["local"] != results["sqlite"]:
+                print(f"MISMATCH: cohort differs for {sexes}, {bands}")
+                mismatches += 1
+
+        print(f"{args.scans} scans, {rows['master']} master rows, {rows['composition']} composition rows")
+        print(f"{'migrate to SQLite':<34}{migrate_time:>9.2f}s  ({database_mb:.1f} MB)")
+        print(f"{'start-up, local (cold, with app)':<34}{local_start:>9.2f}s")
+        print(f"{'start-up, local (parsed cache)':<34}{warm_time:>9.1f}ms")
+        print(f"{'start-up, SQLite':<34}{sqlite_time:>9.1f}ms")
+        print(f"\nMean callback latency over {len(patients)} patients (first call / best of {args.repeat})")
+        print(f"{'callback':<24}{'local':>20}{'SQLite':>20}")
+        for name, modes in totals.items():
+            cells = [f"{sum(t[0] for t in times) / len(times):.1f} / {sum(t[1] for t in times) / len(times):.1f}ms"
+                     for times in modes.values()]
+            print(f"{name:<24}{cells[0]:>20}{cells[1]:>20}")
+
+    if mismatches:
+        print(f"{mismatches} callbacks differ")
+        sys.exit(1)
+    print("Both backends return the same figures")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Start-up cost of loading the tables from CSV versus the columnar store.
+
+    python benchmarks/startup.py --scans 100000
+
+Writes a synthetic dataset to a temporary directory, builds the columnar stores
+from it and reports the best of ``--repeat`` runs for each loader. "store + query"
+also filters one patient so the memory-mapped pages actually get touched.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from dexa import catalog, columnar
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scans", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = synthetic.write(directory, args.scans)
+        print(f"{args.scans} scans")
+        for path in paths:
+            frame = catalog.parse_frame(catalog.read_csv(path))
+            store = columnar.store_path(path)
+            columnar.write(frame, store)
+            patient = frame["Patient Name"].iloc[len(frame) // 2]
+
+            csv_time = best_of(args.repeat, lambda: catalog.parse_frame(catalog.read_csv(path)))
+            store_time = best_of(args.repeat, lambda: columnar.read(store))
+
+            def query():
+                loaded = columnar.read(store)
+                return loaded[loaded["Patient Name"] == patient]
+
+            query_time = best_of(args.repeat, query)
+            csv_mb = os.path.getsize(path) / 1e6
+            store_mb = sum(os.path.getsize(os.path.join(store, f)) for f in os.listdir(store)) / 1e6
+            print(f"{os.path.basename(path)}: {len(frame)} rows, CSV {csv_mb:.1f} MB, store {store_mb:.1f} MB")
+            print(f"  CSV parse       {csv_time * 1000:9.1f} ms")
+            print(f"  store (mmap)    {store_time * 1000:9.1f} ms  ({csv_time / store_time:.0f}x)")
+            print(f"  store + query   {query_time * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
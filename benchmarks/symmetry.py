@@ -0,0 +1,74 @@
+"""Vectorized symmetry engine versus the original per-scan groupby loop.
+
+    python benchmarks/symmetry.py --scans 10000 100000
+
+Checks that both produce the same Lean scores before timing them.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from dexa import catalog, symmetry
+
+
+def legacy_calculate_symmetry(df):
+    """ The loop that pages/Symmetry.py used before dexa.symmetry (Lean only). """
+    symmetry_data = []
+    for unique_id, group in df.groupby("Unique ID", observed=True):
+        row = {"Unique ID": unique_id,
+               "Scan Date": group["Scan Date"].iloc[0],
+               "Patient Name": group["Patient Name"].iloc[0]}
+        body_parts = group.set_index("Body Part")
+        for region, (left, right) in symmetry.PAIRS.items():
+            if left in body_parts.index and right in body_parts.index:
+                row[f"{region} Symmetry"] = symmetry.calculate_symmetry_score(
+                    body_parts.loc[left, "Lean (g)"],
+                    body_parts.loc[right, "Lean (g)"]
+                )
+        symmetry_data.append(row)
+    return pd.DataFrame(symmetry_data)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scans", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for n_scans in args.scans:
+        scan_frame = synthetic.scans(n_scans)
+        master = catalog.parse_frame(synthetic.master(scan_frame))
+
+        legacy, legacy_time = timed(legacy_calculate_symmetry, master)
+        vectorized, vectorized_time = timed(symmetry.calculate_symmetry, master)
+        for region in symmetry.PAIRS:
+            np.testing.assert_allclose(
+                legacy[f"{region} Symmetry"].to_numpy(dtype=float),
+                vectorized[symmetry.symmetry_column(region, "Lean")].to_numpy())
+
+        # One new scan arriving on top of the existing table
+        appended = master[master["Unique ID"] == master["Unique ID"].iloc[-1]]
+        _, update_time = timed(symmetry.update_symmetry, vectorized, master, appended)
+
+        n_columns = len(symmetry.PAIRS) * len(symmetry.TISSUES)
+        print(f"{len(scan_frame)} scans ({len(master)} rows)")
+        print(f"  legacy loop, 3 Lean columns       {legacy_time * 1000:10.1f} ms")
+        print(f"  vectorized, {n_columns} columns            {vectorized_time * 1000:10.1f} ms"
+              f"  ({legacy_time / vectorized_time:.0f}x)")
+        print(f"  incremental update, 1 new scan    {update_time * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Seeded synthetic DEXA data in the same schema as the files under Data/.
+
+Used by the benchmarks to see how loaders and callbacks scale beyond the
+handful of real scans in the repository. ``write_reports`` renders the same
+scans as one-page PDF reports in the layout the ingestion parsers expect.
+
+    python benchmarks/synthetic.py DIRECTORY [--scans 10000] [--patients N] [--seed 0] [--missing 0.02]
+
+writes both CSVs to DIRECTORY, e.g. to point ``DEXA_DATA_DIR`` at.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+BODY_PARTS = [
+    "Left Arm", "Right Arm", "Left Ribs", "Right Ribs", "T Spine", "L Spine", "Pelvis",
+    "Left Leg", "Right Leg", "SubTotal", "Head", "Total", "Android", "Gynoid"
+]
+
+# Typical lean mass (g) and fat fraction per body part for an adult
+PART_LEAN = np.array([3900, 4100, 9000, 8800, 5000, 2600, 9500, 11500, 11800, 60000, 3800, 64000, 4000, 9800])
+PART_FAT = np.array([0.14, 0.14, 0.11, 0.10, 0.12, 0.15, 0.16, 0.16, 0.16, 0.13, 0.18, 0.13, 0.15, 0.17])
+
+ETHNICITIES = ["White", "Asian", "Black", "Mixed", "Other"]
+
+MASTER_COLUMNS = [
+    "Unique ID", "Patient Name", "Scan Date", "Body Part", "% Fat", "Tissues (g)", "Tissue Area (cm²)",
+    "Fat (g)", "Lean (g)", "BMC (g)", "BMC Area (cm²)", "Total Mass (kg)", "Patient ID", "Ethnicity", "Sex",
+    "Height", "Weight", "Age", "Total Body Weight (kg)", "BMI (kg/m²)", "Basal Metabolic Rate (kcal/day)",
+    "Total Body Fat (%)"
+]
+
+
+def scans(n_scans, n_patients=None, seed=0):
+    """ Return a frame with one row per scan: Unique ID, Patient Name, Scan Date and a size factor. """
+    rng = np.random.default_rng(seed)
+    n_patients = n_patients or max(1, n_scans // 8)
+    patient = rng.integers(0, n_patients, n_scans)
+    days = rng.integers(0, 365 * 6, n_scans)
+    dates = pd.Timestamp("2018-01-01") + pd.to_timedelta(days, unit="D")
+    names = np.char.add("PATIENT_", np.char.zfill(patient.astype(str), 6))
+    date_strings = dates.strftime("%d-%m-%Y").to_numpy().astype(str)
+    frame = pd.DataFrame({
+        "Unique ID": np.char.add(np.char.add(names, "_"), date_strings),
+        "Patient Name": names,
+        "Scan Date": date_strings,
+        "size": rng.normal(1.0, 0.12, n_patients)[patient],
+    })
+    # A patient can't be scanned twice on the same day
+    return frame.drop_duplicates("Unique ID").reset_index(drop=True)
+
+
+def blank(frame, columns, missing, seed=0):
+    """ Blank a ``missing`` fraction of the ``columns`` cells of ``frame``, as values a report didn't print. """
+    if missing > 0:
+        # Its own stream, so the values that stay are the same as with no gaps
+        rng = np.random.default_rng([seed, 1])
+        mask = rng.random((len(frame), len(columns))) < missing
+        for column, column_mask in zip(columns, mask.T):
+            frame.loc[column_mask, column] = np.nan
+    return frame
+
+
+def demographics(scan_frame, seed=0):
+    """ Sex, Ethnicity and Age at each scan of ``scan_frame``, drawn once per patient. """
+    # Its own stream, so the measurements are the same as without demographics
+    rng = np.random.default_rng([seed, 2])
+    patient = scan_frame["Patient Name"].str.rsplit("_", n=1).str[-1].astype(int).to_numpy()
+    n_patients = patient.max() + 1 if len(patient) else 0
+    sex = rng.choice(["Female", "Male"], n_patients)
+    ethnicity = rng.choice(ETHNICITIES, n_patients, p=[0.6, 0.15, 0.1, 0.1, 0.05])
+    born = pd.Timestamp("1938-01-01") + pd.to_timedelta(rng.integers(0, 365 * 62, n_patients), unit="D")
+    scanned = pd.to_datetime(scan_frame["Scan Date"], format="%d-%m-%Y")
+    age = (scanned.to_numpy() - born.to_numpy()[patient]) // np.timedelta64(1, "D") // 365.25
+    return {"Sex": sex[patient], "Ethnicity": ethnicity[patient], "Age": age.astype(float)}
+
+
+def master(scan_frame, seed=0, missing=0.0):
+    """
+    Return the master table (one row per scan and body part) for ``scan_frame``,
+    with a ``missing`` fraction of the measurements blank.
+    """
+    rng = np.random.default_rng(seed)
+    n_scans, n_parts = len(scan_frame), len(BODY_PARTS)
+    lean = (PART_LEAN[None, :] * scan_frame["size"].to_numpy()[:, None]
+            * rng.normal(1.0, 0.04, (n_scans, n_parts))).round()
+    fat_fraction = np.clip(PART_FAT[None, :] * rng.normal(1.0, 0.2, (n_scans, n_parts)), 0.03, 0.6)
+    fat = (lean * fat_fraction / (1 - fat_fraction)).round()
+    bmc = (lean * rng.normal(0.07, 0.01, (n_scans, n_parts))).round(1)
+    tissues = lean + fat
+    frame = pd.DataFrame({
+        "Unique ID": np.repeat(scan_frame["Unique ID"].to_numpy(), n_parts),
+        "Patient Name": np.repeat(scan_frame["Patient Name"].to_numpy(), n_parts),
+        "Scan Date": np.repeat(scan_frame["Scan Date"].to_numpy(), n_parts),
+        "Body Part": np.tile(BODY_PARTS, n_scans),
+        "% Fat": (100 * fat / tissues).round(1).ravel(),
+        "Tissues (g)": tissues.ravel(),
+        "Tissue Area (cm²)": (tissues * 0.35).round(1).ravel(),
+        "Fat (g)": fat.ravel(),
+        "Lean (g)": lean.ravel(),
+        "BMC (g)": bmc.ravel(),
+        "BMC Area (cm²)": (bmc * 0.6).round(1).ravel(),
+        "Total Mass (kg)": ((tissues + bmc) / 1000).round(1).ravel(),
+    })
+    frame = blank(frame, MASTER_COLUMNS[4:12], missing, seed)
+    for column, values in demographics(scan_frame, seed).items():
+        frame[column] = np.repeat(values, n_parts)
+    return frame.reindex(columns=MASTER_COLUMNS)
+
+
+def composition(scan_frame, seed=0, missing=0.0):
+    """
+    Return the composition indices table (one row per scan) for ``scan_frame``,
+    with a ``missing`` fraction of the indices blank on top of the older reports' gaps.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(scan_frame)
+    size = scan_frame["size"].to_numpy()
+    weight = 80 * size * rng.normal(1.0, 0.03, n)
+    body_fat = np.clip(rng.normal(15, 4, n), 4, 45)
+    frame = pd.DataFrame({
+        "Unique ID": scan_frame["Unique ID"],
+        "Patient Name": scan_frame["Patient Name"],
+        "Scan Date": pd.to_datetime(scan_frame["Scan Date"], format="%d-%m-%Y").dt.strftime("%d/%m/%Y"),
+        "Measure": np.nan,
+        "Result": np.nan,
+        "Total Body Weight (kg)": weight.round(3),
+        "BMI (kg/m²)": (weight / 1.8 ** 2).round(2),
+        "Basal Metabolic Rate (kcal/day)": (1000 + 10 * weight).round(1),
+        "Total Body Fat (%)": body_fat.round(1),
+        "Fat Mass Index (FMI)": (weight * body_fat / 100 / 1.8 ** 2).round(1),
+        "Android/Gynoid Fat Ratio": rng.normal(0.9, 0.05, n).round(2),
+        "Trunk/Legs Fat Ratio": rng.normal(1.0, 0.1, n).round(2),
+        "Trunk/Limb Fat Mass Ratio": rng.normal(0.8, 0.08, n).round(2),
+        "Visceral Fat Area (cm²)": rng.normal(25, 8, n).round(1),
+        "Visceral Fat Mass (g)": rng.normal(80, 30, n).round(1),
+        "Visceral Fat Volume (cm³)": rng.normal(85, 30, n).round(1),
+        "Subcutaneous Fat Area (cm²)": rng.normal(40, 15, n).round(1),
+        "Total Lean Body (%)": (95 - body_fat).round(1),
+        "Lean Mass Index (kg/m²)": rng.normal(20, 1, n).round(1),
+        "Appendicular Lean Mass Index (kg/m²)": rng.normal(9.5, 0.5, n).round(1),
+        "Total Bone Mass (%)": rng.normal(5.3, 0.3, n).round(1),
+    })
+    # Older reports don't have the fat distribution ratios
+    old_reports = rng.random(n) < 0.05
+    frame.loc[old_reports, ["Android/Gynoid Fat Ratio", "Trunk/Legs Fat Ratio", "Trunk/Limb Fat Mass Ratio"]] = np.nan
+    return blank(frame, list(frame.columns[5:]), missing, seed)
+
+
+def write(directory, n_scans, n_patients=None, seed=0, missing=0.0):
+    """
+    Write master_dexa_data.csv and composition_indices.csv for ``n_scans`` scans
+    of ``n_patients`` patients to ``directory``, with a ``missing`` fraction of
+    the measurements blank.
+    """
+    os.makedirs(directory, exist_ok=True)
+    scan_frame = scans(n_scans, n_patients, seed)
+    master_path = os.path.join(directory, "master_dexa_data.csv")
+    composition_path = os.path.join(directory, "composition_indices.csv")
+    master(scan_frame, seed, missing).to_csv(master_path, index=False)
+    composition(scan_frame, seed, missing).to_csv(composition_path, index=False)
+    return master_path, composition_path
+
+
+# Report label of each composition index, as printed on the PDF reports
+REPORT_INDICES = {
+    "Total Body Weight (kg)": "Total body weight (kg)",
+    "BMI (kg/m²)": "Body mass index (kg/m²) (BMI)",
+    "Basal Metabolic Rate (kcal/day)": "Basal metabolic rate (kcal/Day)",
+    "Total Body Fat (%)": "Total body % Fat",
+    "Fat Mass Index (FMI)": "Fat mass/height² (kg/m²) (FMI)",
+    "Android/Gynoid Fat Ratio": "Android/Gynoid % fat ratio",
+    "Trunk/Legs Fat Ratio": "Trunk/legs % fat ratio",
+    "Trunk/Limb Fat Mass Ratio": "Trunk/limb fat mass ratio",
+    "Visceral Fat Area (cm²)": "Visceral Adipose Tissue Area (cm²)",
+    "Visceral Fat Mass (g)": "Visceral Adipose Tissue Mass (g)",
+    "Visceral Fat Volume (cm³)": "Visceral Adipose Tissue Volume (cm³)",
+    "Subcutaneous Fat Area (cm²)": "Subcutaneous Adipose Tissue Area (cm²)",
+    "Total Lean Body (%)": "Total body % Lean",
+    "Lean Mass Index (kg/m²)": "Lean mass/height² (kg/m²)",
+    "Appendicular Lean Mass Index (kg/m²)": "Append. Lean Mass/Height² (kg/m²)",
+    "Total Bone Mass (%)": "Total body % Bone",
+}
+
+REGION_COLUMNS = ["% Fat", "Tissues (g)", "Tissue Area (cm²)", "Fat (g)", "Lean (g)", "BMC (g)",
+                  "BMC Area (cm²)", "Total Mass (kg)"]
+
+
+def _pdf(*pages):
+    """ A PDF with one page per list of lines, each line shown in Helvetica. """
+    def escape(line):
+        return line.encode("cp1252").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    n_pages = len(pages)
+    kids = b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(n_pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, n_pages),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, lines in enumerate(pages):
+        content = b"BT /F1 9 Tf 12 TL 40 800 Td " + b" ".join(b"(" + escape(line) + b") Tj T*" for line in lines) + b" ET"
+        objects += [
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % (5 + 2 * i),
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def filler_lines(scan, page_number):
+    """ A report page with neither table: the header and a reference-range listing. """
+    return [
+        f"Patient :{scan['Patient Name'].replace('_', ' ')}    Height : 180.0 cm",
+        f"Reference data, page {page_number}",
+        *(f"Age {age}-{age + 4} {20 + age / 10:.1f} {1.1 - age / 500:.3f} {0.9 + age / 400:.3f} {age * 3}"
+          for age in range(20, 85, 1)),
+    ]
+
+
+def report_lines(scan, regions, indices):
+    """ The text of one report: header, regional table and composition indices. """
+    scan_date = pd.to_datetime(scan["Scan Date"], format="%d-%m-%Y").strftime("%d/%m/%Y")
+    lines = [
+        "DEXA Body Composition Report",
+        f"Patient :{scan['Patient Name'].replace('_', ' ')}    Height : 180.0 cm",
+        f"Scan Date :{scan_date}    Sex : Male",
+        "Region %Fat Tissue(g) Area(cm²) Fat(g) Lean(g) BMC(g) BMC Area(cm²) Total(kg)",
+    ]
+    for part, values in zip(regions["Body Part"], regions[REGION_COLUMNS].itertuples(index=False)):
+        lines.append(" ".join([part, *(f"{value:g}" for value in values)]))
+    lines.append("Composition Indices")
+    for column, label in REPORT_INDICES.items():
+        if pd.notna(indices[column]):
+            lines.append(f"{label} {indices[column]:g}")
+    return lines
+
+
+def write_reports(directory, n_scans, n_patients=None, seed=0, value_seed=None, extra_pages=0):
+    """
+    Write one PDF report per scan for ``n_scans`` scans to ``directory``; return their paths.
+    ``value_seed`` (default ``seed``) draws other measurements for the same scans, and
+    ``extra_pages`` adds that many pages with neither table to the end of each report.
+    """
+    os.makedirs(directory, exist_ok=True)
+    scan_frame = scans(n_scans, n_patients, seed)
+    value_seed = seed if value_seed is None else value_seed
+    master_frame = master(scan_frame, value_seed)
+    composition_frame = composition(scan_frame, value_seed)
+    paths = []
+    n_parts = len(BODY_PARTS)
+    for i, scan in scan_frame.iterrows():
+        regions = master_frame.iloc[i * n_parts:(i + 1) * n_parts]
+        path = os.path.join(directory, f"{scan['Unique ID']}.pdf")
+        with open(path, "wb") as f:
+            f.write(_pdf(report_lines(scan, regions, composition_frame.iloc[i]),
+                         *(filler_lines(scan, page) for page in range(2, extra_pages + 2))))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--scans", type=int, default=10_000)
+    parser.add_argument("--patients", type=int, default=None, help="default: one per 8 scans")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--missing", type=float, default=0.02, help="fraction of measurements left blank")
+    args = parser.parse_args()
+    for path in write(args.directory, args.scans, args.patients, args.seed, args.missing):
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
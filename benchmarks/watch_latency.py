@@ -0,0 +1,116 @@
+"""Seconds from a report landing in the drop folder to its scan on the dashboard.
+
+    python benchmarks/watch_latency.py [--reports 50] [--new 5] [--interval 0.2] [--debounce 0.5]
+
+Runs ``dexa.ingest.watch`` on a drop folder of ``--reports`` synthetic reports
+and the dashboard's store (``dexa.store``) in local mode on its CSVs, then
+drops ``--new`` reports in, the first one copied in two halves a moment apart
+as a slow copy would, and polls ``store.reload()`` until every new scan is in
+the snapshot. The half-copied report must not be parsed before it is
+complete, and the snapshot must equal the CSVs read from scratch; exits
+non-zero otherwise.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Time text extraction itself, not the text cache
+os.environ["DEXA_TEXT_CACHE_DIR"] = ""
+
+from benchmarks import synthetic
+from dexa import catalog, store
+from dexa.ingest import watch
+
+TIMEOUT = 60
+
+
+def wait_for(condition, poll=0.05):
+    """ Seconds until ``condition()`` holds, or None after ``TIMEOUT``. """
+    start = time.perf_counter()
+    while time.perf_counter() - start < TIMEOUT:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(poll)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=50)
+    parser.add_argument("--new", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--debounce", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        every_report = synthetic.write_reports(os.path.join(tmp, "all"), args.reports + args.new)
+        drop = os.path.join(tmp, "drop")
+        os.makedirs(drop)
+        for path in every_report[:args.reports]:
+            shutil.copy2(path, drop)
+        catalog.DATA_SOURCE, catalog.DATA_DIR = "local", os.path.join(tmp, "data")
+        os.makedirs(catalog.DATA_DIR)
+
+        log = io.StringIO()
+        stop = threading.Event()
+        with contextlib.redirect_stdout(log):
+            watcher = threading.Thread(target=watch.watch, kwargs=dict(
+                folder_path=drop, master_csv_path=catalog.MASTER.local_path,
+                composition_csv_path=catalog.COMPOSITION.local_path,
+                interval=args.interval, debounce=args.debounce, workers=1, stop=stop))
+            watcher.start()
+            backlog = wait_for(lambda: catalog.read_data_version() and len(store.reload().composition) == args.reports)
+            first = store.snapshot()
+
+            new_reports = every_report[args.reports:]
+            start = time.perf_counter()
+            # A slow copy: half the file, a pause shorter than the debounce, the rest
+            with open(new_reports[0], "rb") as f:
+                data = f.read()
+            landing = os.path.join(drop, os.path.basename(new_reports[0]))
+            with open(landing, "wb") as f:
+                f.write(data[:len(data) // 2])
+            time.sleep(args.debounce / 2)
+            with open(landing, "ab") as f:
+                f.write(data[len(data) // 2:])
+            for path in new_reports[1:]:
+                shutil.copy(path, drop)
+            latency = wait_for(lambda: len(store.reload().composition) == len(first.composition) + args.new)
+            latency = latency and time.perf_counter() - start
+            stop.set()
+            watcher.join()
+
+        print(f"{args.reports} reports in the drop folder, then {args.new} new "
+              f"(poll every {args.interval:g}s, debounce {args.debounce:g}s)")
+        print(f"{'backlog ingested and published':<36}{backlog:>8.2f}s" if backlog else "backlog never published")
+        print(f"{'new scans on the dashboard':<36}{latency:>8.2f}s" if latency else "new scans never appeared")
+        ok = bool(backlog and latency)
+        if "Skipping file" in log.getvalue():
+            print("MISMATCH: a report failed to parse (read before it was complete?)")
+            ok = False
+        current = store.snapshot()
+        for name, source in catalog.SOURCES.items():
+            frames = [catalog.parse_frame(catalog.read_csv(source.local_path)), getattr(current, name)]
+            frames = [frame.sort_values(list(source.key)).reset_index(drop=True) for frame in frames]
+            try:
+                pd.testing.assert_frame_equal(*frames, check_categorical=False)
+            except AssertionError as e:
+                print(f"MISMATCH: {name} snapshot differs from its CSV\n{e}")
+                ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("New reports reached the dashboard, each parsed once complete")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared data and helper modules for the DEXA dashboard pages."""
@@ -0,0 +1,77 @@
+"""Command line entry point for PDF ingestion.
+
+    python -m dexa ingest FOLDER [--reprocess] [--workers N] [--batch-size N]
+    python -m dexa watch FOLDER [--interval S] [--debounce S] [--workers N] [--batch-size N]
+    python -m dexa migrate
+
+``ingest`` adds the reports in FOLDER that have not been ingested yet to the
+master and composition CSVs and exits, with status 1 if any report failed to
+parse (those stay pending for the next run); ``watch`` keeps doing so as new reports
+land in FOLDER (see ``dexa.ingest.watch``). ``migrate`` copies the CSVs into
+the SQLite database next to them (see ``dexa.database``), which ingestion
+then keeps up to date. The CSVs default to the ones the dashboard reads in
+local mode (under ``DEXA_DATA_DIR``).
+"""
+import argparse
+import os
+import sys
+
+from dexa import catalog, database
+from dexa.ingest import watch
+from dexa.ingest.reports import update_csvs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dexa", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    tables = argparse.ArgumentParser(add_help=False)
+    tables.add_argument("--master", default=catalog.MASTER.local_path, help="master CSV (default: %(default)s)")
+    tables.add_argument("--composition", default=catalog.COMPOSITION.local_path,
+                        help="composition indices CSV (default: %(default)s)")
+
+    reports = argparse.ArgumentParser(add_help=False, parents=[tables])
+    reports.add_argument("folder", help="folder of DEXA report PDFs")
+    reports.add_argument("--workers", type=int, default=None,
+                         help="worker processes (default: DEXA_INGEST_WORKERS or one per CPU)")
+    reports.add_argument("--batch-size", type=int, default=None,
+                         help="reports parsed and written at a time (default: DEXA_INGEST_BATCH_SIZE or 200)")
+
+    ingest = commands.add_parser("ingest", parents=[reports], help="ingest the reports not ingested yet and exit")
+    ingest.add_argument("--reprocess", action="store_true", help="parse every report again")
+
+    watcher = commands.add_parser("watch", parents=[reports], help="ingest reports as they land in the folder")
+    watcher.add_argument("--interval", type=float, default=watch.WATCH_INTERVAL,
+                         help="seconds between polls of the folder (default: %(default)s)")
+    watcher.add_argument("--debounce", type=float, default=watch.DEBOUNCE,
+                         help="seconds a report must be unchanged before it is ingested (default: %(default)s)")
+
+    commands.add_parser("migrate", parents=[tables], help="copy the CSVs into the SQLite database next to them")
+
+    args = parser.parse_args(argv)
+    for csv_path in (args.master, args.composition):
+        os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+    if args.command == "migrate":
+        path = database.path_for(args.master)
+        rows = database.migrate({"master": args.master, "composition": args.composition}, path)
+        print(f"Migrated {rows['master']} master rows and {rows['composition']} composition rows to {path}")
+        return 0
+    if args.command == "ingest":
+        failed = update_csvs(args.folder, args.master, args.composition,
+                             workers=args.workers, reprocess=args.reprocess, batch_size=args.batch_size)
+        if failed:
+            print(f"{len(failed)} files failed to parse; they stay pending for the next run", file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        watch.watch(args.folder, args.master, args.composition, interval=args.interval, debounce=args.debounce,
+                    workers=args.workers, batch_size=args.batch_size)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
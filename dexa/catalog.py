@@ -0,0 +1,302 @@
+"""Shared data catalog: every page gets its DataFrames from here.
+
+Each source is loaded at most once per process and every caller receives the same
+parsed, typed DataFrame.
+
+* ``remote`` mode (default) downloads the CSVs from GitHub into a disk cache and
+  revalidates them with ETag / Last-Modified, so an unchanged file is never
+  downloaded twice and the dashboard still boots offline from the cached copy.
+* ``local`` mode reads the CSVs under ``Data/`` directly.
+* ``sqlite`` mode loads nothing here: the pages query ``Data/dexa.sqlite3``
+  one patient at a time (see ``dexa.database``).
+
+After each ingestion run the pipeline publishes a version stamp next to the
+CSVs (``data_version.json``, see ``publish_data_version``) recording how much
+of each CSV that run left complete. While a run is writing, a marker next to
+them (``ingesting.json``, see ``ingesting``) records where each CSV ended when
+it started.
+
+In local mode the typed columnar store written by the ingestion scripts
+(``Data/*.store``, see ``dexa.columnar``) is memory-mapped instead of parsing the
+CSV, unless the CSV is newer. Otherwise parsed frames are cached on disk in the
+same columnar format, keyed by the raw file's content hash (remote) or mtime and
+size (local), so an unchanged file is never re-parsed.
+
+Configuration (environment variables):
+    DEXA_DATA_SOURCE   "remote", "local" or "sqlite"
+    DEXA_DATA_DIR      directory holding the CSVs in local mode (default: Data/)
+    DEXA_CACHE_DIR     disk cache directory (default: .cache/); nothing in it is
+                       unpickled, unlike the figure cache's DEXA_FIGURE_CACHE_DIR
+                       (see dexa.figure_cache), which must stay private
+    DEXA_FETCH_TIMEOUT network timeout in seconds for remote mode
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import pandas as pd
+
+from dexa import columnar, metrics
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_SOURCE = os.environ.get("DEXA_DATA_SOURCE", "remote")
+DATA_DIR = os.environ.get("DEXA_DATA_DIR", os.path.join(ROOT_DIR, "Data"))
+CACHE_DIR = os.environ.get("DEXA_CACHE_DIR", os.path.join(ROOT_DIR, ".cache"))
+FETCH_TIMEOUT = float(os.environ.get("DEXA_FETCH_TIMEOUT", "10"))
+
+# Publication stamp written next to the CSVs after each ingestion run
+VERSION_FILE = "data_version.json"
+
+# Marker kept next to the CSVs while an ingestion run writes to them
+INGESTING_FILE = "ingesting.json"
+
+BASE_URL = "https://raw.githubusercontent.com/rigg-alex/DEXA_Dashboard/main/Data/"
+
+# The ingestion scripts write dd-mm-YYYY, older composition rows use d/mm/YYYY
+DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y")
+
+# Columns kept as categorical strings; everything else except "Scan Date" is numeric
+TEXT_COLUMNS = ["Unique ID", "Patient Name", "Body Part", "Patient ID", "Ethnicity", "Sex", "Measure", "Result"]
+
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    filename: str
+    key: tuple
+
+    @property
+    def url(self):
+        return BASE_URL + self.filename
+
+    @property
+    def local_path(self):
+        return os.path.join(DATA_DIR, self.filename)
+
+
+MASTER = Source("master", "master_dexa_data.csv", ("Unique ID", "Body Part"))
+COMPOSITION = Source("composition", "composition_indices.csv", ("Unique ID",))
+SOURCES = {source.name: source for source in (MASTER, COMPOSITION)}
+
+_lock = threading.Lock()
+_frames = {}
+
+
+def parse_scan_dates(values):
+    """ Parse "Scan Date" strings, accepting every format the data has been written in. """
+    dates = pd.to_datetime(values, format=DATE_FORMATS[0], errors="coerce")
+    for date_format in DATE_FORMATS[1:]:
+        missing = dates.isna() & values.notna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(values[missing], format=date_format, errors="coerce")
+    return dates
+
+
+def read_csv(path_or_buffer, **kwargs):
+    """ Read a raw CSV with the text columns kept as strings. """
+    return pd.read_csv(path_or_buffer, dtype={column: str for column in TEXT_COLUMNS + ["Scan Date"]}, **kwargs)
+
+
+def categorize(frame):
+    """ Store the text columns as categoricals (after a concat turned them back to objects). """
+    for column in TEXT_COLUMNS:
+        if column in frame.columns and not isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype("category")
+    return frame
+
+
+def parse_frame(raw):
+    """ Turn a raw CSV frame into the typed frame the pages work with. """
+    frame = raw.copy()
+    frame.columns = frame.columns.str.replace("Â²", "²", regex=False).str.strip()
+    frame["Scan Date"] = parse_scan_dates(frame["Scan Date"])
+    frame = frame.dropna(subset=["Scan Date"])
+    for column in frame.columns:
+        if column not in TEXT_COLUMNS and column != "Scan Date":
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+    frame = frame.sort_values("Scan Date", kind="mergesort").reset_index(drop=True)
+    return categorize(frame)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_data_version(directory=None):
+    """ The last stamp published in ``directory`` (default ``DATA_DIR``), or {} if there is none. """
+    return _read_json(os.path.join(directory or DATA_DIR, VERSION_FILE))
+
+
+def publish_data_version(csv_paths):
+    """
+    Bump the version stamp next to ``csv_paths`` and record their current
+    sizes. Returns the new version.
+    """
+    by_directory = {}
+    for path in csv_paths:
+        by_directory.setdefault(os.path.dirname(os.path.abspath(path)), []).append(path)
+    version = None
+    for directory, paths in by_directory.items():
+        stamp = read_data_version(directory)
+        files = dict(stamp.get("files", {}))
+        for path in paths:
+            if os.path.exists(path):
+                files[os.path.basename(path)] = {"size": os.path.getsize(path)}
+        version = stamp.get("version", 0) + 1
+        stamp = {"version": version, "published": time.time(), "files": files}
+        _atomic_write(os.path.join(directory, VERSION_FILE), json.dumps(stamp).encode())
+    return version
+
+
+def _running(pid):
+    if os.name != "posix":
+        # os.kill cannot probe a process elsewhere
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def ingesting(csv_paths):
+    """
+    Mark ``csv_paths`` as being written by an ingestion run until the block
+    exits. The dashboard reads rows appended to a marked CSV only up to where
+    it ended when the run started, so the rows of a run appear together once
+    it has finished, while rows appended any other way are read right away.
+    """
+    by_directory = {}
+    for path in csv_paths:
+        by_directory.setdefault(os.path.dirname(os.path.abspath(path)), []).append(path)
+    markers = []
+    try:
+        for directory, paths in by_directory.items():
+            files = {os.path.basename(path): {"size": os.path.getsize(path)} for path in paths if os.path.exists(path)}
+            marker = os.path.join(directory, INGESTING_FILE)
+            _atomic_write(marker, json.dumps({"pid": os.getpid(), "files": files}).encode())
+            markers.append(marker)
+        yield
+    finally:
+        for marker in markers:
+            try:
+                os.remove(marker)
+            except OSError:
+                pass
+
+
+def read_ingesting(directory=None):
+    """ The marker of the ingestion run writing in ``directory`` (default ``DATA_DIR``), or {} if none is. """
+    marker = _read_json(os.path.join(directory or DATA_DIR, INGESTING_FILE))
+    # A marker left behind by a run that died is ignored
+    if not marker.get("pid") or not _running(marker["pid"]):
+        return {}
+    return marker
+
+
+def fetch(source):
+    """
+    Return (path, stamp) for the latest raw CSV of a remote source.
+    The cached copy is revalidated with a conditional request and reused on 304
+    or when the network is unavailable.
+    """
+    raw_path = os.path.join(CACHE_DIR, source.filename)
+    meta_path = raw_path + ".meta.json"
+    meta = _read_json(meta_path)
+    cached = os.path.exists(raw_path) and "sha256" in meta
+
+    request = urllib.request.Request(source.url)
+    if cached:
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            body = response.read()
+            meta = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": hashlib.sha256(body).hexdigest(),
+            }
+        _atomic_write(raw_path, body)
+        _atomic_write(meta_path, json.dumps(meta).encode())
+    except urllib.error.HTTPError as e:
+        if not cached:
+            raise
+        if e.code != 304:
+            print(f"Error fetching {source.url} ({e.code}), using cached copy")
+    except (urllib.error.URLError, OSError) as e:
+        if not cached:
+            raise
+        print(f"Error fetching {source.url} ({e}), using cached copy")
+
+    return raw_path, meta["sha256"]
+
+
+def locate(source):
+    """ Return (path, stamp) of the raw CSV for ``source`` in the configured mode. """
+    if DATA_SOURCE == "local":
+        stat = os.stat(source.local_path)
+        return source.local_path, f"{stat.st_mtime_ns}-{stat.st_size}"
+    return fetch(source)
+
+
+def _load_source(source):
+    if DATA_SOURCE == "local":
+        store_path = columnar.store_path(source.local_path)
+        if columnar.is_fresh(store_path, source.local_path):
+            return columnar.read(store_path)
+
+    path, stamp = locate(source)
+    cache_path = os.path.join(CACHE_DIR, f"{source.name}.store")
+    meta = columnar.read_meta(cache_path)
+    if meta is not None and meta["stamp"] == stamp:
+        return columnar.read(cache_path, meta)
+
+    frame = parse_frame(read_csv(path))
+    try:
+        columnar.write(frame, cache_path, stamp=stamp)
+    except OSError as e:
+        print(f"Could not write parsed cache {cache_path}: {e}")
+    return frame
+
+
+def load(name):
+    """ Return the parsed DataFrame for a source, loading it on first use. """
+    with _lock:
+        if name not in _frames:
+            with metrics.timer(metrics.LOAD_SECONDS, source=name):
+                _frames[name] = _load_source(SOURCES[name])
+        return _frames[name]
+
+
+def load_master():
+    return load("master")
+
+
+def load_composition():
+    return load("composition")
@@ -0,0 +1,204 @@
+"""Typed columnar on-disk store for the master and composition tables.
+
+A store is a directory next to the CSV (``master_dexa_data.store/``) holding one
+``.npy`` file per column and a ``meta.json`` describing them:
+
+* numeric columns keep their int64 / float64 dtype,
+* "Scan Date" is stored as datetime64[ns] (ISO dates, no string parsing),
+* text columns ("Patient Name", "Body Part", ...) are stored as categorical
+  codes, with the categories listed in ``meta.json``.
+
+``read`` opens every column with ``np.load(mmap_mode="r")`` and wraps the arrays
+in a DataFrame without copying, so loading costs a few file opens instead of a
+CSV parse and the OS pages data in as callbacks touch it. The arrays are
+read-only; pandas operations return new, writable frames as usual.
+
+``write`` is atomic for readers: column files are written under a new
+generation prefix and ``meta.json`` is swapped in last. ``extend`` adds rows
+the same way, merging them into memory-mapped column files so the table is
+never loaded whole.
+"""
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+
+def store_path(csv_path):
+    """ Return the store directory that sits next to ``csv_path``. """
+    return os.path.splitext(csv_path)[0] + ".store"
+
+
+def _new_generation(path):
+    os.makedirs(path, exist_ok=True)
+    return uuid.uuid4().hex[:12]
+
+
+def _commit(path, generation, columns, rows, stamp):
+    """ Swap in the meta.json of a fully written generation and drop earlier ones. """
+    meta = {"format": FORMAT_VERSION, "rows": rows, "stamp": stamp, "columns": columns}
+    tmp_path = os.path.join(path, f"{META_FILE}.{generation}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    # Drop earlier generations; readers that already mapped them keep their handles
+    current = {column["file"] for column in columns}
+    for filename in os.listdir(path):
+        if filename.endswith(".npy") and filename not in current:
+            try:
+                os.remove(os.path.join(path, filename))
+            except OSError:
+                pass
+
+
+def write(frame, path, stamp=None):
+    """ Write a typed frame to the store at ``path``. ``stamp`` identifies its source data. """
+    generation = _new_generation(path)
+    columns = []
+    for i, (name, values) in enumerate(frame.items()):
+        filename = f"{generation}_{i}.npy"
+        column = {"name": name, "file": filename}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            column["kind"] = "category"
+            column["categories"] = [str(c) for c in values.cat.categories]
+            array = values.cat.codes.to_numpy()
+        else:
+            column["kind"] = "array"
+            array = values.to_numpy()
+            if array.dtype == object:
+                raise TypeError(f"Column {name!r} must be numeric, datetime or categorical")
+        np.save(os.path.join(path, filename), np.ascontiguousarray(array), allow_pickle=False)
+        columns.append(column)
+    _commit(path, generation, columns, len(frame), stamp)
+
+
+def _codes_dtype(n_categories):
+    # The smallest code type, as pandas picks it
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def extend(path, chunks, stamp=None, block_rows=1 << 16):
+    """
+    Add the rows of the typed frames yielded by ``chunks()`` to the store at
+    ``path`` (or build it, if there is none), sorted by "Scan Date" as a stable
+    sort of the old rows followed by the new ones would be. ``chunks`` is called
+    twice, and the columns are merged into memory-mapped files ``block_rows`` at
+    a time, so memory holds the new rows' dates and positions but not the table.
+    """
+    meta = read_meta(path)
+    old = read(path, meta) if meta is not None else None
+
+    # First pass: the new rows' dates, and each column's categories or dtype
+    names, dates, kinds = None, [], {}
+    for chunk in chunks():
+        if names is None:
+            names = list(old.columns) if old is not None else list(chunk.columns)
+        if list(chunk.columns) != names:
+            raise ValueError(f"Columns {list(chunk.columns)} do not match the store's {names}")
+        dates.append(chunk["Scan Date"].to_numpy())
+        for name in names:
+            values = chunk[name]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                kinds.setdefault(name, set()).update(values.cat.categories)
+            else:
+                kinds[name] = np.result_type(kinds.get(name, values.dtype), values.dtype)
+    if names is None:
+        return
+    n_old = len(old) if old is not None else 0
+    for name in names if old is not None else ():
+        values = old[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            kinds.setdefault(name, set()).update(values.cat.categories)
+        else:
+            kinds[name] = np.result_type(kinds.get(name, values.dtype), values.dtype)
+
+    # Where each new row goes: after the old rows of its date or earlier, new rows in their own stable order
+    new_dates = np.concatenate(dates)
+    order = np.argsort(new_dates, kind="stable")
+    inserted_at = np.searchsorted(old["Scan Date"].to_numpy(), new_dates[order], side="right") \
+        if old is not None else np.zeros(len(order), dtype=np.int64)
+    destinations = np.empty(len(order), dtype=np.int64)
+    destinations[order] = inserted_at + np.arange(len(order))
+    del new_dates, order, dates
+
+    # Second pass: write each column's merged values in place
+    generation = _new_generation(path)
+    rows = n_old + len(destinations)
+    columns, outputs, encoders = [], {}, {}
+    for i, name in enumerate(names):
+        filename = f"{generation}_{i}.npy"
+        column = {"name": name, "file": filename}
+        if isinstance(kinds[name], set):
+            categories = np.array(sorted(kinds[name]), dtype=object)
+            column["kind"] = "category"
+            column["categories"] = [str(c) for c in categories]
+            dtype = _codes_dtype(len(categories))
+            # Old or new codes -> merged codes; code -1 (missing) stays -1
+            encoders[name] = lambda values, categories=categories, dtype=dtype: np.append(
+                np.searchsorted(categories, np.asarray(values.cat.categories, dtype=object)), -1
+            ).astype(dtype)[values.cat.codes.to_numpy()]
+        else:
+            column["kind"] = "array"
+            dtype = kinds[name]
+            encoders[name] = lambda values, dtype=dtype: values.to_numpy().astype(dtype, copy=False)
+        outputs[name] = np.lib.format.open_memmap(os.path.join(path, filename), mode="w+", dtype=dtype, shape=(rows,))
+        columns.append(column)
+
+    for start in range(0, n_old, block_rows):
+        positions = np.arange(start, min(start + block_rows, n_old))
+        # Each old row moves down by the number of new rows inserted before it
+        target = positions + np.searchsorted(inserted_at, positions, side="right")
+        for name in names:
+            outputs[name][target] = encoders[name](old[name].iloc[start:start + block_rows])
+    start = 0
+    for chunk in chunks():
+        target = destinations[start:start + len(chunk)]
+        for name in names:
+            outputs[name][target] = encoders[name](chunk[name])
+        start += len(chunk)
+    for output in outputs.values():
+        output.flush()
+    del outputs
+    _commit(path, generation, columns, rows, stamp)
+
+
+def read_meta(path):
+    """ Return the store's metadata, or None if there is no readable store at ``path``. """
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("format") == FORMAT_VERSION else None
+
+
+def read(path, meta=None):
+    """ Open the store at ``path`` as a DataFrame backed by memory-mapped columns. """
+    meta = meta or read_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f"No columnar store at {path}")
+    data = {}
+    for column in meta["columns"]:
+        array = np.load(os.path.join(path, column["file"]), mmap_mode="r", allow_pickle=False)
+        if column["kind"] == "category":
+            data[column["name"]] = pd.Categorical.from_codes(array, categories=column["categories"])
+        else:
+            data[column["name"]] = array
+    return pd.DataFrame(data, copy=False)
+
+
+def is_fresh(path, csv_path):
+    """ True if the store exists and is not older than the CSV it was built from. """
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(meta_path) >= os.path.getmtime(csv_path)
@@ -0,0 +1,307 @@
+"""SQLite copy of the master and composition tables, queried one patient at a time.
+
+``python -m dexa migrate`` loads the CSVs into ``dexa.sqlite3`` next to them:
+
+    scans                   one row per "Unique ID" with its "Patient Name" and
+                            "Scan Date" (ISO text), indexed on (patient, scan date)
+    body_part_measurements  the master table's other columns, keyed on
+                            ("Unique ID", "Body Part")
+    composition_indices     the composition table's other columns, keyed on "Unique ID"
+
+Measurement columns keep their CSV names; a column that a CSV or an ingested
+batch brings for the first time is added to its table. Once the database
+exists, every ingestion run upserts its rows into it in one transaction (see
+``dexa.ingest.pipeline``) and bumps ``meta.version``, so readers see a run's
+rows together.
+
+With ``DEXA_DATA_SOURCE=sqlite`` the dashboard never loads the tables: the
+patient indexes are ``PatientQuery`` objects that answer each callback with
+one indexed query for the selected patient, and the store polls
+``meta.version`` instead of the CSVs (see ``dexa.store``).
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from dexa import catalog, metrics
+
+DATABASE_FILE = "dexa.sqlite3"
+
+# Source name -> measurement table
+TABLES = {"master": "body_part_measurements", "composition": "composition_indices"}
+
+SCAN_COLUMNS = ["Unique ID", "Patient Name", "Scan Date"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS scans (
+    "Unique ID" TEXT PRIMARY KEY,
+    "Patient Name" TEXT,
+    "Scan Date" TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_patient_date ON scans ("Patient Name", "Scan Date");
+CREATE TABLE IF NOT EXISTS body_part_measurements (
+    "Unique ID" TEXT NOT NULL REFERENCES scans,
+    "Body Part" TEXT,
+    PRIMARY KEY ("Unique ID", "Body Part")
+);
+CREATE TABLE IF NOT EXISTS composition_indices (
+    "Unique ID" TEXT PRIMARY KEY REFERENCES scans
+);
+"""
+
+# Rows per chunk when a CSV is migrated
+CHUNK_ROWS = 50_000
+
+# Patients whose rows each PatientQuery keeps, most recently used first
+PATIENT_CACHE = 64
+
+_readers = threading.local()
+
+
+def default_path():
+    """ The database the dashboard reads, next to the local CSVs. """
+    return os.path.join(catalog.DATA_DIR, DATABASE_FILE)
+
+
+def path_for(csv_path):
+    """ The database kept next to ``csv_path``. """
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), DATABASE_FILE)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns(connection, table):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def _reader(path):
+    """ This thread's read-only connection to ``path``, reopened if the file was replaced or the process forked. """
+    opened = (os.stat(path).st_ino, os.getpid())
+    connections = getattr(_readers, "connections", None)
+    if connections is None:
+        connections = _readers.connections = {}
+    connection, current = connections.get(path, (None, None))
+    if current != opened:
+        # A connection inherited across a fork must not be used, or even closed, in the child
+        if connection is not None and current[1] == opened[1]:
+            connection.close()
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA query_only = ON")
+        connections[path] = (connection, opened)
+    return connection
+
+
+def version(path=None):
+    """ The database's ``meta.version``, or None if there is no database at ``path``. """
+    path = path or default_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        return _reader(path).execute("SELECT version FROM meta").fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
+def _typed(columns, rows):
+    """
+    Rows read from the database as a frame typed as ``catalog.parse_frame`` types
+    the CSVs, except that text columns stay plain strings: a patient's rows are
+    too few for categoricals to pay for themselves.
+    """
+    values = zip(*rows) if rows else [()] * len(columns)
+    data = {}
+    # One array per column, so the frame is built once instead of column by column
+    for column, column_values in zip(columns, values):
+        if column == "Scan Date":
+            data[column] = np.array(column_values, dtype="datetime64[ns]")
+        elif column in catalog.TEXT_COLUMNS:
+            data[column] = np.array(column_values, dtype=object)
+        else:
+            try:
+                data[column] = np.array(column_values, dtype="float64")
+            except (TypeError, ValueError):
+                data[column] = pd.to_numeric(pd.Series(column_values, dtype=object), errors="coerce").to_numpy()
+    return pd.DataFrame(data, columns=columns)
+
+
+def _records(frame):
+    """ The rows of ``frame`` as tuples of values sqlite3 can bind (dates as ISO text, NaN as NULL). """
+    frame = frame.copy()
+    if "Scan Date" in frame.columns:
+        frame["Scan Date"] = frame["Scan Date"].dt.strftime("%Y-%m-%d")
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+class Writer:
+    def __init__(self, path, reset=False):
+        """ Start a transaction on the database at ``path`` (created if missing); ``reset`` empties its tables. """
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        # Readers keep reading the last commit while a run writes
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("BEGIN IMMEDIATE")
+        if reset:
+            for table in ("scans", *TABLES.values()):
+                self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in filter(str.strip, SCHEMA.split(";")):
+            self.connection.execute(statement)
+        if self.connection.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0:
+            self.connection.execute("INSERT INTO meta VALUES (0)")
+
+    def upsert(self, name, frame):
+        """ Insert or replace the rows of a typed frame of source ``name`` (see ``catalog.parse_frame``). """
+        table, key = TABLES[name], list(catalog.SOURCES[name].key)
+        frame = frame[frame["Unique ID"].notna()]
+        if frame.empty:
+            return
+        self._upsert("scans", frame[SCAN_COLUMNS].drop_duplicates("Unique ID", keep="last"), ["Unique ID"])
+
+        measurements = frame.drop(columns=SCAN_COLUMNS[1:])
+        columns = _columns(self.connection, table)
+        for column in measurements.columns:
+            if column not in columns:
+                kind = "TEXT" if column in catalog.TEXT_COLUMNS else "REAL"
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(column)} {kind}")
+                columns.append(column)
+        # Columns the rows lack are cleared, as rewriting the CSV row would
+        self._upsert(table, measurements.reindex(columns=columns), key)
+
+    def _upsert(self, table, frame, key):
+        columns = list(frame.columns)
+        updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in columns if c not in key)
+        self.connection.executemany(
+            f"INSERT INTO {table} ({', '.join(map(_quote, columns))}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(map(_quote, key))}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING"),
+            _records(frame))
+
+    def commit(self):
+        """ Publish everything upserted so far as a new ``meta.version``. """
+        self.connection.execute("UPDATE meta SET version = version + 1")
+        self.connection.execute("COMMIT")
+
+    def close(self):
+        """ Discard anything not committed. """
+        if self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        self.connection.close()
+
+
+def migrate(csv_paths, path=None):
+    """
+    Fill the database at ``path`` from ``csv_paths`` ({source name: CSV path}),
+    replacing its tables in one transaction. Returns {source name: rows}.
+    """
+    rows = {}
+    writer = Writer(path or default_path(), reset=True)
+    try:
+        for name, csv_path in csv_paths.items():
+            rows[name] = 0
+            for chunk in catalog.read_csv(csv_path, chunksize=CHUNK_ROWS):
+                chunk = catalog.parse_frame(chunk)
+                writer.upsert(name, chunk)
+                rows[name] += len(chunk)
+        writer.commit()
+    finally:
+        writer.close()
+    return rows
+
+
+def read_columns(name, columns, path=None):
+    """
+    ``columns`` of every row of source ``name`` (all NULL where its table lacks
+    one), read ``CHUNK_ROWS`` at a time and typed as ``_typed`` types them.
+    """
+    connection = _reader(path or default_path())
+    table = TABLES[name]
+    available = set(_columns(connection, table))
+    selected = [f"s.{_quote(c)}" if c in SCAN_COLUMNS else f"m.{_quote(c)}" if c in available
+                else f"NULL AS {_quote(c)}" for c in columns]
+    cursor = connection.execute(
+        f'SELECT {", ".join(selected)} FROM scans s JOIN {table} m ON m."Unique ID" = s."Unique ID"')
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        chunks.append(_typed(columns, rows))
+    return pd.concat(chunks, ignore_index=True) if chunks else _typed(columns, [])
+
+
+class PatientQuery:
+    """
+    ``PatientIndex``'s lookups for source ``name``, answered by one indexed
+    query per patient. ``transform`` turns a patient's rows into the rows
+    returned (e.g. ``symmetry.calculate_symmetry``).
+
+    The store builds new ``PatientQuery`` objects for every database version,
+    so the rows of the last ``PATIENT_CACHE`` patients are kept: a callback
+    that asks for several body parts of one patient queries once.
+    """
+
+    def __init__(self, name, path=None, transform=None):
+        self.table = TABLES[name]
+        self.path = path or default_path()
+        self.transform = transform
+        self._patients = None
+        self._rows = OrderedDict()
+        # Callbacks on a worker's threads share the cache
+        self._lock = threading.Lock()
+
+    def patients(self):
+        """ All patient names, sorted. """
+        if self._patients is None:
+            self._patients = [row[0] for row in _reader(self.path).execute(
+                f'SELECT DISTINCT "Patient Name" FROM scans s WHERE "Patient Name" IS NOT NULL '
+                f'AND EXISTS (SELECT 1 FROM {self.table} m WHERE m."Unique ID" = s."Unique ID") '
+                f'ORDER BY "Patient Name"')]
+        return self._patients
+
+    def __contains__(self, patient):
+        return patient in set(self.patients())
+
+    @metrics.timed("slice")
+    def patient(self, patient):
+        """ The patient's rows in scan date order (empty if unknown). """
+        with self._lock:
+            rows = self._rows.get(patient)
+            if rows is not None:
+                self._rows.move_to_end(patient)
+                return rows
+        # Queried outside the lock, so other patients are not held up
+        rows = self._select(patient)
+        with self._lock:
+            self._rows[patient] = rows
+            while len(self._rows) > PATIENT_CACHE:
+                self._rows.popitem(last=False)
+        return rows
+
+    @metrics.timed("slice")
+    def part(self, patient, part):
+        """ The patient's rows for one body part in scan date order. """
+        return self.parts(patient, [part])
+
+    @metrics.timed("slice")
+    def parts(self, patient, parts):
+        """ The patient's rows for several body parts in scan date order. """
+        rows = self.patient(patient)
+        return rows[rows["Body Part"].isin(parts)]
+
+    def _select(self, patient):
+        connection = _reader(self.path)
+        columns = [f"s.{_quote(c)}" for c in SCAN_COLUMNS] + \
+                  [f"m.{_quote(c)}" for c in _columns(connection, self.table) if c != "Unique ID"]
+        cursor = connection.execute(
+            f'SELECT {", ".join(columns)} FROM scans s JOIN {self.table} m ON m."Unique ID" = s."Unique ID" '
+            f'WHERE s."Patient Name" = ? ORDER BY s."Scan Date", m.rowid', [patient])
+        frame = _typed([d[0] for d in cursor.description], cursor.fetchall())
+        if self.transform is not None:
+            frame = self.transform(frame).sort_values("Scan Date", kind="mergesort").reset_index(drop=True)
+        return frame
@@ -0,0 +1,190 @@
+"""Bounded cache for figures and callback responses.
+
+Callbacks wrap their expensive part in ``figure_cache.get_or_build(key, build)``
+with a key of the form ``(page, patient, selection, snapshot.fingerprint)``.
+Because the data fingerprint is part of the key, a reload never serves stale
+figures; old entries simply age out.
+
+Two tiers:
+
+* memory: an LRU of at most ``DEXA_FIGURE_CACHE_SIZE`` entries, each dropped
+  after ``DEXA_FIGURE_CACHE_TTL`` seconds;
+* disk (optional): when ``DEXA_FIGURE_CACHE_DIR`` is set, entries are also
+  pickled there so every gunicorn worker pointing at the same directory reuses
+  the others' results. It is capped at ``DEXA_FIGURE_CACHE_DISK_SIZE`` files
+  and uses the same TTL. Unpickling runs code, so anyone who can write to the
+  directory could run code in the dashboard: it is created private (0700) and
+  the cache refuses a directory owned by another user or writable by others.
+
+Hit/miss counters are available from ``stats()`` and the ``/cache-stats`` route.
+"""
+import hashlib
+import os
+import pickle
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = int(os.environ.get("DEXA_FIGURE_CACHE_SIZE", "256"))
+MAX_AGE = float(os.environ.get("DEXA_FIGURE_CACHE_TTL", "3600"))
+DISK_DIR = os.environ.get("DEXA_FIGURE_CACHE_DIR")
+DISK_MAX_ENTRIES = int(os.environ.get("DEXA_FIGURE_CACHE_DISK_SIZE", "4096"))
+
+# Prune the disk tier after this many writes rather than on every write
+DISK_PRUNE_EVERY = 64
+
+
+def _check_private(directory):
+    """ Raise unless ``directory`` belongs to this user and nobody else can write to it. """
+    if not hasattr(os, "getuid"):
+        return
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"Figure cache directory {directory} belongs to another user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Figure cache directory {directory} is writable by other users (chmod 700 it)")
+
+
+class FigureCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_age=MAX_AGE, disk_dir=DISK_DIR,
+                 disk_max_entries=DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "errors": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, mode=0o700, exist_ok=True)
+            _check_private(disk_dir)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get_or_build(self, key, build):
+        """ Return the cached value for ``key``, calling ``build()`` on a miss. """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.max_age:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self.counters["expired"] += 1
+
+        found, value = self._disk_get(key, now)
+        if found:
+            self._count("disk_hits")
+        else:
+            self._count("misses")
+            value = build()
+            self._disk_put(key, value)
+        self._put(key, value, now)
+        return value
+
+    def _put(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".pkl")
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return False, None
+        path = self._disk_path(key)
+        try:
+            if now - os.path.getmtime(path) > self.max_age:
+                return False, None
+            with open(path, "rb") as f:
+                stored_key, value = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception:
+            self._count("errors")
+            return False, None
+        # Guard against hash collisions
+        return (True, value) if stored_key == repr(key) else (False, None)
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((repr(key), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._count("errors")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % DISK_PRUNE_EVERY == 0
+        if prune:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """ Drop expired disk entries and the oldest ones beyond ``disk_max_entries``. """
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".pkl"):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                files.append((mtime, entry.path))
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.disk_max_entries)]:
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            self._count("evictions")
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_age": self.max_age,
+                "disk_dir": self.disk_dir,
+                "hit_ratio": (self.counters["hits"] + self.counters["disk_hits"]) / lookups if lookups else None,
+            }
+
+
+# Shared by every page; keys start with the page name
+figure_cache = FigureCache()
+
+
+def stats():
+    return figure_cache.stats()
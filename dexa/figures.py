@@ -0,0 +1,105 @@
+"""Plain-dict figure builders that skip plotly's object validation.
+
+``go.Figure`` / ``make_subplots`` validate every property on construction and
+again on every ``update_layout``, which is a large share of callback time for
+figures that are rebuilt from the same few layouts. The helpers here build the
+same figures as plain ``{"data": [...], "layout": {...}}`` dicts:
+
+* the template JSON (``template()``) and the subplot axes
+  (``secondary_y_layout()``, ``shared_x_layout()``) are computed once with
+  plotly and cached;
+* static layout parts live in module-level dicts in the pages and are merged
+  into a new dict per figure with ``merge`` (cached dicts are never mutated);
+* traces are ``scatter(...)`` dicts holding the pandas/NumPy data as is.
+
+Dash serializes these with the same encoder as ``go.Figure`` and the output is
+JSON-equivalent to the validated figures (``benchmarks/figures.py`` checks it).
+
+``use_json_engine`` selects plotly's JSON engine for every response: "orjson"
+(much faster; ``pip install orjson``), "json", or "auto" (orjson when installed).
+It is applied at import from ``DEXA_JSON_ENGINE`` when set.
+"""
+import functools
+import os
+
+import plotly.io as pio
+
+
+@functools.lru_cache(maxsize=None)
+def template(name=None):
+    """ The serialized template, as ``go.Figure`` embeds it in ``layout.template``. """
+    return pio.templates[name or pio.templates.default].to_plotly_json()
+
+
+@functools.lru_cache(maxsize=None)
+def _secondary_y_axes():
+    from plotly.subplots import make_subplots
+    layout = make_subplots(specs=[[{"secondary_y": True}]]).to_plotly_json()["layout"]
+    layout.pop("template", None)
+    return layout
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_x_axes(titles, vertical_spacing, title_size):
+    from plotly.subplots import make_subplots
+    layout = make_subplots(rows=len(titles), cols=1, shared_xaxes=True, subplot_titles=titles,
+                           vertical_spacing=vertical_spacing).to_plotly_json()["layout"]
+    layout.pop("template", None)
+    for annotation in layout["annotations"]:
+        annotation["font"] = {"size": title_size}
+    return layout
+
+
+def merge(base, updates):
+    """ Return ``base`` recursively updated with ``updates``, without modifying either. """
+    merged = dict(base)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def secondary_y_layout(layout=None):
+    """ Layout for a ``make_subplots(specs=[[{"secondary_y": True}]])`` figure. """
+    return merge(_secondary_y_axes(), layout or {})
+
+
+def shared_x_layout(titles, layout=None, vertical_spacing=0.02, title_size=12):
+    """ Layout for a one-column ``make_subplots(shared_xaxes=True)`` figure, one row per title. """
+    return merge(_shared_x_axes(tuple(titles), vertical_spacing, title_size), layout or {})
+
+
+def axes(row):
+    """ The (xaxis, yaxis) a trace in subplot ``row`` (1-based) of a one-column figure refers to. """
+    suffix = "" if row == 1 else str(row)
+    return "x" + suffix, "y" + suffix
+
+
+def scatter(**props):
+    return {"type": "scatter", **props}
+
+
+def figure(data, layout=None, template_name=None):
+    """ Assemble a figure dict; ``template_name`` defaults to plotly's default template. """
+    layout = dict(layout or {})
+    layout["template"] = template(template_name)
+    return {"data": list(data), "layout": layout}
+
+
+def use_json_engine(engine):
+    """ Use ``engine`` ("orjson", "json" or "auto") to serialize figures and responses. """
+    pio.json.config.default_engine = engine
+
+
+if os.environ.get("DEXA_JSON_ENGINE"):
+    use_json_engine(os.environ["DEXA_JSON_ENGINE"])
+
+# plotly imports orjson on the first response it serializes; a request on
+# another thread meanwhile finds it half-imported in sys.modules and fails.
+# Import it before the server starts its threads.
+try:
+    import orjson  # noqa: F401
+except ImportError:
+    pass
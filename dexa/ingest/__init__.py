@@ -0,0 +1 @@
+"""PDF report ingestion: turns DEXA scan reports into the CSVs under Data/."""
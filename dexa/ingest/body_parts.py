@@ -0,0 +1,89 @@
+"""Regional body part measurements from DEXA reports, for Data/master_dexa_data.csv."""
+import re
+
+from dexa.ingest import pipeline
+from dexa.ingest.text import block, header, report_pages, scan_header
+
+# Known body parts
+BODY_PARTS = [
+    "Left Arm", "Right Arm", "Left Leg", "Right Leg", "Left Ribs", "Right Ribs",
+    "T Spine", "L Spine", "Pelvis", "SubTotal", "Head", "Total", "Android", "Gynoid"
+]
+
+HEADERS = ["Unique ID", "Patient Name", "Scan Date", "Body Part", "% Fat", "Tissues (g)", "Tissue Area (cm²)",
+           "Fat (g)", "Lean (g)", "BMC (g)", "BMC Area (cm²)", "Total Mass (kg)"]
+
+TABLE = pipeline.Table("master", "Master CSV", HEADERS, ["Unique ID", "Body Part"])
+
+
+def merge_body_part_names(row):
+    """ Merge first two elements if they form a known body part name. """
+    if len(row) > 1:
+        potential_body_part = f"{row[0]} {row[1]}"
+        if potential_body_part in BODY_PARTS:
+            row[0:2] = [potential_body_part]  # Merge the first two elements
+    return row
+
+
+def body_part_rows(text, unique_id, patient_name, scan_date):
+    """ The regional table of one report page as CSV rows. """
+    # Extract regional body part data
+    body_parts_pattern = r"Left Arm.*Gynoid.*"
+    body_parts_match = re.search(body_parts_pattern, text, re.DOTALL)
+
+    data_rows = []
+    if body_parts_match:
+        body_parts_data = body_parts_match.group(0).split("\n")
+        for line in body_parts_data:
+            if not re.search(r"\d", line):
+                continue
+
+            split_line = re.split(r"\s+", line.strip())
+            split_line = merge_body_part_names(split_line)
+
+            if len(split_line) == 9:  # Expected number of columns
+                body_part, *values = split_line
+                data_rows.append([unique_id, patient_name, scan_date, body_part] + values)
+
+    return data_rows
+
+
+def page_rows(lines):
+    """ The regional rows on one report page (as text lines), or [] if the page has no regional table. """
+    table = block(lines, r"Left Arm", r"Gynoid")
+    if table is None:
+        return []
+    return body_part_rows(table, *scan_header(header(lines)))
+
+
+def rows_from_pages(pages):
+    """ The regional rows of a report, from the first of its pages (as text lines) that has the table. """
+    for lines in pages:
+        rows = page_rows(lines)
+        if rows:
+            return rows
+    return []
+
+
+def parse_dexa_text(pdf_path):
+    return rows_from_pages(report_pages(pdf_path))
+
+
+def merge_into_csv(all_data_rows, master_csv_path, manifest=None):
+    """
+    Add parsed rows to ``master_csv_path`` and its columnar copy (see
+    ``dexa.ingest.writer``); without a manifest the whole CSV is merged and rewritten.
+    """
+    pipeline.write_rows(TABLE, master_csv_path, all_data_rows, manifest)
+
+
+def update_master_csv(folder_path, master_csv_path, workers=None, chunksize=None, reprocess=False, batch_size=None):
+    """
+    Parse the PDFs in ``folder_path`` not ingested yet (all of them with
+    ``reprocess``; see ``dexa.ingest.manifest``) on ``workers`` processes
+    (see ``dexa.ingest.parallel``) and add their rows to ``master_csv_path``,
+    ``batch_size`` reports at a time (see ``dexa.ingest.pipeline``).
+    Returns the results of the files that failed to parse.
+    """
+    return pipeline.run(folder_path, parse_dexa_text, [pipeline.Target(TABLE, master_csv_path)],
+                        workers=workers, chunksize=chunksize, reprocess=reprocess, batch_size=batch_size)
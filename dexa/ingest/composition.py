@@ -0,0 +1,101 @@
+"""Composition indices from DEXA reports, for Data/composition_indices.csv."""
+import re
+
+from dexa.ingest import pipeline
+from dexa.ingest.text import block, header, report_pages, scan_header
+
+# Composition Indices Fields
+COMPOSITION_INDICES_FIELDS = {
+    r"Total body weight \(kg\)": "Total Body Weight (kg)",
+    r"Body mass index \(kg/m²\) \(BMI\)": "BMI (kg/m²)",
+    r"Basal metabolic rate \(kcal/Day\)": "Basal Metabolic Rate (kcal/day)",
+    r"Total body % Fat": "Total Body Fat (%)",
+    r"Fat mass/height² \(kg/m²\) \(FMI\)": "Fat Mass Index (FMI)",
+    r"Android/Gynoid % fat ratio": "Android/Gynoid Fat Ratio",
+    r"Trunk/legs % fat ratio": "Trunk/Legs Fat Ratio",
+    r"Trunk/limb fat mass ratio": "Trunk/Limb Fat Mass Ratio",
+    r"Visceral Adipose Tissue Area \(cm²\)": "Visceral Fat Area (cm²)",
+    r"Visceral Adipose Tissue Mass \(g\)": "Visceral Fat Mass (g)",
+    r"Visceral Adipose Tissue Volume \(cm³\)": "Visceral Fat Volume (cm³)",
+    r"Subcutaneous Adipose Tissue Area \(cm²\)": "Subcutaneous Fat Area (cm²)",
+    r"Total body % Lean": "Total Lean Body (%)",
+    r"Lean mass/height² \(kg/m²\)": "Lean Mass Index (kg/m²)",
+    r"Append\. Lean Mass/Height² \(kg/m²\)": "Appendicular Lean Mass Index (kg/m²)",
+    r"Total body % Bone": "Total Bone Mass (%)",
+}
+
+HEADERS = ["Unique ID", "Patient Name", "Scan Date"] + list(COMPOSITION_INDICES_FIELDS.values())
+
+TABLE = pipeline.Table("composition", "Composition Indices CSV", HEADERS, ["Unique ID"])
+
+
+# Any index label: the block runs from the first to the last one, plus the line
+# after it in case the last value wraps
+INDICES_PATTERN = "|".join(COMPOSITION_INDICES_FIELDS)
+
+# Every field and its value in one pattern, so the text is scanned once; group
+# f<i> holds the value of the i-th field
+INDICES_TOKENIZER = re.compile("|".join(
+    rf"{field}\s+(?P<f{i}>[\d.]+)" for i, field in enumerate(COMPOSITION_INDICES_FIELDS)))
+FIELD_GROUPS = {f"f{i}": friendly_name for i, friendly_name in enumerate(COMPOSITION_INDICES_FIELDS.values())}
+
+
+def extract_composition_indices(text, unique_id, patient_name, scan_date):
+    """ Extract composition indices from the Composition Indices section. """
+    indices_data = {"Unique ID": unique_id, "Patient Name": patient_name, "Scan Date": scan_date}
+    indices_data.update(dict.fromkeys(FIELD_GROUPS.values()))
+    # The first value of each field wins, as with one search per field (no
+    # label occurs inside another, so matches never hide each other)
+    found = set()
+    for match in INDICES_TOKENIZER.finditer(text):
+        group = match.lastgroup
+        if group not in found:
+            found.add(group)
+            indices_data[FIELD_GROUPS[group]] = float(match.group(group))
+            if len(found) == len(FIELD_GROUPS):
+                break
+    return indices_data
+
+
+def page_rows(lines):
+    """ The composition indices row of one report page (as text lines), or [] if the page has none. """
+    indices_text = block(lines, INDICES_PATTERN, INDICES_PATTERN, after=1)
+    if indices_text is None:
+        return []
+    return [extract_composition_indices(indices_text, *scan_header(header(lines)))]
+
+
+def rows_from_pages(pages):
+    """ The composition indices row of a report, from the first of its pages (as text lines) that has them. """
+    for lines in pages:
+        rows = page_rows(lines)
+        if rows:
+            return rows
+    return []
+
+
+def parse_dexa_text_for_composition_indices(pdf_path):
+    """ Parse the PDF and extract only the composition indices. """
+    return rows_from_pages(report_pages(pdf_path))
+
+
+def merge_into_csv(all_composition_rows, composition_csv_path, manifest=None):
+    """
+    Add parsed rows to ``composition_csv_path`` and its columnar copy (see
+    ``dexa.ingest.writer``); without a manifest the whole CSV is merged and rewritten.
+    """
+    pipeline.write_rows(TABLE, composition_csv_path, all_composition_rows, manifest)
+
+
+def update_composition_indices_csv(folder_path, composition_csv_path, workers=None, chunksize=None, reprocess=False,
+                                   batch_size=None):
+    """
+    Parse the PDFs in ``folder_path`` not ingested yet (all of them with
+    ``reprocess``; see ``dexa.ingest.manifest``) on ``workers`` processes
+    (see ``dexa.ingest.parallel``) and add their rows to ``composition_csv_path``,
+    ``batch_size`` reports at a time (see ``dexa.ingest.pipeline``).
+    Returns the results of the files that failed to parse.
+    """
+    return pipeline.run(folder_path, parse_dexa_text_for_composition_indices,
+                        [pipeline.Target(TABLE, composition_csv_path)],
+                        workers=workers, chunksize=chunksize, reprocess=reprocess, batch_size=batch_size)
@@ -0,0 +1,133 @@
+"""Which reports have already been ingested into a CSV.
+
+A manifest sits next to its CSV (``master_dexa_data.manifest.json``) and
+records every ingested report by the SHA-256 of its content, with the path,
+mtime and size it was last seen with. ``pending`` then only reads what is new:
+
+* a report whose path, mtime and size match an entry is skipped on a stat;
+* anything else is hashed, and skipped if that content was already ingested
+  (a copied or renamed report);
+* the rest is returned for parsing.
+
+It also keeps the set of Unique IDs in the CSV, which the append-only writer
+uses to tell new scans from re-ingested ones without reading the CSV. The set
+is rebuilt from the CSV's "Unique ID" column whenever the CSV was changed by
+anything but this manifest's own runs.
+"""
+import functools
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".manifest.json"
+
+
+def file_hash(path):
+    """ SHA-256 of the file's content. """
+    return _file_hash(os.path.abspath(path), *_stat_key(os.stat(path)))
+
+
+def _stat_key(stat):
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Memoized on (path, mtime, size) so that several manifests hash each new report once
+@functools.lru_cache(maxsize=65536)
+def _file_hash(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _csv_stamp(csv_path):
+    try:
+        stat = os.stat(csv_path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class Manifest:
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.path = manifest_path(csv_path)
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") != MANIFEST_VERSION:
+            data = {}
+        # sha256 -> {"path", "mtime_ns", "size"}
+        self.files = data.get("files", {})
+        self._by_path = {entry["path"]: digest for digest, entry in self.files.items()}
+        self._unique_ids = set(data["unique_ids"]) \
+            if data.get("csv_stamp") is not None and data.get("csv_stamp") == _csv_stamp(csv_path) else None
+        self._seen = {}
+
+    def pending(self, paths, reprocess=False):
+        """
+        The reports among ``paths`` whose content has not been ingested yet, in
+        the given order; with ``reprocess``, all of them.
+        """
+        pending = []
+        for path in paths:
+            path = os.path.abspath(path)
+            stat = os.stat(path)
+            digest = self._by_path.get(path)
+            entry = self.files.get(digest)
+            if not reprocess and entry is not None \
+                    and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                continue
+            digest = _file_hash(path, *_stat_key(stat))
+            self._seen[path] = (digest, stat)
+            if digest in self.files and not reprocess:
+                # Same content under a new name or mtime: just remember where it is now
+                self.record(path)
+            else:
+                pending.append(path)
+        return pending
+
+    def record(self, path):
+        """ Mark a report returned by ``pending`` as ingested. """
+        path = os.path.abspath(path)
+        digest, stat = self._seen.pop(path)
+        old = self.files.get(digest)
+        if old is not None:
+            self._by_path.pop(old["path"], None)
+        self.files[digest] = {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        self._by_path[path] = digest
+
+    def unique_ids(self):
+        """ The Unique IDs currently in the CSV. """
+        if self._unique_ids is None:
+            if os.path.exists(self.csv_path):
+                ids = pd.read_csv(self.csv_path, usecols=["Unique ID"], dtype=str)["Unique ID"]
+                self._unique_ids = set(ids.dropna())
+            else:
+                self._unique_ids = set()
+        return self._unique_ids
+
+    def add_unique_ids(self, unique_ids):
+        self.unique_ids().update(unique_ids)
+
+    def save(self):
+        """ Write the manifest; call after the CSV has been written. """
+        data = {
+            "version": MANIFEST_VERSION,
+            "csv_stamp": _csv_stamp(self.csv_path),
+            "unique_ids": sorted(self.unique_ids()),
+            "files": self.files,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,77 @@
+"""Parse many PDF reports on a pool of worker processes.
+
+pdfplumber is pure Python and CPU-bound, so a backfill of thousands of reports
+scales with processes, not threads. ``parse_files`` hands the files to a
+``ProcessPoolExecutor`` in chunks and yields one ``ParseResult`` per file in
+input order, so the output never depends on which worker finished first. A file
+whose parser raises is reported in its result instead of aborting the batch.
+
+The worker count is the ``workers`` argument, else ``DEXA_INGEST_WORKERS``,
+else one per CPU. With one worker the files are parsed in-process and
+results are produced only as they are consumed.
+"""
+import concurrent.futures
+import functools
+import os
+from dataclasses import dataclass
+
+WORKERS = int(os.environ.get("DEXA_INGEST_WORKERS", "0")) or os.cpu_count() or 1
+
+
+@dataclass(frozen=True)
+class ParseResult:
+    path: str
+    rows: list
+    error: str = None
+
+
+def list_pdfs(folder_path):
+    """ The PDF files in ``folder_path``, sorted so every run sees them in the same order. """
+    return sorted(os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(".pdf"))
+
+
+def _parse_one(parse, path):
+    try:
+        return ParseResult(path, parse(path) or [])
+    except Exception as e:
+        return ParseResult(path, [], f"{type(e).__name__}: {e}")
+
+
+def default_chunksize(n_files, workers):
+    # A few chunks per worker keeps them all busy without one round trip per file
+    return max(1, n_files // (workers * 4))
+
+
+def parse_files(parse, paths, workers=None, chunksize=None, window=None):
+    """
+    Yield ``ParseResult``s for ``parse(path)`` over ``paths``, in order. ``parse``
+    must be picklable. With ``window``, at most that many files are handed to the
+    workers at a time, so results never pile up ahead of a slower consumer.
+    """
+    paths = list(paths)
+    workers = max(1, min(workers or WORKERS, len(paths)))
+    task = functools.partial(_parse_one, parse)
+    if workers == 1:
+        yield from map(task, paths)
+        return
+    window = window or len(paths)
+    chunksize = chunksize or default_chunksize(min(window, len(paths)), workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(paths), window):
+            yield from executor.map(task, paths[start:start + window], chunksize=chunksize)
+
+
+def batches(results, batch_size):
+    """ Print progress over ``results`` and yield them in lists of at most ``batch_size``. """
+    batch = []
+    for result in results:
+        if result.error:
+            print(f"Skipping file {result.path}: {result.error}")
+        else:
+            print(f"Processed file: {result.path}")
+        batch.append(result)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
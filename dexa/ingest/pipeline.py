@@ -0,0 +1,144 @@
+"""Stream parsed reports into the table CSVs a batch at a time.
+
+Ingestion is a chain of generators: PDF -> page text (``text.report_pages``)
+-> rows (each table's page parser) -> a batch of rows framed with the table's
+columns -> ``writer.TableWriter``. Reports are parsed only as fast as batches
+are written (``parallel.parse_files`` hands at most one batch of files to the
+workers at a time) and a batch is written before the next one is parsed, so
+memory holds one batch of rows however large the archive is. The batch size
+is the ``batch_size`` argument, else ``DEXA_INGEST_BATCH_SIZE`` reports.
+
+Each run writes under ``catalog.ingesting``, so the dashboard shows its rows
+together, and ends by publishing a new data version
+(``catalog.publish_data_version``). If a SQLite database sits next to
+the CSVs (``python -m dexa migrate``, see ``dexa.database``), every batch is
+also upserted into it, in one transaction committed with the publication.
+"""
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+
+from dexa import catalog, database
+from dexa.ingest import parallel
+from dexa.ingest.manifest import Manifest
+from dexa.ingest.writer import TableWriter
+
+BATCH_SIZE = int(os.environ.get("DEXA_INGEST_BATCH_SIZE", "200"))
+
+
+@dataclass(frozen=True)
+class Table:
+    # The catalog source (and database table) the rows belong to
+    name: str
+    label: str
+    headers: list
+    key: list
+
+    def frame(self, rows):
+        """ ``rows`` as a frame with this table's columns; raises if a row has the wrong number of fields. """
+        return pd.DataFrame(rows, columns=self.headers)
+
+
+@dataclass(frozen=True)
+class Target:
+    table: Table
+    csv_path: str
+    # This table's rows from what the parser returned for one report, if it returned more than that
+    rows: callable = None
+
+
+def _report(table, rows, rewritten):
+    if rewritten:
+        print(f"{table.label} updated successfully! Total records: {rows}")
+    else:
+        print(f"{table.label} updated successfully! Appended records: {rows}")
+
+
+def _databases(csv_paths):
+    """ A ``database.Writer`` on each database that exists next to ``csv_paths``, by path. """
+    paths = {database.path_for(csv_path) for csv_path in csv_paths}
+    return {path: database.Writer(path) for path in sorted(paths) if os.path.exists(path)}
+
+
+def _write(table, csv_path, frame, table_writer, databases):
+    table_writer.write(frame)
+    writer = databases.get(database.path_for(csv_path))
+    if writer is not None:
+        writer.upsert(table.name, catalog.parse_frame(frame))
+
+
+def write_rows(table, csv_path, rows, manifest=None):
+    """
+    Add ``rows`` to ``csv_path`` and its columnar copy (see ``dexa.ingest.writer``);
+    without a manifest the whole CSV is merged and rewritten.
+    """
+    with catalog.ingesting([csv_path]):
+        table_writer = TableWriter(csv_path, table.key, manifest)
+        databases = _databases([csv_path])
+        try:
+            _write(table, csv_path, table.frame(rows), table_writer, databases)
+            _report(table, *table_writer.close())
+            for writer in databases.values():
+                writer.commit()
+        finally:
+            for writer in databases.values():
+                writer.close()
+        catalog.publish_data_version([csv_path])
+
+
+def run(folder_path, parse, targets, workers=None, chunksize=None, reprocess=False, batch_size=None, paths=None):
+    """
+    Parse the PDFs in ``folder_path`` (only ``paths``, if given) that any
+    target's CSV has not ingested yet (all of them with ``reprocess``; see
+    ``dexa.ingest.manifest``) once, on ``workers`` processes (see
+    ``dexa.ingest.parallel``), and add their rows to each target
+    ``batch_size`` reports at a time.
+    Returns the results of the files that failed to parse.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    manifests = [Manifest(target.csv_path) for target in targets]
+    all_files = parallel.list_pdfs(folder_path) if paths is None else sorted(paths)
+    pending = [set(manifest.pending(all_files, reprocess=reprocess)) for manifest in manifests]
+    pdf_files = [path for path in map(os.path.abspath, all_files) if any(path in paths for paths in pending)]
+    print(f"Found {len(all_files)} PDF files in folder: {folder_path} ({len(pdf_files)} new or changed)")
+
+    with catalog.ingesting([target.csv_path for target in targets]):
+        failed = _ingest(parse, targets, manifests, pending, pdf_files, workers, chunksize, batch_size)
+        version = catalog.publish_data_version([target.csv_path for target in targets])
+    print(f"Published data version {version}")
+    return failed
+
+
+def _ingest(parse, targets, manifests, pending, pdf_files, workers, chunksize, batch_size):
+    writers = [TableWriter(target.csv_path, target.table.key, manifest)
+               for target, manifest in zip(targets, manifests)]
+    databases = _databases([target.csv_path for target in targets])
+    failed = []
+    try:
+        results = parallel.parse_files(parse, pdf_files, workers=workers, chunksize=chunksize, window=batch_size)
+        for batch in parallel.batches(results, batch_size):
+            failed.extend(result for result in batch if result.error)
+            # A report may be new to one CSV only (e.g. ingested earlier by a single-table script)
+            for target, manifest, paths, table_writer in zip(targets, manifests, pending, writers):
+                parsed = [result for result in batch if not result.error and result.path in paths]
+                select = target.rows or (lambda rows: rows)
+                frame = target.table.frame([row for result in parsed for row in select(result.rows)])
+                _write(target.table, target.csv_path, frame, table_writer, databases)
+                # Failed files stay pending and are retried on the next run
+                for result in parsed:
+                    manifest.record(result.path)
+
+        if failed:
+            print(f"{len(failed)} files could not be parsed and were skipped")
+        for target, table_writer in zip(targets, writers):
+            _report(target.table, *table_writer.close())
+        # Before the manifests: reports must not be marked ingested unless the database has them
+        for writer in databases.values():
+            writer.commit()
+        for manifest in manifests:
+            manifest.save()
+    finally:
+        for writer in databases.values():
+            writer.close()
+    return failed
@@ -0,0 +1,47 @@
+"""Both tables from one pass over the reports.
+
+``parse_report`` opens each PDF once, extracts each page's text once and
+feeds the same lines to the regional (``body_parts``) and composition
+(``composition``) parsers, so ingesting into both CSVs costs one read and
+one text extraction per report instead of two. Each CSV keeps its own
+manifest, so only reports new to at least one of them are parsed.
+"""
+import operator
+from dataclasses import dataclass
+
+from dexa.ingest import body_parts, composition, pipeline
+from dexa.ingest.text import report_pages
+
+
+@dataclass(frozen=True)
+class ReportRows:
+    body_parts: list
+    composition: list
+
+
+def parse_report(pdf_path):
+    """ The regional and composition rows of one report. """
+    regional, indices = [], []
+    for lines in report_pages(pdf_path):
+        regional = regional or body_parts.page_rows(lines)
+        indices = indices or composition.page_rows(lines)
+        if regional and indices:
+            # Pages after both blocks are never laid out
+            break
+    return ReportRows(regional, indices)
+
+
+def update_csvs(folder_path, master_csv_path, composition_csv_path, workers=None, chunksize=None, reprocess=False,
+                batch_size=None, paths=None):
+    """
+    Parse the PDFs in ``folder_path`` (only ``paths``, if given) that either
+    CSV has not ingested yet (all of them with ``reprocess``) once, on
+    ``workers`` processes (see ``dexa.ingest.parallel``), and add their rows
+    to both CSVs ``batch_size`` reports at a time (see ``dexa.ingest.pipeline``).
+    Returns the results of the files that failed to parse.
+    """
+    targets = [pipeline.Target(body_parts.TABLE, master_csv_path, operator.attrgetter("body_parts")),
+               pipeline.Target(composition.TABLE, composition_csv_path, operator.attrgetter("composition"))]
+    return pipeline.run(folder_path, parse_report, targets,
+                        workers=workers, chunksize=chunksize, reprocess=reprocess, batch_size=batch_size,
+                        paths=paths)
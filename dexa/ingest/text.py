@@ -0,0 +1,113 @@
+"""Text of DEXA report pages and the scan header fields every table needs.
+
+Reports are read page by page as lists of text lines. ``page_lines`` takes
+the characters straight from pdfminer's layout of the page instead of going
+through pdfplumber's per-object dicts (most of the cost of
+``page.extract_text()``), and joins them into the same lines. Parsers then
+look for their block with ``block`` and only read those lines; pages are
+laid out as they are consumed, so a parser that has found its block never
+lays out the pages after it. Extracted lines are kept in ``text_cache``.
+"""
+import re
+
+import pandas as pd
+import pdfplumber
+from pdfminer.layout import LTChar, LTContainer
+from pdfplumber.utils import extract_text
+
+from dexa.ingest import text_cache
+from dexa.ingest.manifest import file_hash
+
+# The lines scan_header reads, and the line after each in case a field wraps
+HEADER_PATTERN = re.compile(r"Patient :|Scan Date :")
+
+
+def _chars(objects):
+    for obj in objects:
+        if isinstance(obj, LTChar):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from _chars(obj)
+
+
+def page_lines(page):
+    """ The text lines of a pdfplumber page, as ``page.extract_text()`` would return them. """
+    height, doctop = page.height, page.initial_doctop
+    # The only char attributes extract_text reads, computed as pdfplumber does
+    chars = [{"text": char.get_text(), "x0": char.x0, "x1": char.x1, "doctop": doctop + (height - char.y1)}
+             for char in _chars(page.layout)]
+    return extract_text(chars).split("\n") if chars else []
+
+
+def _extract_pages(pdf_path, start=0):
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages[start:]:
+            yield page_lines(page)
+
+
+def report_pages(pdf_path):
+    """
+    Yield the text lines of each page of ``pdf_path``. Pages in the text cache
+    are read from it, the rest are only laid out as they are consumed and then
+    added to the cache.
+    """
+    if not text_cache.CACHE_DIR:
+        yield from _extract_pages(pdf_path)
+        return
+
+    digest = file_hash(pdf_path)
+    pages, cached_complete = text_cache.load(digest)
+    n_cached, complete = len(pages), cached_complete
+    try:
+        yield from pages[:n_cached]
+        if not complete:
+            for lines in _extract_pages(pdf_path, n_cached):
+                pages.append(lines)
+                yield lines
+            complete = True
+    finally:
+        # Also when the caller stops early: keep whatever was laid out
+        if len(pages) > n_cached or complete != cached_complete:
+            text_cache.save(digest, pages, complete)
+
+
+def block(lines, start, end, after=0):
+    """
+    The text from the first line matching ``start`` to the last line matching
+    ``end`` (both regexes) and ``after`` more lines, or None if no line matches ``start``.
+    """
+    first = next((i for i, line in enumerate(lines) if re.search(start, line)), None)
+    if first is None:
+        return None
+    last = max((i for i, line in enumerate(lines) if i >= first and re.search(end, line)), default=first)
+    return "\n".join(lines[first:last + after + 1])
+
+
+def header(lines):
+    """ The lines of a page that ``scan_header`` reads. """
+    selected = set()
+    for i, line in enumerate(lines):
+        if HEADER_PATTERN.search(line):
+            selected.update((i, i + 1))
+    return "\n".join(lines[i] for i in sorted(selected) if i < len(lines))
+
+
+def scan_header(text):
+    """ (unique_id, patient_name, scan_date) of the scan a report page belongs to. """
+    # Extract scan date for unique ID creation
+    scan_date_match = re.search(r"Scan Date :([\d/]+)", text)
+    scan_date = scan_date_match.group(1) if scan_date_match else "01/01/2000"  # Default date if missing
+
+    # Convert scan date to consistent format
+    try:
+        scan_date = pd.to_datetime(scan_date, format="%d/%m/%Y").strftime("%d-%m-%Y")
+    except ValueError:
+        scan_date = "unknown_date"
+
+    # Extract patient name
+    patient_match = re.search(r"Patient :(.*?)\s+Height", text)
+    patient_name = patient_match.group(1).strip().replace(" ", "_") if patient_match else "unknown_patient"
+
+    # Create Unique ID for the scan
+    unique_id = f"{patient_name}_{scan_date}"
+    return unique_id, patient_name, scan_date
@@ -0,0 +1,57 @@
+"""Content-addressed cache of the text extracted from report pages.
+
+Text extraction is most of the cost of parsing a report, and it does not
+depend on the parsing rules (``BODY_PARTS``, ``COMPOSITION_INDICES_FIELDS``),
+so ``text.report_pages`` keeps the lines of every page it lays out here.
+Re-parsing an archive after a rule change (``reprocess=True``) then only
+runs the regex stage.
+
+Entries are keyed by the SHA-256 of the PDF, under a directory named after
+the pdfplumber and pdfminer versions and the line format, so upgrading
+either library starts a new cache instead of serving stale text; delete old
+version directories to reclaim the space. Each entry is a gzipped JSON file
+holding the pages extracted so far and whether that is all of them: parsers
+stop at the page holding their table, and a later run that needs further
+pages extracts only those.
+
+Configuration (environment variables):
+    DEXA_TEXT_CACHE_DIR  cache directory (default: .cache/report_text/); empty disables the cache
+"""
+import gzip
+import json
+import os
+
+import pdfminer
+import pdfplumber
+
+from dexa import catalog
+
+# Bump when text.page_lines changes what it returns
+FORMAT_VERSION = 1
+
+CACHE_DIR = os.environ.get("DEXA_TEXT_CACHE_DIR", os.path.join(catalog.CACHE_DIR, "report_text")) or None
+VERSION_KEY = f"pdfplumber-{pdfplumber.__version__}_pdfminer-{pdfminer.__version__}_lines-{FORMAT_VERSION}"
+
+
+def entry_path(digest):
+    return os.path.join(CACHE_DIR, VERSION_KEY, digest[:2], f"{digest}.json.gz")
+
+
+def load(digest):
+    """ (pages, complete) cached for the PDF with content hash ``digest``; ([], False) on a miss. """
+    try:
+        with gzip.open(entry_path(digest), "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return [], False
+    return entry["pages"], entry["complete"]
+
+
+def save(digest, pages, complete):
+    """ Store the lines of the first ``len(pages)`` pages; ``complete`` if that is every page. """
+    path = entry_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"pages": pages, "complete": complete}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
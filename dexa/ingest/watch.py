@@ -0,0 +1,96 @@
+"""Ingest reports as they land in a drop folder.
+
+``watch`` polls the folder every ``interval`` seconds; a poll is one
+``scandir`` of the folder, so it works the same on local disks and network
+shares where inotify sees nothing. A report is ingested once its size and
+mtime have not changed for ``debounce`` seconds, so a PDF still being copied in
+is never parsed half-written. Ready reports go through
+``reports.update_csvs`` in micro-batches of at most ``batch_size``, and each
+micro-batch ends by publishing a new data version that the dashboard's watcher
+picks up on its next poll (see ``dexa.store``). A report that fails to parse
+is not retried until it changes (or the watcher restarts).
+
+Configuration (environment variables):
+    DEXA_WATCH_INTERVAL  seconds between polls of the drop folder (default 1)
+    DEXA_WATCH_DEBOUNCE  seconds a report must be unchanged before it is ingested (default 2)
+"""
+import os
+import threading
+import time
+
+from dexa.ingest import pipeline
+from dexa.ingest.reports import update_csvs
+
+WATCH_INTERVAL = float(os.environ.get("DEXA_WATCH_INTERVAL", "1"))
+DEBOUNCE = float(os.environ.get("DEXA_WATCH_DEBOUNCE", "2"))
+
+
+def _scan(folder_path):
+    """ {path: (size, mtime_ns)} of the PDFs in ``folder_path``. """
+    files = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name.endswith(".pdf") and entry.is_file():
+                stat = entry.stat()
+                files[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class DropFolder:
+    def __init__(self, folder_path, debounce=DEBOUNCE):
+        self.folder_path = folder_path
+        self.debounce = debounce
+        # path -> (size, mtime_ns) and when the watcher first saw it that way
+        self._settling = {}
+        # path -> (size, mtime_ns) it was last ingested (or failed to parse) with
+        self._handled = {}
+
+    def ready(self):
+        """ The reports that changed since they were last handled and have been unchanged for ``debounce`` seconds. """
+        now = time.monotonic()
+        files = _scan(self.folder_path)
+        ready = []
+        for path, signature in files.items():
+            if self._handled.get(path) == signature:
+                continue
+            settling = self._settling.get(path)
+            if settling is None or settling[0] != signature:
+                # Reports already there when the watcher starts have long been unchanged
+                age = time.time() - signature[1] / 1e9
+                self._settling[path] = (signature, now - age if settling is None else now)
+            if now - self._settling[path][1] >= self.debounce:
+                ready.append(path)
+        # Forget reports that were removed
+        for state in (self._settling, self._handled):
+            for path in state.keys() - files.keys():
+                del state[path]
+        return sorted(ready)
+
+    def handled(self, paths):
+        """ Mark ``paths`` (from ``ready``) as ingested or failed, until they change. """
+        for path in paths:
+            self._handled[path] = self._settling.pop(path)[0]
+
+
+def watch(folder_path, master_csv_path, composition_csv_path, interval=WATCH_INTERVAL, debounce=DEBOUNCE,
+          workers=None, batch_size=None, stop=None):
+    """
+    Ingest the reports in ``folder_path`` into both CSVs as they arrive, until
+    ``stop`` (a ``threading.Event``) is set; reports already ingested are skipped.
+    """
+    drop_folder = DropFolder(folder_path, debounce)
+    batch_size = batch_size or pipeline.BATCH_SIZE
+    stop = stop or threading.Event()
+    print(f"Watching {folder_path} for new reports (every {interval:g}s, settled after {debounce:g}s)")
+    while not stop.is_set():
+        try:
+            ready = drop_folder.ready()
+            for start in range(0, len(ready), batch_size):
+                paths = ready[start:start + batch_size]
+                update_csvs(folder_path, master_csv_path, composition_csv_path,
+                            workers=workers, batch_size=batch_size, paths=paths)
+                drop_folder.handled(paths)
+        except Exception as e:
+            # Reports not marked handled are tried again on the next poll
+            print(f"Error ingesting from {folder_path}: {e}")
+        stop.wait(interval)
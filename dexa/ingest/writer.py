@@ -0,0 +1,165 @@
+"""Add parsed rows to a table CSV and its columnar copy, one batch at a time.
+
+A ``TableWriter`` never holds more than the batch it is given. New scans are
+appended: each batch is written to the end of the CSV, so the CSV is neither
+read nor rewritten and the dashboard's watcher picks the rows up as they
+arrive. When a scan is ingested again (its Unique ID is already in the CSV),
+the rows bring columns the CSV lacks, or there is no manifest to tell, the
+batch is staged in a spill file instead and ``close`` merges it into the CSV
+in one streamed pass, the staged rows winning.
+
+``close`` then extends the columnar copy (``dexa.columnar.extend``) with the
+appended rows, read back from the CSV in chunks, or rebuilds it the same way
+from the whole CSV after a merge or when it was already out of date.
+"""
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+from dexa import catalog, columnar
+
+# Rows per chunk when the CSV or the spill file is read back
+CHUNK_ROWS = 50_000
+
+
+def _format_dates(frame):
+    # Ensure consistent date formatting (older rows were written d/mm/YYYY)
+    frame["Scan Date"] = catalog.parse_scan_dates(frame["Scan Date"]).dt.strftime(catalog.DATE_FORMATS[0])
+    return frame
+
+
+def csv_columns(csv_path):
+    """ The header of ``csv_path``, or None if it does not exist or is empty. """
+    try:
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
+    except FileNotFoundError:
+        return None
+
+
+def _append_text(path, data):
+    with open(path, "ab+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write(data.encode("utf-8"))
+
+
+def _read_chunks(path, offset=0, **kwargs):
+    """ Frames of ``path`` from byte ``offset`` on, ``CHUNK_ROWS`` rows at a time; values stay as written. """
+    with open(path, newline="", encoding="utf-8") as f:
+        f.seek(offset)
+        yield from pd.read_csv(f, dtype=str, keep_default_na=False, na_values=[""], chunksize=CHUNK_ROWS, **kwargs)
+
+
+class TableWriter:
+    def __init__(self, csv_path, key, manifest=None):
+        self.csv_path = csv_path
+        self.key = key
+        self.manifest = manifest
+        self.columns = csv_columns(csv_path)
+        self.store_path = columnar.store_path(csv_path)
+        self.store_fresh = self.columns is not None and columnar.is_fresh(self.store_path, csv_path)
+        # This run's appends start here
+        self.offset = os.path.getsize(csv_path) if self.columns is not None else 0
+        self.staged_path = f"{csv_path}.staged.{os.getpid()}.tmp"
+        self.staged_columns = None
+        self.appended = 0
+
+    def write(self, new_data):
+        """ Add a batch of parsed rows. """
+        new_data = _format_dates(new_data).drop_duplicates(subset=self.key, keep="last")
+        if new_data.empty:
+            return
+        if self.manifest is None:
+            self._stage(new_data)
+            return
+
+        if self.columns is None:
+            # A new CSV: start it with the header the merge would have written
+            _append_text(self.csv_path, new_data.head(0).to_csv(index=False))
+            self.columns = list(new_data.columns)
+            self.offset = os.path.getsize(self.csv_path)
+        new_ids = set(new_data["Unique ID"].dropna())
+        if set(new_data.columns) <= set(self.columns) and new_ids.isdisjoint(self.manifest.unique_ids()):
+            _append_text(self.csv_path, new_data.reindex(columns=self.columns).to_csv(header=False, index=False))
+            self.appended += len(new_data)
+        else:
+            self._stage(new_data)
+        self.manifest.add_unique_ids(new_ids)
+
+    def _stage(self, new_data):
+        if self.staged_columns is None:
+            self.staged_columns = list(new_data.columns)
+            _append_text(self.staged_path, new_data.head(0).to_csv(index=False))
+        _append_text(self.staged_path, new_data.reindex(columns=self.staged_columns).to_csv(header=False, index=False))
+
+    def close(self):
+        """ Merge staged rows and bring the columnar copy up to date. Returns (rows written, whether the CSV was rewritten). """
+        if self.staged_columns is not None:
+            rows = self._merge_staged()
+            columnar.extend(self._rebuild_path(), lambda: self._typed_chunks())
+            return rows, True
+        if self.columns is None:
+            return 0, False
+        if not self.store_fresh:
+            columnar.extend(self._rebuild_path(), lambda: self._typed_chunks())
+        elif self.appended:
+            columnar.extend(self.store_path, lambda: self._typed_chunks(self.offset))
+        return self.appended, False
+
+    def _rebuild_path(self):
+        # A rebuilt store replaces whatever was there
+        if columnar.read_meta(self.store_path) is not None:
+            os.remove(os.path.join(self.store_path, columnar.META_FILE))
+        return self.store_path
+
+    def _typed_chunks(self, offset=0):
+        """ The CSV from byte ``offset`` on, parsed as the dashboard would, ``CHUNK_ROWS`` rows at a time. """
+        kwargs = {"header": None, "names": self.columns} if offset else {}
+        with open(self.csv_path, newline="", encoding="utf-8") as f:
+            f.seek(offset)
+            for chunk in catalog.read_csv(f, chunksize=CHUNK_ROWS, **kwargs):
+                yield catalog.parse_frame(chunk)
+
+    def _merge_staged(self):
+        """ Rewrite the CSV with the staged rows replacing the ones they share a key with; returns the row count. """
+        # One 64-bit hash per staged row rather than the keys themselves, so a
+        # reprocess of the whole archive holds 8 bytes a row, not a tuple
+        staged = np.concatenate([self._hashes(chunk) for chunk in _read_chunks(self.staged_path)])
+        # Last staged occurrence of each key (a scan can be staged by more than one batch)
+        staged_keys, from_end = np.unique(staged[::-1], return_index=True)
+        last = np.zeros(len(staged), dtype=bool)
+        last[len(staged) - 1 - from_end] = True
+        del staged, from_end
+        columns = (self.columns or []) + [c for c in self.staged_columns if c not in (self.columns or [])]
+
+        tmp_path = f"{self.csv_path}.{os.getpid()}.tmp"
+        rows = 0
+        with open(tmp_path, "w", newline="", encoding="utf-8") as out:
+            out.write(pd.DataFrame(columns=columns).to_csv(index=False))
+            if self.columns is not None:
+                for chunk in _read_chunks(self.csv_path):
+                    chunk = _format_dates(chunk)
+                    chunk = chunk[~np.isin(self._hashes(chunk), staged_keys)]
+                    out.write(chunk.reindex(columns=columns).to_csv(header=False, index=False))
+                    rows += len(chunk)
+            start = 0
+            for chunk in _read_chunks(self.staged_path):
+                keep = last[start:start + len(chunk)]
+                start += len(chunk)
+                chunk = chunk[keep]
+                out.write(chunk.reindex(columns=columns).to_csv(header=False, index=False))
+                rows += len(chunk)
+        os.replace(tmp_path, self.csv_path)
+        os.remove(self.staged_path)
+        self.columns, self.staged_columns = columns, None
+        return rows
+
+    def _hashes(self, chunk):
+        # Missing key values match each other, as in drop_duplicates
+        return pd.util.hash_pandas_object(chunk[self.key].fillna(""), index=False).to_numpy()
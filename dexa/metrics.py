@@ -0,0 +1,238 @@
+"""Callback and data timings, served in the Prometheus text format at ``/metrics``.
+
+``instrument(app)`` times every ``/_dash-update-component`` request, labelled
+with the callback that handled it (e.g. ``pages.overview.update_page_content``),
+and splits its wall time into phases:
+
+* ``slice``: the patient index lookups (``PatientIndex`` / ``PatientQuery``),
+  which mark themselves with ``phase("slice")``;
+* ``serialize``: Dash's JSON encoding of the response;
+* ``build``: everything else, i.e. building the figures (or finding them in
+  the figure cache) plus Dash's dispatch.
+
+It also records the response size and status, and the data store reports how
+long each source load, derived table build and reload took. One JSON line per
+callback is printed for callbacks slower than ``DEXA_CALLBACK_LOG_MS``:
+
+    {"callback": "pages.overview.update_page_content", "status": 200, "ms": 41.2,
+     "slice_ms": 1.3, "build_ms": 35.0, "serialize_ms": 4.9, "bytes": 48211}
+
+The numbers live in the process: under gunicorn each worker serves its own
+(the load timings of a preloaded app are inherited from the master), so scrape
+the workers individually or alert on quantiles rather than summed counters.
+
+Configuration (environment variables):
+    DEXA_CALLBACK_LOG_MS  log callbacks taking at least this many ms
+                          (default 0: every callback; "off" disables the log)
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+
+from dexa import figure_cache
+
+_log_setting = os.environ.get("DEXA_CALLBACK_LOG_MS", "0")
+CALLBACK_LOG_MS = None if _log_setting.lower() == "off" else float(_log_setting)
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 2.5e5, 1e6, 2.5e6, 1e7)
+
+PHASES = ("slice", "build", "serialize")
+
+_local = threading.local()
+
+
+class Metric:
+    def __init__(self, name, kind, help, labels=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then the sum and the total count
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted((key, list(value) if isinstance(value, list) else value)
+                            for key, value in self._values.items())
+        for key, value in values:
+            pairs = [f'{label}="{_escape(v)}"' for label, v in zip(self.labels, key)]
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{_labels(pairs)} {_number(value)}")
+                continue
+            bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, value[:-2] + [value[-1]]):
+                lines.append(f"{self.name}_bucket{_labels(pairs + ['le=' + json.dumps(bound)])} {count}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_number(value[-2])}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {value[-1]}")
+        return lines
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+CALLBACK_SECONDS = Metric("dexa_callback_duration_seconds", "histogram",
+                          "Wall time of each callback request.", ("callback",), SECONDS_BUCKETS)
+PHASE_SECONDS = Metric("dexa_callback_phase_seconds", "histogram",
+                       "Wall time of each callback request by phase (slice, build, serialize).",
+                       ("callback", "phase"), SECONDS_BUCKETS)
+RESPONSE_BYTES = Metric("dexa_callback_response_bytes", "histogram",
+                        "Size of each callback response.", ("callback",), BYTES_BUCKETS)
+CALLBACK_REQUESTS = Metric("dexa_callback_requests_total", "counter",
+                           "Callback requests by HTTP status.", ("callback", "status"))
+LOAD_SECONDS = Metric("dexa_data_load_seconds", "histogram",
+                      "Time to load each source table.", ("source",), SECONDS_BUCKETS)
+DERIVED_SECONDS = Metric("dexa_derived_build_seconds", "histogram",
+                         "Time to build (or incrementally update) each derived table.",
+                         ("table", "mode"), SECONDS_BUCKETS)
+RELOAD_SECONDS = Metric("dexa_data_reload_seconds", "histogram",
+                        "Time to publish a new data snapshot after a change.", (), SECONDS_BUCKETS)
+DATA_VERSION = Metric("dexa_data_version", "gauge", "Version of the current data snapshot.")
+DATA_ROWS = Metric("dexa_data_rows", "gauge", "Rows in each loaded source table.", ("table",))
+CACHE_EVENTS = Metric("dexa_figure_cache_events_total", "counter",
+                      "Figure cache lookups and maintenance by outcome.", ("event",))
+CACHE_ENTRIES = Metric("dexa_figure_cache_entries", "gauge", "Entries in the in-memory figure cache.")
+
+METRICS = [CALLBACK_SECONDS, PHASE_SECONDS, RESPONSE_BYTES, CALLBACK_REQUESTS, LOAD_SECONDS, DERIVED_SECONDS,
+           RELOAD_SECONDS, DATA_VERSION, DATA_ROWS, CACHE_EVENTS, CACHE_ENTRIES]
+
+
+@contextmanager
+def phase(name):
+    """ Add the time spent in the block to phase ``name`` of the callback request running on this thread. """
+    phases = getattr(_local, "phases", None)
+    if phases is None or name in _local.active:
+        # Not in a callback, or nested in the same phase (already being timed)
+        yield
+        return
+    _local.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+        _local.active.discard(name)
+
+
+def timed(name):
+    """ Decorator form of ``phase(name)``. """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timer(metric, **labels):
+    """ Observe the time spent in the block in the histogram ``metric``. """
+    start = time.perf_counter()
+    yield
+    metric.observe(time.perf_counter() - start, **labels)
+
+
+def callback_name(app, output):
+    """ ``module.function`` of the callback registered for ``output``. """
+    entry = app.callback_map.get(output)
+    if entry is None:
+        return "unknown"
+    func = entry["callback"]
+    return f"{func.__module__}.{func.__name__}"
+
+
+def render():
+    """ Every metric in the Prometheus text exposition format. """
+    stats = figure_cache.stats()
+    for event in ("hits", "disk_hits", "misses", "evictions", "expired", "errors"):
+        CACHE_EVENTS.set(stats[event], event=event)
+    CACHE_ENTRIES.set(stats["entries"])
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def instrument(app):
+    """ Time every callback request of ``app`` and serve ``/metrics`` on its Flask server. """
+    from dash import _callback
+
+    server = app.server
+    update_path = app.config.requests_pathname_prefix + "_dash-update-component"
+
+    # Dash has no hook around its response encoding; time the function it calls
+    to_json = _callback.to_json
+    _callback.to_json = timed("serialize")(to_json)
+
+    @server.before_request
+    def start_callback():
+        if flask.request.path == update_path:
+            _local.phases = {}
+            _local.active = set()
+            _local.start = time.perf_counter()
+
+    @server.after_request
+    def finish_callback(response):
+        phases = getattr(_local, "phases", None)
+        if phases is None:
+            return response
+        _local.phases = None
+        elapsed = time.perf_counter() - _local.start
+        body = flask.request.get_json(silent=True) or {}
+        name = callback_name(app, body.get("output"))
+        phases["build"] = max(0.0, elapsed - phases.get("slice", 0.0) - phases.get("serialize", 0.0))
+        size = response.calculate_content_length() or 0
+
+        CALLBACK_SECONDS.observe(elapsed, callback=name)
+        for phase_name in PHASES:
+            PHASE_SECONDS.observe(phases.get(phase_name, 0.0), callback=name, phase=phase_name)
+        RESPONSE_BYTES.observe(size, callback=name)
+        CALLBACK_REQUESTS.inc(callback=name, status=response.status_code)
+        if CALLBACK_LOG_MS is not None and elapsed * 1000 >= CALLBACK_LOG_MS:
+            print(json.dumps({"callback": name, "status": response.status_code, "ms": round(elapsed * 1000, 1),
+                              **{f"{p}_ms": round(phases.get(p, 0.0) * 1000, 1) for p in PHASES},
+                              "bytes": size}), flush=True)
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return flask.Response(render(), mimetype="text/plain; version=0.0.4")
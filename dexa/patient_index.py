@@ -0,0 +1,76 @@
+"""Per-patient row index so callbacks never mask the whole table.
+
+``PatientIndex`` sorts a table once by (patient, scan date) and records where
+each patient's rows start and stop, so ``patient(name)`` is a dict lookup plus
+a contiguous, date-sorted slice. With a ``part_column`` it also keeps the row
+positions of every (patient, body part) pair, so ``part(name, part)`` costs
+O(rows for that part) instead of O(rows in the clinic).
+
+The master and composition indexes are registered with the data store and
+rebuilt whenever the data is reloaded. In SQLite mode they are
+``database.PatientQuery`` objects with the same methods, which query the
+selected patient's rows instead of slicing a loaded table:
+
+    snapshot = store.snapshot()
+    rows = snapshot.derived["master_index"].part(patient, "Total")
+"""
+import numpy as np
+import pandas as pd
+
+from dexa import catalog, database, metrics, store
+
+
+class PatientIndex:
+    def __init__(self, frame, part_column=None, patient_column="Patient Name"):
+        self.frame = frame.sort_values([patient_column, "Scan Date"], kind="mergesort").reset_index(drop=True)
+        self.part_column = part_column
+
+        patients = self.frame[patient_column]
+        codes = patients.cat.codes.to_numpy() if isinstance(patients.dtype, pd.CategoricalDtype) \
+            else pd.factorize(patients)[0]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(codes)]
+        names = patients.iloc[starts] if len(starts) else []
+        self._slices = {name: (start, stop) for name, start, stop in zip(names, starts, stops)}
+
+        self._parts = {}
+        if part_column is not None:
+            self._parts = self.frame.groupby([patient_column, part_column], observed=True, sort=False).indices
+
+    def patients(self):
+        """ All patient names, sorted. """
+        return sorted(self._slices)
+
+    def __contains__(self, patient):
+        return patient in self._slices
+
+    @metrics.timed("slice")
+    def patient(self, patient):
+        """ The patient's rows in scan date order (empty if unknown). """
+        start, stop = self._slices.get(patient, (0, 0))
+        return self.frame.iloc[start:stop]
+
+    @metrics.timed("slice")
+    def part(self, patient, part):
+        """ The patient's rows for one body part in scan date order. """
+        positions = self._parts.get((patient, part))
+        return self.frame.iloc[positions] if positions is not None else self.frame.iloc[:0]
+
+    @metrics.timed("slice")
+    def parts(self, patient, parts):
+        """ The patient's rows for several body parts in scan date order. """
+        positions = [self._parts[(patient, part)] for part in parts if (patient, part) in self._parts]
+        if not positions:
+            return self.frame.iloc[:0]
+        return self.frame.iloc[np.sort(np.concatenate(positions))]
+
+
+def index(name, frame, part_column=None, transform=None):
+    """ The patient index of source ``name``: over ``frame`` (after ``transform``), or over the database in SQLite mode. """
+    if catalog.DATA_SOURCE == "sqlite":
+        return database.PatientQuery(name, transform=transform)
+    return PatientIndex(transform(frame) if transform is not None else frame, part_column=part_column)
+
+
+store.register_derived("master_index", lambda master, composition: index("master", master, part_column="Body Part"))
+store.register_derived("composition_index", lambda master, composition: index("composition", composition))
@@ -0,0 +1,201 @@
+"""Opt-in profiling of single callback requests.
+
+When enabled, a profiled ``/_dash-update-component`` request runs under
+cProfile and a sampling thread at the same time. Two files are then written to
+``DEXA_PROFILE_DIR``:
+
+* ``<name>.pstats``: the cProfile statistics (``python -m pstats FILE``, snakeviz);
+* ``<name>.collapsed``: the sampled stacks in the collapsed format that
+  ``flamegraph.pl`` and speedscope read, one ``frame;frame;... count`` line
+  per distinct stack.
+
+Both profilers see the request running under the other one. cProfile adds
+a little time to every call, so the flamegraph's proportions are close to, but
+not exactly, those of an unprofiled request.
+
+Which requests are profiled:
+
+* every callback request when ``DEXA_PROFILE=1``;
+* with ``DEXA_PROFILE_TOKEN`` set, any callback request that carries the token
+  in an ``X-Dexa-Profile`` header or a ``?profile=`` query argument. Opening a
+  dashboard page with ``?profile=<token>`` stores the token in a cookie, so
+  every callback from that browser is profiled until ``?profile=off``.
+
+Only one request per process is profiled at a time; the others run normally.
+When neither variable is set, ``install`` registers nothing and requests pay
+nothing.
+
+Configuration (environment variables):
+    DEXA_PROFILE           1 to profile every callback request
+    DEXA_PROFILE_TOKEN     secret that enables profiling per request
+    DEXA_PROFILE_DIR       where profiles are written (default profiles/ in DEXA_CACHE_DIR)
+    DEXA_PROFILE_KEEP      profiles kept; older ones are deleted (default 50)
+    DEXA_PROFILE_MIN_MS    keep only requests at least this slow (default 0)
+    DEXA_PROFILE_INTERVAL  seconds between stack samples (default 0.001)
+"""
+import cProfile
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import flask
+
+from dexa import catalog, metrics
+
+ENABLED = os.environ.get("DEXA_PROFILE", "0") == "1"
+TOKEN = os.environ.get("DEXA_PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("DEXA_PROFILE_DIR", os.path.join(catalog.CACHE_DIR, "profiles"))
+KEEP = int(os.environ.get("DEXA_PROFILE_KEEP", "50"))
+MIN_MS = float(os.environ.get("DEXA_PROFILE_MIN_MS", "0"))
+INTERVAL = float(os.environ.get("DEXA_PROFILE_INTERVAL", "0.001"))
+
+HEADER = "X-Dexa-Profile"
+COOKIE = "dexa_profile"
+
+_busy = threading.Lock()
+_local = threading.local()
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval=INTERVAL):
+        super().__init__(name="dexa-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        # The sampler only runs when the profiled thread lets go of the GIL,
+        # every sys.getswitchinterval() (5 ms by default): sample more often
+        # while it runs
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval))
+        try:
+            self._sample()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def collapsed(self):
+        """ The sampled stacks in the collapsed (``flamegraph.pl``) format. """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _has_token(value):
+    return bool(TOKEN) and value is not None and hmac.compare_digest(value.encode(), TOKEN.encode())
+
+
+def requested():
+    """ Whether the current request asks to be profiled. """
+    if ENABLED:
+        return True
+    request = flask.request
+    return any(_has_token(value) for value in
+               (request.headers.get(HEADER), request.args.get("profile"), request.cookies.get(COOKIE)))
+
+
+def write(name, profile, sampler, directory=PROFILE_DIR, keep=KEEP):
+    """ Write ``<name>.pstats`` and ``<name>.collapsed`` to ``directory`` and prune to ``keep`` profiles. """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    profile.dump_stats(path + ".pstats")
+    with open(path + ".collapsed", "w") as f:
+        f.write(sampler.collapsed())
+    prune(directory, keep)
+    return path
+
+
+def prune(directory=PROFILE_DIR, keep=KEEP):
+    """ Delete all but the newest ``keep`` profiles in ``directory``. """
+    profiles = sorted((entry.stat().st_mtime_ns, entry.name[:-len(".pstats")]) for entry in os.scandir(directory)
+                      if entry.name.endswith(".pstats"))
+    for _, name in profiles[:max(0, len(profiles) - keep)]:
+        for suffix in (".pstats", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except OSError:
+                pass
+
+
+def install(app):
+    """
+    Profile the callback requests of ``app`` that ask for it (nothing is
+    registered when disabled). Install it before ``metrics.instrument``, whose
+    after_request hook then runs first, so writing a profile is not timed as
+    part of the callback.
+    """
+    if not ENABLED and not TOKEN:
+        return
+    server = app.server
+    update_path = app.config.requests_pathname_prefix + "_dash-update-component"
+
+    @server.before_request
+    def start_profile():
+        if flask.request.path != update_path or not requested() or not _busy.acquire(blocking=False):
+            return
+        _local.sampler = Sampler(threading.get_ident())
+        _local.sampler.start()
+        _local.profile = cProfile.Profile()
+        _local.start = time.perf_counter()
+        _local.profile.enable()
+
+    @server.after_request
+    def finish_profile(response):
+        profile = getattr(_local, "profile", None)
+        if profile is None:
+            if TOKEN and flask.request.path != update_path and "profile" in flask.request.args:
+                _remember(response)
+            return response
+        profile.disable()
+        elapsed = time.perf_counter() - _local.start
+        sampler, _local.profile, _local.sampler = _local.sampler, None, None
+        try:
+            sampler.stop()
+            if elapsed * 1000 >= MIN_MS:
+                body = flask.request.get_json(silent=True) or {}
+                callback = metrics.callback_name(app, body.get("output"))
+                name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{callback}-{elapsed * 1000:.0f}ms"
+                path = write(name, profile, sampler)
+                response.headers[HEADER] = os.path.basename(path)
+                print(f"Profiled {callback} ({elapsed * 1000:.0f} ms): {path}.pstats", flush=True)
+        except Exception as e:
+            print(f"Error writing profile: {e}", flush=True)
+        finally:
+            _busy.release()
+        return response
+
+    @server.teardown_request
+    def abandon_profile(exc):
+        # after_request did not run (an earlier hook raised): drop the profile
+        profile = getattr(_local, "profile", None)
+        if profile is not None:
+            profile.disable()
+            _local.sampler.stop()
+            _local.profile = _local.sampler = None
+            _busy.release()
+
+
+def _remember(response):
+    """ Store (or with ``?profile=off`` clear) the profiling token in a cookie for this browser. """
+    value = flask.request.args["profile"]
+    if value == "off":
+        response.delete_cookie(COOKIE)
+    elif _has_token(value):
+        response.set_cookie(COOKIE, value, httponly=True, samesite="Strict", secure=flask.request.is_secure)
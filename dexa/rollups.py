@@ -0,0 +1,285 @@
+"""Cohort rollup: binned distributions of the region measurements across patients.
+
+``Rollup`` keeps every scan of the master table with its measurements already
+binned, so a filter never touches the raw rows:
+
+    bins[scan, part, metric]    bin of each value (``NO_VALUE`` where missing)
+    values[scan, part, metric]  the values themselves (float32), for exact means
+    scan_months[scan]           month of the scan
+    next_months[scan]           month of the patient's next scan
+    sexes, bands[scan]          sex and age band at the scan
+
+A cohort counts each patient once, at their latest scan in the window of
+months: a scan is that scan when its month is in the window and the patient's
+next scan falls after it. The sex and age band filters then apply to that
+scan. ``select`` masks the scans and counts the chosen ones' bins, so a filter
+change costs about one bincount per patient in the cohort; ``Cohort``
+interpolates medians and quartiles within the bins. The bins of each (body
+part, metric) split the range of its values into ``BINS``; when added scans
+bring a value outside it, the range is widened and every scan binned again
+from ``values``, so no value is ever clipped into an end bin.
+
+The cohort page registers ``build`` and ``update`` as the store's
+"cohort_rollup" derived table, so it follows the data: appended scans are
+binned and added to a copy of the previous rollup, while a reload that
+replaces scans (or brings a new body part) builds it again. In SQLite mode it
+is built from the database, on first use after each new database version:
+
+    cohort = snapshot.derived["cohort_rollup"].resolve().select(sexes=["Female"], months=(first, last))
+    cohort.quantile("Lean (g)", 0.5)    # median per body part
+"""
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from dexa import catalog, database, metrics
+
+METRICS = ["% Fat", "Tissues (g)", "Fat (g)", "Lean (g)", "BMC (g)", "Total Mass (kg)"]
+
+SEXES = ["Female", "Male", "Unknown"]
+SEX_VALUES = {"female": 0, "f": 0, "male": 1, "m": 1}
+
+# Age bands: under 20, 20-29, ..., 70-79, 80 and over, then unknown
+AGE_EDGES = [20, 30, 40, 50, 60, 70, 80]
+AGE_BANDS = ["<20", *(f"{low}-{low + 9}" for low in AGE_EDGES[:-1]), f"{AGE_EDGES[-1]}+", "Unknown"]
+
+COLUMNS = ["Unique ID", "Patient Name", "Scan Date", "Body Part", "Sex", "Age", *METRICS]
+
+BINS = 40
+
+# Bin of a missing value
+NO_VALUE = np.iinfo(np.uint8).max
+
+# Next month of a patient's last scan
+NO_NEXT = np.iinfo(np.int64).max
+
+
+def month_number(dates):
+    """ Months since year 0 (year * 12 + month - 1) of a datetime Series. """
+    return (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64)
+
+
+def month_label(month):
+    return f"{month // 12}-{month % 12 + 1:02d}"
+
+
+def _sex_codes(values):
+    categorical = pd.Categorical(values)
+    lookup = [SEX_VALUES.get(str(value).strip().lower(), len(SEXES) - 1) for value in categorical.categories]
+    # Code -1 (missing) picks the last entry: unknown
+    return np.array(lookup + [len(SEXES) - 1])[categorical.codes]
+
+
+def _age_codes(values):
+    ages = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+    return np.where(np.isnan(ages), len(AGE_BANDS) - 1, np.digitize(ages, AGE_EDGES))
+
+
+def _rows(frame):
+    """ The rows of ``frame`` the rollup counts: with a scan, a patient, a date and a body part. """
+    frame = frame.reindex(columns=COLUMNS)
+    return frame[frame["Unique ID"].notna() & frame["Patient Name"].notna() & frame["Scan Date"].notna()
+                 & frame["Body Part"].notna()]
+
+
+def _next_months(patients, dates, months):
+    """ The month of each scan's patient's next scan (by date), ``NO_NEXT`` for their last one. """
+    codes = pd.factorize(patients)[0]
+    # Stable: a patient's scans on the same date keep their order
+    order = np.lexsort((dates, codes))
+    next_months = np.full(len(order), NO_NEXT, dtype=np.int64)
+    same = codes[order][1:] == codes[order][:-1]
+    next_months[order[:-1][same]] = months[order[1:][same]]
+    return next_months
+
+
+def _edges(values):
+    """ (part, metric, [low, high]) bin ranges spanning every value in ``values``; NaN where there are none. """
+    with warnings.catch_warnings():
+        # All-NaN columns: a part never measured for a metric
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+    return np.stack([low, np.where(high > low, high, low + 1)], axis=-1).astype(float)
+
+
+def _widen(edges, values):
+    """ ``edges`` stretched to cover ``values`` too. """
+    new = _edges(values)
+    low, high = np.fmin(edges[..., 0], new[..., 0]), np.fmax(edges[..., 1], new[..., 1])
+    return np.stack([low, np.where(high > low, high, low + 1)], axis=-1)
+
+
+def _bin(values, edges):
+    """ The bin of each of ``values`` [scan, part, metric] within ``edges`` (``NO_VALUE`` where missing). """
+    low, high = edges[:, :, 0], edges[:, :, 1]
+    with np.errstate(invalid="ignore"):
+        bins = np.clip(np.floor((values - low) / (high - low) * BINS), 0, BINS - 1)
+    return np.where(np.isnan(values), NO_VALUE, bins).astype(np.uint8)
+
+
+class Rollup:
+    def __init__(self, parts, edges, scan_ids, patients, dates, sexes, bands, bins, values):
+        self.parts = parts
+        self.edges = edges
+        self.scan_ids = scan_ids
+        self.patients = patients
+        self.dates = dates
+        self.sexes = sexes
+        self.bands = bands
+        self.bins = bins
+        self.values = values
+        self.scan_months = month_number(pd.Series(dates))
+        self.next_months = _next_months(patients, dates, self.scan_months)
+
+    @classmethod
+    def empty(cls, parts, edges):
+        """ A rollup of no scans yet, for body ``parts`` with the bin ranges ``edges``. """
+        return cls(parts, edges, frozenset(), np.zeros(0, dtype=object),
+                   np.zeros(0, dtype="datetime64[ns]"), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int8),
+                   np.zeros((0, len(parts), len(METRICS)), dtype=np.uint8),
+                   np.zeros((0, len(parts), len(METRICS)), dtype=np.float32))
+
+    @classmethod
+    def build(cls, frame):
+        """ The rollup of every row of the master table ``frame``. """
+        frame = _rows(frame)
+        parts = sorted(pd.unique(frame["Body Part"].astype(object)))
+        return cls.empty(parts, np.full((len(parts), len(METRICS), 2), np.nan)).add(frame)
+
+    def resolve(self):
+        return self
+
+    def add(self, frame):
+        """
+        A new rollup that also counts the master rows in ``frame``, or None if
+        they include a scan already counted or an unknown body part.
+        """
+        frame = _rows(frame)
+        part = pd.Categorical(frame["Body Part"], categories=self.parts).codes
+        scan, scan_ids = pd.factorize(frame["Unique ID"].astype(object))
+        if (part < 0).any() or not self.scan_ids.isdisjoint(scan_ids):
+            return None
+
+        values = np.full((len(scan_ids), len(self.parts), len(METRICS)), np.nan, dtype=np.float32)
+        values[scan, part] = frame[METRICS].to_numpy(dtype=np.float32)
+        edges = _widen(self.edges, values)
+        if np.array_equal(edges, self.edges, equal_nan=True):
+            bins = np.concatenate([self.bins, _bin(values, edges)])
+        else:
+            # A value beyond the bins: rebin every scan rather than clip it into an end bin
+            bins = _bin(np.concatenate([self.values, values]), edges)
+
+        first = frame.iloc[np.unique(scan, return_index=True)[1]]
+        return Rollup(self.parts, edges, self.scan_ids.union(scan_ids),
+                      np.concatenate([self.patients, first["Patient Name"].to_numpy(dtype=object)]),
+                      np.concatenate([self.dates, first["Scan Date"].to_numpy(dtype="datetime64[ns]")]),
+                      np.concatenate([self.sexes, _sex_codes(first["Sex"]).astype(np.int8)]),
+                      np.concatenate([self.bands, _age_codes(first["Age"]).astype(np.int8)]),
+                      bins, np.concatenate([self.values, values]))
+
+    def months(self):
+        """ (first, last) month number of the counted scans, or None if there are none. """
+        if not len(self.scan_months):
+            return None
+        return int(self.scan_months.min()), int(self.scan_months.max())
+
+    def recorded(self):
+        """ (whether any scan has a sex, whether any scan has an age) """
+        return bool((self.sexes != len(SEXES) - 1).any()), bool((self.bands != len(AGE_BANDS) - 1).any())
+
+    @metrics.timed("slice")
+    def select(self, sexes=None, bands=None, months=None):
+        """
+        The ``Cohort`` of the patients whose latest scan in ``months`` (all
+        months if None) has one of ``sexes`` and one of the age ``bands``.
+        """
+        if months is None:
+            mask = self.next_months == NO_NEXT
+        else:
+            mask = (self.scan_months >= months[0]) & (self.scan_months <= months[1]) & (self.next_months > months[1])
+        if sexes is not None:
+            mask &= np.isin(self.sexes, [SEXES.index(name) for name in sexes])
+        if bands is not None:
+            mask &= np.isin(self.bands, [AGE_BANDS.index(name) for name in bands])
+        scans = np.flatnonzero(mask)
+
+        bins = self.bins[scans].reshape(len(scans), len(self.parts) * len(METRICS))
+        cells = np.arange(bins.shape[1]) * BINS + bins
+        counts = np.bincount(cells[bins != NO_VALUE], minlength=bins.shape[1] * BINS)
+        sums = np.nansum(self.values[scans], axis=0, dtype=np.float64)
+        return Cohort(self.parts, self.edges, counts.reshape(len(self.parts), len(METRICS), BINS), sums, len(scans))
+
+
+class Cohort:
+    def __init__(self, parts, edges, counts, sums, patients):
+        self.parts = parts
+        self.edges = edges
+        self.counts = counts
+        self.sums = sums
+        self.patients = patients
+
+    def count(self, metric):
+        """ Values of ``metric`` per body part. """
+        return self.counts[:, METRICS.index(metric)].sum(axis=1)
+
+    def mean(self, metric):
+        m = METRICS.index(metric)
+        n = self.count(metric)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 0, self.sums[:, m] / n, np.nan)
+
+    def quantile(self, metric, q):
+        """ The ``q`` quantile of ``metric`` per body part, interpolated within its bin (NaN without values). """
+        m = METRICS.index(metric)
+        counts = self.counts[:, m].astype(float)
+        n = counts.sum(axis=1)
+        cumulative = np.cumsum(counts, axis=1)
+        target = q * n
+        bins = np.minimum((cumulative < target[:, None]).sum(axis=1), BINS - 1)
+        rows = np.arange(len(self.parts))
+        in_bin = counts[rows, bins]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.clip((target - (cumulative[rows, bins] - in_bin)) / in_bin, 0, 1)
+        low, high = self.edges[:, m, 0], self.edges[:, m, 1]
+        return np.where(n > 0, low + (bins + np.nan_to_num(fraction)) * (high - low) / BINS, np.nan)
+
+    def histogram(self, part, metric):
+        """ (bin centres, bin width, counts) of ``metric`` for body ``part``. """
+        p, m = self.parts.index(part), METRICS.index(metric)
+        low, high = self.edges[p, m]
+        width = (high - low) / BINS
+        return low + (np.arange(BINS) + 0.5) * width, width, self.counts[p, m]
+
+
+class DatabaseRollup:
+    """ The rollup of the database's master rows, built on first use. """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._rollup = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        with self._lock:
+            if self._rollup is None:
+                self._rollup = Rollup.build(database.read_columns("master", COLUMNS, self.path))
+            return self._rollup
+
+
+def build(master, composition):
+    """ The rollup of ``master`` (of the database in SQLite mode, built on first use). """
+    if catalog.DATA_SOURCE == "sqlite":
+        return DatabaseRollup()
+    return Rollup.build(master)
+
+
+def update(previous, master, composition, appended):
+    """ ``previous`` plus the scans appended to ``master``; rebuilt if they replace counted ones. """
+    rows = appended.get("master")
+    if rows is None or rows.empty:
+        return previous
+    updated = previous.add(rows)
+    return updated if updated is not None else Rollup.build(master)
+
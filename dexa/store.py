@@ -0,0 +1,275 @@
+"""Versioned data store with hot reload of the master and composition tables.
+
+Callbacks take one ``Snapshot`` with ``store.snapshot()`` at the start and read
+every table they need from it, so a reload that lands while a callback is
+running can never mix old and new data.
+
+In local mode (``DEXA_DATA_SOURCE=local``) ``start_watching()`` runs a daemon
+thread that polls the CSVs under ``Data/``. When a file has only grown, just the
+appended rows are read and merged; any other change reloads the file in full.
+While an ingestion run is writing to a file (``catalog.ingesting``), appended
+rows are read only up to where the file ended when the run started, so a run's
+rows appear together once it has finished rather than batch by batch.
+Derived tables registered with ``register_derived`` are rebuilt on the watcher
+thread and the new snapshot is published with a single reference swap.
+
+In SQLite mode (``DEXA_DATA_SOURCE=sqlite``, see ``dexa.database``) the tables
+stay in the database: ``master`` and ``composition`` are empty, the derived
+indexes query the database, and the watcher polls the database's version.
+
+Configuration (environment variables):
+    DEXA_RELOAD_INTERVAL  seconds between polls (default 5, 0 disables watching)
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import pandas as pd
+
+from dexa import catalog, database, metrics
+
+RELOAD_INTERVAL = float(os.environ.get("DEXA_RELOAD_INTERVAL", "5"))
+
+# Bytes before the last read offset that must be unchanged for a grown file
+# to be treated as an append rather than a rewrite
+TAIL_BYTES = 256
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    master: pd.DataFrame
+    composition: pd.DataFrame
+    derived: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    # Content hash of the source tables: equal in every process that holds the
+    # same data, unlike ``version`` which counts reloads in this process
+    fingerprint: str = ""
+
+
+@dataclass
+class _FileState:
+    path: str
+    columns: list
+    offset: int
+    mtime_ns: int
+    tail: bytes
+
+
+_lock = threading.RLock()
+_snapshot = None
+_files = {}
+_derived = {}
+_watcher = None
+_database_version = None
+
+
+def _stat_state(path):
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(max(0, stat.st_size - TAIL_BYTES))
+        tail = f.read(TAIL_BYTES)
+    columns = list(catalog.read_csv(io.BytesIO(header)).columns)
+    return _FileState(path, columns, stat.st_size, stat.st_mtime_ns, tail)
+
+
+def _readable_size(path, size):
+    """ How much of ``path`` (``size`` bytes now) may be read: up to where a running ingestion started appending. """
+    entry = catalog.read_ingesting(os.path.dirname(path)).get("files", {}).get(os.path.basename(path))
+    if entry is None or entry["size"] > size:
+        return size
+    return entry["size"]
+
+
+def _build_derived(master, composition, previous=None, appended=None):
+    """ Build every registered derived table, incrementally where possible. """
+    derived = {}
+    for name, (build, update) in _derived.items():
+        if previous is not None and appended is not None and update is not None and name in previous.derived:
+            with metrics.timer(metrics.DERIVED_SECONDS, table=name, mode="update"):
+                derived[name] = update(previous.derived[name], master, composition, appended)
+        else:
+            with metrics.timer(metrics.DERIVED_SECONDS, table=name, mode="build"):
+                derived[name] = build(master, composition)
+    return MappingProxyType(derived)
+
+
+def fingerprint(*frames):
+    """ Hash the contents of ``frames`` into a short hex string. """
+    digest = hashlib.sha1()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+        digest.update(repr(list(frame.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def _publish(master, composition, derived, digest=None):
+    global _snapshot
+    current = _snapshot
+    if digest is None and current is not None and current.master is master and current.composition is composition:
+        digest = current.fingerprint
+    elif digest is None:
+        digest = fingerprint(master, composition)
+    version = current.version + 1 if current is not None else 1
+    _snapshot = Snapshot(version, master, composition, derived, digest)
+    metrics.DATA_VERSION.set(version)
+    metrics.DATA_ROWS.set(len(master), table="master")
+    metrics.DATA_ROWS.set(len(composition), table="composition")
+    return _snapshot
+
+
+def _initial_snapshot():
+    global _database_version
+    if catalog.DATA_SOURCE == "sqlite":
+        _database_version = database.version()
+        if _database_version is None:
+            raise FileNotFoundError(f"No database at {database.default_path()} (create it with python -m dexa migrate)")
+        master, composition = pd.DataFrame(), pd.DataFrame()
+        return _publish(master, composition, _build_derived(master, composition), f"sqlite-{_database_version}")
+    if catalog.DATA_SOURCE == "local":
+        for source in catalog.SOURCES.values():
+            if os.path.exists(source.local_path):
+                _files[source.name] = _stat_state(source.local_path)
+    master, composition = catalog.load_master(), catalog.load_composition()
+    return _publish(master, composition, _build_derived(master, composition))
+
+
+def snapshot():
+    """ Return the current consistent view of all tables. """
+    current = _snapshot
+    if current is not None:
+        return current
+    with _lock:
+        return _snapshot if _snapshot is not None else _initial_snapshot()
+
+
+def register_derived(name, build, update=None):
+    """
+    Register a table derived from the source tables.
+
+    ``build(master, composition)`` computes it from scratch. The optional
+    ``update(previous, master, composition, appended)`` receives the previous
+    value and a dict of the rows appended to each source, and is used instead of
+    ``build`` when a reload only appended rows.
+    """
+    with _lock:
+        current = snapshot()
+        _derived[name] = (build, update)
+        derived = dict(current.derived)
+        with metrics.timer(metrics.DERIVED_SECONDS, table=name, mode="build"):
+            derived[name] = build(current.master, current.composition)
+        _publish(current.master, current.composition, MappingProxyType(derived))
+
+
+def _merge_appended(source, frame, rows):
+    merged = pd.concat([frame, rows], ignore_index=True)
+    merged = merged.drop_duplicates(subset=list(source.key), keep="last")
+    merged = merged.sort_values("Scan Date", kind="mergesort").reset_index(drop=True)
+    return catalog.categorize(merged)
+
+
+def _read_changes(source, frame):
+    """
+    Return (frame, appended_rows) for a changed file, or None if unchanged.
+    ``appended_rows`` is None when the file had to be reloaded in full.
+    """
+    state = _files[source.name]
+    stat = os.stat(state.path)
+    if stat.st_mtime_ns == state.mtime_ns and stat.st_size == state.offset:
+        return None
+    size = _readable_size(state.path, stat.st_size)
+    if size == state.offset < stat.st_size:
+        # Everything after the offset is still being written by an ingestion run
+        return None
+
+    with open(state.path, "rb") as f:
+        tail_start = max(0, state.offset - len(state.tail))
+        f.seek(tail_start)
+        is_append = size > state.offset and f.read(state.offset - tail_start) == state.tail
+        if is_append:
+            data = f.read(size - state.offset)
+            # Leave a partially written last line for the next poll
+            data = data[:data.rfind(b"\n") + 1]
+
+    if not is_append:
+        _files[source.name] = _stat_state(state.path)
+        return catalog.parse_frame(catalog.read_csv(state.path)), None
+
+    offset = state.offset + len(data)
+    tail = (state.tail + data)[-TAIL_BYTES:]
+    _files[source.name] = _FileState(state.path, state.columns, offset, stat.st_mtime_ns, tail)
+    if not data.strip():
+        return None
+    rows = catalog.parse_frame(catalog.read_csv(io.BytesIO(data), header=None, names=state.columns))
+    return _merge_appended(source, frame, rows), rows
+
+
+def reload():
+    """ Pick up changes to the watched files. Returns the snapshot now current. """
+    with _lock:
+        start = time.perf_counter()
+        current = snapshot()
+        if catalog.DATA_SOURCE == "sqlite":
+            return _reload_database(current, start)
+        if not _files:
+            return current
+        tables = {"master": current.master, "composition": current.composition}
+        appended = {}
+        full_reload = False
+        for name, source in catalog.SOURCES.items():
+            if name not in _files:
+                continue
+            changes = _read_changes(source, tables[name])
+            if changes is None:
+                continue
+            tables[name], rows = changes
+            if rows is None:
+                full_reload = True
+            else:
+                appended[name] = rows
+        if not full_reload and not appended:
+            return current
+
+        derived = _build_derived(tables["master"], tables["composition"],
+                                 previous=current, appended=None if full_reload else appended)
+        new = _publish(tables["master"], tables["composition"], derived)
+        metrics.RELOAD_SECONDS.observe(time.perf_counter() - start)
+        print(f"Data reloaded: version {new.version}, {len(new.master)} master rows, "
+              f"{len(new.composition)} composition rows")
+        return new
+
+
+def _reload_database(current, start):
+    global _database_version
+    version = database.version()
+    if version is None or version == _database_version:
+        return current
+    _database_version = version
+    new = _publish(current.master, current.composition, _build_derived(current.master, current.composition),
+                   f"sqlite-{version}")
+    metrics.RELOAD_SECONDS.observe(time.perf_counter() - start)
+    print(f"Data reloaded: version {new.version}, database version {version}")
+    return new
+
+
+def _watch(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reload()
+        except Exception as e:
+            print(f"Error reloading data: {e}")
+
+
+def start_watching(interval=RELOAD_INTERVAL):
+    """ Start the background watcher (local and SQLite modes only). Safe to call more than once. """
+    global _watcher
+    snapshot()
+    if interval <= 0 or not (_files or catalog.DATA_SOURCE == "sqlite") or (_watcher is not None and _watcher.is_alive()):
+        return
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="dexa-data-watcher", daemon=True)
+    _watcher.start()
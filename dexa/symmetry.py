@@ -0,0 +1,82 @@
+"""Vectorized left/right symmetry scores for every paired region and tissue.
+
+``calculate_symmetry`` scatters the paired body-part rows of the master table
+into one (scan, side, tissue) NumPy array and scores every region and tissue in
+a single pass, instead of grouping by scan in Python. A scan missing either
+side of a pair (or with a zero total) gets NaN for that pair.
+
+The result has one row per "Unique ID" with "Scan Date", "Patient Name" and a
+``"{region} {tissue} Symmetry"`` column for each entry of ``PAIRS`` x ``TISSUES``.
+``update_symmetry`` recomputes only the scans touched by newly appended rows.
+"""
+import numpy as np
+import pandas as pd
+
+PAIRS = {
+    "Arm": ("Left Arm", "Right Arm"),
+    "Ribs": ("Left Ribs", "Right Ribs"),
+    "Leg": ("Left Leg", "Right Leg"),
+}
+
+TISSUES = {
+    "Fat": "Fat (g)",
+    "Lean": "Lean (g)",
+    "BMC": "BMC (g)",
+    "Tissues": "Tissues (g)",
+}
+
+# Left, right, left, right, ... so that sides[:, 0::2] is left and sides[:, 1::2] is right
+SIDES = [part for pair in PAIRS.values() for part in pair]
+
+
+def symmetry_column(region, tissue):
+    return f"{region} {tissue} Symmetry"
+
+
+def calculate_symmetry_score(left, right):
+    """
+    Calculate symmetry score between -1 and 1
+    -1: left side much bigger
+    0: perfect symmetry
+    1: right side much bigger
+    Works element-wise on arrays; missing sides and zero totals give NaN.
+    """
+    left, right = np.asarray(left, dtype=float), np.asarray(right, dtype=float)
+    avg = (left + right) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff = (right - left) / avg
+    return np.where(np.isfinite(diff), diff, np.nan)
+
+
+def calculate_symmetry(df):
+    """ Score every paired region and tissue for every scan in ``df`` in one pass. """
+    df = df[df["Unique ID"].notna()]
+    scan_codes, unique_ids = pd.factorize(df["Unique ID"], sort=True)
+    first = np.unique(scan_codes, return_index=True)[1]
+
+    part_codes = pd.Categorical(df["Body Part"], categories=SIDES).codes
+    paired = part_codes >= 0
+    sides = np.full((len(unique_ids), len(SIDES), len(TISSUES)), np.nan)
+    sides[scan_codes[paired], part_codes[paired]] = df[list(TISSUES.values())].to_numpy(dtype=float)[paired]
+
+    scores = calculate_symmetry_score(sides[:, 0::2], sides[:, 1::2])
+
+    columns = {
+        "Unique ID": np.asarray(unique_ids),
+        "Scan Date": df["Scan Date"].iloc[first].to_numpy(),
+        "Patient Name": df["Patient Name"].iloc[first].reset_index(drop=True),
+    }
+    for r, region in enumerate(PAIRS):
+        for t, tissue in enumerate(TISSUES):
+            columns[symmetry_column(region, tissue)] = scores[:, r, t]
+    return pd.DataFrame(columns)
+
+
+def update_symmetry(previous, master, appended_rows):
+    """ Refresh ``previous`` for the scans that ``appended_rows`` added to ``master``. """
+    if appended_rows is None or appended_rows.empty:
+        return previous
+    scan_ids = appended_rows["Unique ID"].unique()
+    changed = calculate_symmetry(master[master["Unique ID"].isin(scan_ids)])
+    kept = previous[~previous["Unique ID"].isin(scan_ids)]
+    return pd.concat([kept, changed], ignore_index=True)
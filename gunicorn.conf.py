@@ -0,0 +1,47 @@
+"""gunicorn settings for serving the dashboard in production.
+
+    gunicorn -c gunicorn.conf.py app:server
+
+With preload (the default) the master process imports the app, which loads
+the tables and builds the derived indexes, and only then forks the workers.
+The workers share those pages copy-on-write instead of each loading its own
+copy, so memory does not multiply with the worker count. ``gc.freeze()`` in
+the master moves everything loaded so far out of the garbage collector's
+reach: otherwise the first collection in each worker writes to every object
+header and un-shares the pages holding them. (In local mode the columnar
+store is memory-mapped, so its columns are shared through the page cache
+either way.)
+
+Threads do not survive a fork, so each worker starts its own data watcher
+once it has booted (see ``dexa.store``). A reload builds new frames that the
+worker holds privately until the server is restarted.
+
+Configuration (environment variables):
+    PORT             port to listen on (default 8080)
+    WEB_CONCURRENCY  worker processes (default one per CPU)
+    DEXA_THREADS     threads per worker (default 4)
+    DEXA_PRELOAD     1 to load the data once in the master (default), 0 to load it in every worker
+    DEXA_TIMEOUT     seconds before a silent worker is restarted (default 60)
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+threads = int(os.environ.get("DEXA_THREADS", "4"))
+preload_app = os.environ.get("DEXA_PRELOAD", "1") != "0"
+timeout = int(os.environ.get("DEXA_TIMEOUT", "60"))
+
+
+def when_ready(server):
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+        server.log.info("Data loaded in the master, %d objects frozen for the workers", gc.get_freeze_count())
+
+
+def post_worker_init(worker):
+    from dexa import store
+
+    store.start_watching()
+    worker.log.info("Worker %s ready", worker.pid)
@@ -1,10 +1,13 @@
-from dash import dcc, html, Input, Output, callback, ALL, MATCH, callback_context, register_page, State
-import plotly.graph_objects as go
+from dash import dcc, html, Input, Output, callback, ALL, callback_context, register_page, State
+from dash import clientside_callback, ClientsideFunction, Patch
 import plotly.express as px
-from plotly.subplots import make_subplots
-import pandas as pd
 from dash.exceptions import PreventUpdate
 import dash
+import os
+
+from dexa import figures, store
+from dexa.figure_cache import figure_cache
+from dexa import patient_index  # noqa: F401 - registers the patient indexes with the store
 
 # Register this page
 register_page(__name__, 
@@ -12,21 +15,10 @@ register_page(__name__,
              name='Body Part Trends',
              order=2)
 
-# GitHub raw URL for the master CSV
-MASTER_CSV_URL = "https://raw.githubusercontent.com/rigg-alex/DEXA_Dashboard/main/Data/master_dexa_data.csv"
-
-# Load the data from GitHub
-def load_data():
-    try:
-        df = pd.read_csv(MASTER_CSV_URL)
-        df["Scan Date"] = pd.to_datetime(df["Scan Date"], format="%d-%m-%Y", errors="coerce")
-        df.dropna(subset=["Scan Date"], inplace=True)
-        return df
-    except Exception as e:
-        print(f"Error loading data from GitHub: {e}")
-        return pd.DataFrame()
-
-df = load_data()
+# "client" (default): the selected patient's series are shipped once into a
+# dcc.Store and button toggling and chart rendering run in the browser
+# (assets/body_part_trend.js). "server": every click is a server callback.
+RENDERING = os.environ.get("DEXA_BODY_PART_RENDERING", "client")
 
 # Group body parts logically
 BODY_PART_GROUPS = {
@@ -37,6 +29,34 @@ BODY_PART_GROUPS = {
     'Regions': ['Android', 'Gynoid']
 }
 
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', 
+          '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+# Static figure layouts, built once
+MASS_TRENDS_LAYOUT = {
+    'title': {'text': "Fat Mass and Lean Mass Trends"},
+    'plot_bgcolor': 'white',
+    'paper_bgcolor': 'white',
+    'xaxis': {'showgrid': False},
+    'yaxis': {'showgrid': False, 'title': {'text': "Fat Mass (g)"}},
+    'yaxis2': {'showgrid': False, 'title': {'text': "Lean Mass (g)"}},
+    'legend': {
+        'orientation': "h",
+        'yanchor': "bottom",
+        'y': 1.02,
+        'xanchor': "right",
+        'x': 1
+    }
+}
+
+RATIO_TREND_LAYOUT = {
+    'title': {'text': "Fat-to-Lean Mass Ratio Trend"},
+    'plot_bgcolor': 'white',
+    'paper_bgcolor': 'white',
+    'xaxis': {'showgrid': False},
+    'yaxis': {'showgrid': False, 'title': {'text': "Fat:Lean Mass Ratio"}}
+}
+
 def create_button(part):
     """Create a consistent button style"""
     return html.Button(
@@ -80,12 +100,81 @@ def create_button_group(group, parts):
         })
     ], style={'marginBottom': '15px'})
 
+def toggle_selection(button_ids, current_classes, triggered_index):
+    """Apply a button click to the current selection, returning (classes, selected parts)"""
+    new_classes = []
+    selected_parts = []
+    
+    # Check if we're clicking a new button when Total is selected
+    total_index = next(i for i, btn in enumerate(button_ids) if btn['index'] == 'Total')
+    was_total_selected = 'selected' in (current_classes[total_index] or '')
+    is_clicking_non_total = triggered_index != total_index
+    
+    for i, btn in enumerate(button_ids):
+        is_total = btn['index'] == 'Total'
+        
+        # Special handling when switching from Total to other selections
+        if was_total_selected and is_clicking_non_total:
+            if is_total:
+                new_classes.append('body-part-btn')  # Deselect Total
+            elif i == triggered_index:
+                new_classes.append('body-part-btn selected')  # Select clicked button
+            else:
+                new_classes.append('body-part-btn')  # Keep others deselected
+        else:
+            # Normal toggle behavior
+            is_selected = 'body-part-btn selected' if ('selected' not in (current_classes[i] or '') and i == triggered_index) or \
+                         ('selected' in (current_classes[i] or '') and i != triggered_index) else 'body-part-btn'
+            new_classes.append(is_selected)
+        
+        # Add to selected parts if button is selected
+        if 'selected' in new_classes[-1]:
+            selected_parts.append(btn['index'])
+    
+    return new_classes, selected_parts
+
+def client_figures():
+    """Empty figures and colors the clientside callback fills in"""
+    return {
+        'colors': COLORS,
+        'mass': figures.figure([], figures.secondary_y_layout(MASS_TRENDS_LAYOUT), template_name="plotly_white"),
+        'ratio': figures.figure([], RATIO_TREND_LAYOUT, template_name="plotly_white")
+    }
+
 def layout():
+    patients = store.snapshot().derived["master_index"].patients()
     return html.Div([
         html.H2("Body Part Analysis", style={'textAlign': 'center', 'marginBottom': '20px'}),
+
+        # Selected patient's series and the figure templates for clientside rendering
+        dcc.Store(id='body-part-data'),
+        dcc.Store(id='body-part-figures', data=client_figures() if RENDERING == 'client' else None),
+        # Patient, parts and data version the server-rendered figures show
+        dcc.Store(id='body-part-rendered'),
         
         # Controls Section
         html.Div([
+            # Patient Selection
+            html.Div([
+                html.Label("Select Patient:", style={
+                    'fontWeight': 'bold',
+                    'marginBottom': '10px',
+                    'display': 'block'
+                }),
+                dcc.Dropdown(
+                    id='body-part-patient-selector',
+                    options=[{'label': name, 'value': name} for name in patients],
+                    value=patients[0] if patients else None,
+                    clearable=False
+                )
+            ], style={
+                'backgroundColor': 'white',
+                'padding': '20px',
+                'borderRadius': '8px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                'marginBottom': '20px'
+            }),
+
             # Body Part Selection
             html.Div([
                 html.Label("Select Body Parts:", style={
@@ -122,64 +211,27 @@ def layout():
         ], style={'width': '80%', 'float': 'right', 'padding': '10px'})
     ])
 
-@callback(
-    [Output('mass-trends', 'figure'),
-     Output('ratio-trend', 'figure'),
-     Output('stats-card', 'children'),
-     Output({'type': 'body-part-button', 'index': ALL}, 'className')],
-    [Input({'type': 'body-part-button', 'index': ALL}, 'n_clicks')],
-    [State({'type': 'body-part-button', 'index': ALL}, 'className')],
-    prevent_initial_call=True
-)
-def update_charts(n_clicks, current_classes):
-    if not any(n_clicks):
-        raise PreventUpdate
-    
+def update_charts(n_clicks, selected_patient, current_classes, previous=None):
     # Get all button IDs
     ctx = callback_context
     button_ids = [{'type': 'body-part-button', 'index': k['id']['index']} 
                  for k in ctx.inputs_list[0]]
     
     # Get triggered input info
-    triggered = ctx.triggered[0] if ctx.triggered else None
-    if triggered is None:
+    triggered_id = ctx.triggered_id
+    if triggered_id is None:
         return dash.no_update
-        
-    # Parse the triggered input ID
-    triggered_id = triggered['prop_id']
-    triggered_dict = eval(triggered_id.split('.')[0])
-    triggered_index = next(i for i, btn in enumerate(button_ids) 
-                         if btn['index'] == triggered_dict['index'])
-    
-    # Update button classes based on clicks
-    new_classes = []
-    selected_parts = []
     
-    # Check if we're clicking a new button when Total is selected
-    total_index = next(i for i, btn in enumerate(button_ids) if btn['index'] == 'Total')
-    was_total_selected = 'selected' in (current_classes[total_index] or '')
-    is_clicking_non_total = triggered_index != total_index
-    
-    for i, clicks in enumerate(n_clicks):
-        is_total = button_ids[i]['index'] == 'Total'
-        
-        # Special handling when switching from Total to other selections
-        if was_total_selected and is_clicking_non_total:
-            if is_total:
-                new_classes.append('body-part-btn')  # Deselect Total
-            elif i == triggered_index:
-                new_classes.append('body-part-btn selected')  # Select clicked button
-            else:
-                new_classes.append('body-part-btn')  # Keep others deselected
-        else:
-            # Normal toggle behavior
-            is_selected = 'body-part-btn selected' if ('selected' not in (current_classes[i] or '') and i == triggered_index) or \
-                         ('selected' in (current_classes[i] or '') and i != triggered_index) else 'body-part-btn'
-            new_classes.append(is_selected)
-        
-        # Add to selected parts if button is selected
-        if 'selected' in new_classes[-1]:
-            selected_parts.append(button_ids[i]['index'])
+    if triggered_id == 'body-part-patient-selector':
+        # Patient changed: keep the current selection
+        new_classes = [c or 'body-part-btn' for c in current_classes]
+        selected_parts = [btn['index'] for btn, c in zip(button_ids, new_classes) if 'selected' in c]
+    else:
+        if not any(n_clicks):
+            raise PreventUpdate
+        triggered_index = next(i for i, btn in enumerate(button_ids) 
+                             if btn['index'] == triggered_id['index'])
+        new_classes, selected_parts = toggle_selection(button_ids, current_classes, triggered_index)
     
     # If no parts are selected, default to Total
     if not selected_parts:
@@ -187,106 +239,226 @@ def update_charts(n_clicks, current_classes):
         new_classes = ['body-part-btn selected' if id['index'] == 'Total' else 'body-part-btn' 
                       for id in button_ids]
     
-    # Filter data
-    filtered_df = df[df['Body Part'].isin(selected_parts)].sort_values(['Scan Date', 'Body Part'])
-    
-    if filtered_df.empty:
-        return px.line(), px.line(), [html.P("No data available")], new_classes
+    snapshot = store.snapshot()
+    rendered = {'patient': selected_patient, 'parts': selected_parts, 'fingerprint': snapshot.fingerprint}
     
-    # Create main trends figure with dual y-axis
-    main_fig = make_subplots(specs=[[{"secondary_y": True}]])
-    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', 
-              '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+    # Same patient and data on the client: only send the traces that changed
+    if can_patch(snapshot, previous, rendered):
+        main_fig, ratio_fig, stats_card = patch_charts(snapshot, selected_patient, previous['parts'], selected_parts)
+        return main_fig, ratio_fig, stats_card, new_classes, rendered
     
-    for i, part in enumerate(selected_parts):
-        part_data = filtered_df[filtered_df['Body Part'] == part]
-        
-        # Fat mass on primary y-axis
-        main_fig.add_trace(
-            go.Scatter(
-                x=part_data['Scan Date'],
-                y=part_data['Fat (g)'],
-                name=f"{part} - Fat",
-                line=dict(color=colors[i], width=3, dash='dot'),
-                mode='lines+markers'
-            ),
-            secondary_y=False
-        )
-        
-        # Lean mass on secondary y-axis
-        main_fig.add_trace(
-            go.Scatter(
-                x=part_data['Scan Date'],
-                y=part_data['Lean (g)'],
-                name=f"{part} - Lean",
-                line=dict(color=colors[i], width=3),
-                mode='lines+markers'
-            ),
-            secondary_y=True
-        )
-    
-    main_fig.update_layout(
-        title="Fat Mass and Lean Mass Trends",
-        template="plotly_white",
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        xaxis=dict(showgrid=False),
-        yaxis=dict(showgrid=False, title="Fat Mass (g)"),
-        yaxis2=dict(showgrid=False, title="Lean Mass (g)"),
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
-        )
-    )
-    
-    # Create ratio trend figure
-    ratio_fig = go.Figure()
-    
-    for i, part in enumerate(selected_parts):
-        part_data = filtered_df[filtered_df['Body Part'] == part]
-        ratio = part_data['Fat (g)'] / part_data['Lean (g)']
-        
-        ratio_fig.add_trace(
-            go.Scatter(
-                x=part_data['Scan Date'],
-                y=ratio,
-                name=f"{part}",
-                line=dict(color=colors[i], width=3),
-                mode='lines+markers'
-            )
+    key = ('body-part-trend', selected_patient, tuple(selected_parts), snapshot.fingerprint)
+    main_fig, ratio_fig, stats_card = figure_cache.get_or_build(
+        key, lambda: build_charts(snapshot, selected_patient, selected_parts))
+    return main_fig, ratio_fig, stats_card, new_classes, rendered
+
+def can_patch(snapshot, previous, rendered):
+    """Whether the client's figures (previous) can be patched into rendered"""
+    if not previous or previous['patient'] != rendered['patient'] \
+            or previous['fingerprint'] != rendered['fingerprint']:
+        return False
+    # Parts without data draw the empty placeholder figures instead
+    index = snapshot.derived["master_index"]
+    return all(any(not index.part(rendered['patient'], part).empty for part in parts)
+               for parts in (previous['parts'], rendered['parts']))
+
+def load_patient_series(selected_patient):
+    if not selected_patient:
+        raise PreventUpdate
+    snapshot = store.snapshot()
+    key = ('body-part-data', selected_patient, None, snapshot.fingerprint)
+    return figure_cache.get_or_build(key, lambda: build_patient_series(snapshot, selected_patient))
+
+def build_patient_series(snapshot, selected_patient):
+    """Dates, fat and lean mass of every body part for one patient"""
+    index = snapshot.derived["master_index"]
+    series = {}
+    for parts in BODY_PART_GROUPS.values():
+        for part in parts:
+            part_data = index.part(selected_patient, part)
+            if not part_data.empty:
+                series[part] = {
+                    'dates': part_data['Scan Date'].dt.strftime('%Y-%m-%d').tolist(),
+                    'fat': part_data['Fat (g)'].tolist(),
+                    'lean': part_data['Lean (g)'].tolist()
+                }
+    return series
+
+def mass_traces(part_data, part, color):
+    """Fat mass on the primary y-axis and lean mass on the secondary one"""
+    return [
+        figures.scatter(
+            x=part_data['Scan Date'],
+            y=part_data['Fat (g)'],
+            name=f"{part} - Fat",
+            line=dict(color=color, width=3, dash='dot'),
+            mode='lines+markers',
+            xaxis='x',
+            yaxis='y'
+        ),
+        figures.scatter(
+            x=part_data['Scan Date'],
+            y=part_data['Lean (g)'],
+            name=f"{part} - Lean",
+            line=dict(color=color, width=3),
+            mode='lines+markers',
+            xaxis='x',
+            yaxis='y2'
         )
-    
-    ratio_fig.update_layout(
-        title="Fat-to-Lean Mass Ratio Trend",
-        template="plotly_white",
-        yaxis_title="Fat:Lean Mass Ratio",
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        xaxis=dict(showgrid=False),
-        yaxis=dict(showgrid=False)
-    )
-    
-    # Create stats card
-    latest_date = filtered_df['Scan Date'].max()
-    latest_data = filtered_df[filtered_df['Scan Date'] == latest_date]
-    
-    stats_card = [
-        html.H4("Latest Measurements", style={'marginBottom': '15px'})
     ]
+
+def ratio_trace(part_data, part, color):
+    return figures.scatter(
+        x=part_data['Scan Date'],
+        y=part_data['Fat (g)'] / part_data['Lean (g)'],
+        name=f"{part}",
+        line=dict(color=color, width=3),
+        mode='lines+markers'
+    )
+
+def latest_stats(part_frames, selected_parts):
+    """The latest scan date of the selected parts and each part's stats card entries on that date"""
+    latest_date = max(part_frames[part]['Scan Date'].max() for part in selected_parts if not part_frames[part].empty)
     
+    entries = {}
     for part in selected_parts:
-        part_data = latest_data[latest_data['Body Part'] == part]
+        part_data = part_frames[part]
+        part_data = part_data[part_data['Scan Date'] == latest_date]
         if not part_data.empty:
             fat = part_data['Fat (g)'].iloc[0]
             lean = part_data['Lean (g)'].iloc[0]
-            stats_card.extend([
+            entries[part] = [
                 html.H5(part, style={'marginTop': '10px', 'marginBottom': '5px'}),
                 html.P(f"Fat Mass: {fat:,.0f}g"),
                 html.P(f"Lean Mass: {lean:,.0f}g"),
                 html.P(f"Fat:Lean Ratio: {format_ratio(fat, lean)}")
-            ])
+            ]
+    return latest_date, entries
+
+def build_stats_card(part_frames, selected_parts):
+    _, entries = latest_stats(part_frames, selected_parts)
+    stats_card = [
+        html.H4("Latest Measurements", style={'marginBottom': '15px'})
+    ]
+    for part_entries in entries.values():
+        stats_card.extend(part_entries)
+    return stats_card
+
+def build_charts(snapshot, selected_patient, selected_parts):
+    # Select this patient's rows for each part straight from the index
+    index = snapshot.derived["master_index"]
+    part_frames = {part: index.part(selected_patient, part) for part in selected_parts}
+    
+    if all(part_data.empty for part_data in part_frames.values()):
+        return px.line(), px.line(), [html.P("No data available")]
+    
+    # Create main trends figure with dual y-axis
+    main_traces = []
+    for i, part in enumerate(selected_parts):
+        main_traces.extend(mass_traces(part_frames[part], part, COLORS[i]))
+    
+    main_fig = figures.figure(main_traces, figures.secondary_y_layout(MASS_TRENDS_LAYOUT),
+                              template_name="plotly_white")
+    
+    # Create ratio trend figure
+    ratio_traces = [ratio_trace(part_frames[part], part, COLORS[i]) for i, part in enumerate(selected_parts)]
+    
+    ratio_fig = figures.figure(ratio_traces, RATIO_TREND_LAYOUT, template_name="plotly_white")
+    
+    return main_fig, ratio_fig, build_stats_card(part_frames, selected_parts)
+
+def patch_charts(snapshot, selected_patient, rendered_parts, selected_parts):
+    """
+    Turn the figures and stats card drawn for rendered_parts into the ones
+    build_charts draws for selected_parts, sending only the traces (and stats
+    card entries) that were added or removed.
+    Part i owns traces 2i and 2i + 1 of the mass figure and trace i of the
+    ratio figure, and both lists are in button order.
+    """
+    index = snapshot.derived["master_index"]
+    part_frames = {part: index.part(selected_patient, part) for part in selected_parts}
+    main_patch, ratio_patch = Patch(), Patch()
+    
+    # Remove deselected parts, last first so earlier positions stay valid
+    kept = list(rendered_parts)
+    for i in reversed(range(len(rendered_parts))):
+        if rendered_parts[i] not in selected_parts:
+            del main_patch['data'][2 * i + 1]
+            del main_patch['data'][2 * i]
+            del ratio_patch['data'][i]
+            del kept[i]
     
-    return main_fig, ratio_fig, stats_card, new_classes
+    # Insert new parts in button order, fixing the colors of parts that moved
+    for i, part in enumerate(selected_parts):
+        if part not in kept:
+            fat_trace, lean_trace = mass_traces(part_frames[part], part, COLORS[i])
+            main_patch['data'].insert(2 * i, fat_trace)
+            main_patch['data'].insert(2 * i + 1, lean_trace)
+            ratio_patch['data'].insert(i, ratio_trace(part_frames[part], part, COLORS[i]))
+        elif COLORS[rendered_parts.index(part)] != COLORS[i]:
+            main_patch['data'][2 * i]['line']['color'] = COLORS[i]
+            main_patch['data'][2 * i + 1]['line']['color'] = COLORS[i]
+            ratio_patch['data'][i]['line']['color'] = COLORS[i]
+    
+    return main_patch, ratio_patch, patch_stats_card(index, selected_patient, rendered_parts, selected_parts)
+
+def patch_stats_card(index, selected_patient, rendered_parts, selected_parts):
+    """
+    The stats card for selected_parts as a Patch of the one drawn for
+    rendered_parts: only the entries of added or removed parts are sent, unless
+    the latest scan date changed and with it every entry.
+    """
+    part_frames = {part: index.part(selected_patient, part) for part in {*rendered_parts, *selected_parts}}
+    rendered_date, rendered = latest_stats(part_frames, rendered_parts)
+    latest_date, entries = latest_stats(part_frames, selected_parts)
+    if latest_date != rendered_date:
+        return build_stats_card(part_frames, selected_parts)
+    
+    # Entries follow the heading, in button order, as the figures' traces do
+    card = Patch()
+    kept = list(rendered)
+    for i in reversed(range(len(kept))):
+        if kept[i] not in entries:
+            position = 1 + sum(len(rendered[part]) for part in kept[:i])
+            for _ in rendered[kept[i]]:
+                del card[position]
+            del kept[i]
+    position = 1
+    for part, part_entries in entries.items():
+        if part not in kept:
+            for offset, entry in enumerate(part_entries):
+                card.insert(position + offset, entry)
+        position += len(part_entries)
+    return card
+
+CHART_OUTPUTS = [
+    Output('mass-trends', 'figure'),
+    Output('ratio-trend', 'figure'),
+    Output('stats-card', 'children'),
+    Output({'type': 'body-part-button', 'index': ALL}, 'className')
+]
+
+if RENDERING == 'server':
+    callback(
+        [*CHART_OUTPUTS, Output('body-part-rendered', 'data')],
+        [Input({'type': 'body-part-button', 'index': ALL}, 'n_clicks'),
+         Input('body-part-patient-selector', 'value')],
+        [State({'type': 'body-part-button', 'index': ALL}, 'className'),
+         State('body-part-rendered', 'data')],
+        prevent_initial_call=True
+    )(update_charts)
+else:
+    # One server call per patient change; clicks never leave the browser
+    callback(
+        Output('body-part-data', 'data'),
+        Input('body-part-patient-selector', 'value')
+    )(load_patient_series)
+
+    clientside_callback(
+        ClientsideFunction(namespace='bodyPartTrend', function_name='updateCharts'),
+        CHART_OUTPUTS,
+        [Input({'type': 'body-part-button', 'index': ALL}, 'n_clicks'),
+         Input('body-part-data', 'data')],
+        [State({'type': 'body-part-button', 'index': ALL}, 'className'),
+         State('body-part-figures', 'data')]
+    )
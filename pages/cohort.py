@@ -0,0 +1,199 @@
+from dash import dcc, html, Input, Output, callback, register_page, dash_table
+import numpy as np
+
+from dexa import figures, rollups, store
+from dexa.figure_cache import figure_cache
+
+register_page(__name__, path="/cohort", order=5)
+
+# Updated in the background whenever the master data is reloaded
+store.register_derived("cohort_rollup", rollups.build, rollups.update)
+
+# Whiskers at the 5th and 95th percentiles, box at the quartiles
+QUANTILES = {'lowerfence': 0.05, 'q1': 0.25, 'median': 0.5, 'q3': 0.75, 'upperfence': 0.95}
+
+# Static figure layouts, built once
+BOX_LAYOUT = {
+    'height': 450,
+    'showlegend': False,
+    'margin': {'l': 60, 'r': 30, 't': 50, 'b': 100},
+    'xaxis': {'tickangle': -45},
+    'plot_bgcolor': 'white',
+    'paper_bgcolor': 'white'
+}
+
+HISTOGRAM_LAYOUT = {
+    'height': 350,
+    'showlegend': False,
+    'bargap': 0.05,
+    'margin': {'l': 60, 'r': 30, 't': 50, 'b': 50},
+    'yaxis': {'title': {'text': "Patients"}},
+    'plot_bgcolor': 'white',
+    'paper_bgcolor': 'white'
+}
+
+CARD_STYLE = {
+    'backgroundColor': 'white',
+    'padding': '20px',
+    'borderRadius': '8px',
+    'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+    'marginBottom': '20px'
+}
+
+LABEL_STYLE = {'margin': '10px 0 5px 0', 'display': 'block', 'fontWeight': 'bold'}
+
+# A filter the data gives nothing to filter on stays in the layout (the callback reads it) but hidden
+HIDDEN = {'display': 'none'}
+
+
+def month_marks(first, last):
+    """ A mark at every January between the months ``first`` and ``last``. """
+    marks = {month: str(month // 12) for month in range(first, last + 1) if month % 12 == 0}
+    return marks or {first: rollups.month_label(first)}
+
+
+def create_box_plot(cohort, metric):
+    trace = {
+        'type': 'box',
+        'x': cohort.parts,
+        **{name: cohort.quantile(metric, q) for name, q in QUANTILES.items()},
+        'mean': cohort.mean(metric),
+        'name': metric,
+        'marker': {'color': '#3498db'}
+    }
+    layout = figures.merge(BOX_LAYOUT, {'title': {'text': f"{metric} by body part"},
+                                        'yaxis': {'title': {'text': metric}}})
+    return figures.figure([trace], layout)
+
+
+def create_histogram(cohort, part, metric):
+    centres, width, counts = cohort.histogram(part, metric)
+    trace = {'type': 'bar', 'x': centres, 'y': counts, 'width': width, 'marker': {'color': '#3498db'}}
+    layout = figures.merge(HISTOGRAM_LAYOUT, {'title': {'text': f"{part}: {metric} distribution"},
+                                              'xaxis': {'title': {'text': metric}}})
+    return figures.figure([trace], layout)
+
+
+def median_table(cohort):
+    medians = {metric: cohort.quantile(metric, 0.5) for metric in rollups.METRICS}
+    return [
+        {'Body Part': part, **{metric: None if np.isnan(values[p]) else round(float(values[p]), 1)
+                               for metric, values in medians.items()}}
+        for p, part in enumerate(cohort.parts)
+    ]
+
+
+# Layout
+def layout():
+    rollup = store.snapshot().derived["cohort_rollup"].resolve()
+    first, last = rollup.months() or (0, 0)
+    parts = rollup.parts
+    has_sex, has_age = rollup.recorded()
+    missing = [name for name, recorded in (("sex", has_sex), ("age", has_age)) if not recorded]
+    return html.Div([
+        html.H2("Cohort Explorer", style={'textAlign': 'center', 'marginBottom': '20px'}),
+
+        # Filters
+        html.Div([
+            html.Div([
+                html.Label("Metric:", style=LABEL_STYLE),
+                dcc.RadioItems(
+                    id='cohort-metric',
+                    options=[{'label': metric, 'value': metric} for metric in rollups.METRICS],
+                    value='Lean (g)',
+                    inline=True,
+                    inputStyle={'marginLeft': '15px', 'marginRight': '5px'}
+                ),
+                html.Div([
+                    html.Label("Sex:", style=LABEL_STYLE),
+                    dcc.Checklist(
+                        id='cohort-sex',
+                        options=[{'label': sex, 'value': sex} for sex in rollups.SEXES],
+                        value=list(rollups.SEXES),
+                        inline=True,
+                        inputStyle={'marginLeft': '15px', 'marginRight': '5px'}
+                    )
+                ], style=None if has_sex else HIDDEN),
+                html.Div([
+                    html.Label("Age:", style=LABEL_STYLE),
+                    dcc.Checklist(
+                        id='cohort-age-band',
+                        options=[{'label': band, 'value': band} for band in rollups.AGE_BANDS],
+                        value=list(rollups.AGE_BANDS),
+                        inline=True,
+                        inputStyle={'marginLeft': '15px', 'marginRight': '5px'}
+                    )
+                ], style=None if has_age else HIDDEN),
+                html.P(f"No {' or '.join(missing)} is recorded in this data, so there is nothing to filter on",
+                       style={'color': '#7f8c8d', 'marginTop': '10px'}) if missing else None,
+                html.Label("Scan dates:", style=LABEL_STYLE),
+                dcc.RangeSlider(
+                    id='cohort-months',
+                    min=first,
+                    max=last,
+                    step=1,
+                    value=[first, last],
+                    marks=month_marks(first, last),
+                    allowCross=False
+                ),
+                html.Label("Distribution of:", style=LABEL_STYLE),
+                dcc.Dropdown(
+                    id='cohort-part',
+                    options=[{'label': part, 'value': part} for part in parts],
+                    value='Total' if 'Total' in parts else (parts[0] if parts else None),
+                    clearable=False
+                )
+            ], style=CARD_STYLE),
+            html.Div(id='cohort-summary', style={'textAlign': 'center', 'fontWeight': 'bold'})
+        ], style={'maxWidth': '900px', 'margin': '0 auto'}),
+
+        dcc.Graph(id='cohort-box-graph', style={'marginBottom': '20px'}),
+        dcc.Graph(id='cohort-histogram-graph', style={'marginBottom': '20px'}),
+
+        # Medians of every metric, interpolated within the rollup's bins
+        html.Div([
+            html.H3("Approximate Medians", style={'textAlign': 'center'}),
+            html.P(f"Estimated from each measurement's distribution in {rollups.BINS} bins",
+                   style={'textAlign': 'center', 'color': '#7f8c8d'}),
+            dash_table.DataTable(
+                id='cohort-median-table',
+                columns=[{"name": "Body Part", "id": "Body Part"}] +
+                        [{"name": metric, "id": metric} for metric in rollups.METRICS],
+                style_table={'overflowX': 'auto'},
+                style_cell={
+                    'textAlign': 'center',
+                    'padding': '10px'
+                },
+                style_header={
+                    'backgroundColor': 'rgb(230, 230, 230)',
+                    'fontWeight': 'bold'
+                }
+            )
+        ], style={'margin': '20px'})
+    ])
+
+
+@callback(
+    [Output('cohort-summary', 'children'),
+     Output('cohort-box-graph', 'figure'),
+     Output('cohort-histogram-graph', 'figure'),
+     Output('cohort-median-table', 'data')],
+    [Input('cohort-metric', 'value'),
+     Input('cohort-sex', 'value'),
+     Input('cohort-age-band', 'value'),
+     Input('cohort-months', 'value'),
+     Input('cohort-part', 'value')]
+)
+def update_cohort(metric, sexes, bands, months, part):
+    snapshot = store.snapshot()
+    key = ('cohort', metric, tuple(sexes), tuple(bands), tuple(months), part, snapshot.fingerprint)
+    return figure_cache.get_or_build(key, lambda: build_cohort(snapshot, metric, sexes, bands, months, part))
+
+
+def build_cohort(snapshot, metric, sexes, bands, months, part):
+    rollup = snapshot.derived["cohort_rollup"].resolve()
+    cohort = rollup.select(sexes=sexes, bands=bands, months=months)
+    summary = (f"{cohort.patients:,} patients, at their latest scan from {rollups.month_label(months[0])} "
+               f"to {rollups.month_label(months[1])}")
+    histogram = create_histogram(cohort, part, metric) if part in cohort.parts else figures.figure([])
+    return summary, create_box_plot(cohort, metric), histogram, median_table(cohort)
@@ -1,16 +1,11 @@
 from dash import dcc, html, Input, Output, callback, register_page
-import plotly.graph_objects as go
-import pandas as pd
+import functools
 
-register_page(__name__, path="/dexa-dashboard", order=3)
-
-COMPOSITION_CSV_URL = "https://raw.githubusercontent.com/rigg-alex/DEXA_Dashboard/main/Data/composition_indices.csv"
+from dexa import figures, store
+from dexa.figure_cache import figure_cache
+from dexa import patient_index  # noqa: F401 - registers the patient indexes with the store
 
-# Load the data
-df = pd.read_csv(COMPOSITION_CSV_URL)
-df.columns = df.columns.str.replace("Â²", "²", regex=False).str.strip()
-df["Scan Date"] = pd.to_datetime(df["Scan Date"], format="%d/%m/%Y", errors="coerce")
-df.dropna(subset=["Scan Date"], inplace=True)
+register_page(__name__, path="/dexa-dashboard", order=3)
 
 METRICS = [
     "Total Body Weight (kg)",
@@ -31,135 +26,240 @@ METRICS = [
     "Total Bone Mass (%)"
 ]
 
+# Static figure layout, built once; only the metric name changes per graph
+TIME_SERIES_LAYOUT = {
+    'showlegend': True,
+    'height': 250,
+    'margin': {'l': 50, 'r': 50, 't': 50, 'b': 50},
+    'xaxis': {
+        'title': {'text': "Date"},
+        'showgrid': False,
+        'zeroline': True,
+        'linecolor': 'black',
+        'linewidth': 1,
+        'mirror': False,
+        'showline': True,
+        'showspikes': False
+    },
+    'yaxis': {
+        'showgrid': False,
+        'zeroline': False,
+        'linecolor': 'black',
+        'linewidth': 1,
+        'mirror': False,
+        'showline': True,
+        'showspikes': False
+    },
+    'legend': {
+        'orientation': "h",
+        'yanchor': "bottom",
+        'y': 0.85,
+        'xanchor': "center",
+        'x': 0.5,
+        'bgcolor': 'rgba(255,255,255,0)',
+        'font': {'size': 8}
+    },
+    # Remove borders
+    'plot_bgcolor': 'rgba(0,0,0,0)',
+    'paper_bgcolor': 'rgba(0,0,0,0)'
+}
+
 def create_time_series(df, metric):
-    df = df.copy()
     missing_mask = df[metric].isna()
     mean_value = df[metric].mean()
-    df[metric].fillna(mean_value, inplace=True)
-
-    fig = go.Figure()
+    values = df[metric].fillna(mean_value)
 
     # Main time series line
-    fig.add_trace(go.Scatter(
+    traces = [figures.scatter(
         x=df["Scan Date"],
-        y=df[metric],
+        y=values,
         mode='lines+markers',
         line=dict(width=2),
         marker=dict(size=8),
         name='Actual Data'
-    ))
+    )]
 
     # Highlight filled values
     if missing_mask.any():
-        fig.add_trace(go.Scatter(
+        traces.append(figures.scatter(
             x=df.loc[missing_mask, "Scan Date"],
-            y=df.loc[missing_mask, metric],
+            y=values[missing_mask],
             mode='markers',
             marker=dict(color='red', symbol='x', size=10),
             name='Filled Data (Mean)'
         ))
 
-    fig.update_layout(
-        title={
-            'text': metric,
-            'x': 0.5,
-            'xanchor': 'center',
-            'y': 0.95
-        },
-        xaxis_title="Date",
-        yaxis_title=metric,
-        showlegend=True,
-        height=250,
-        margin=dict(l=50, r=50, t=50, b=50),
-        xaxis=dict(
-            showgrid=False,
-            zeroline=True,
-            linecolor='black',
-            linewidth=1,
-            mirror=False,
-            showline=True,
-            showspikes=False
-        ),
-        yaxis=dict(
-            showgrid=False,
-            zeroline=False,
-            linecolor='black',
-            linewidth=1,
-            mirror=False,
-            showline=True,
-            showspikes=False
-        ),
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=0.85,
-            xanchor="center",
-            x=0.5,
-            bgcolor='rgba(255,255,255,0)',
-            font=dict(size=8)
-        ),
-        # Remove borders
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)'
-    )
-
-    return fig
+    layout = figures.merge(TIME_SERIES_LAYOUT, {
+        'title': {'text': metric, 'x': 0.5, 'xanchor': 'center', 'y': 0.95},
+        'yaxis': {'title': {'text': metric}}
+    })
+    return figures.figure(traces, layout)
+
+# One-figure view: every metric in its own row of a single shared-x figure, so
+# the browser creates one Plotly instance and receives one layout and template
+SMALL_MULTIPLES_ROW_HEIGHT = 170
+
+SMALL_MULTIPLES_LAYOUT = {
+    'height': SMALL_MULTIPLES_ROW_HEIGHT * len(METRICS),
+    'margin': {'l': 60, 'r': 30, 't': 60, 'b': 40},
+    'showlegend': True,
+    'legend': {
+        'orientation': "h",
+        'yanchor': "bottom",
+        'y': 1.005,
+        'xanchor': "center",
+        'x': 0.5,
+        'bgcolor': 'rgba(255,255,255,0)',
+        'font': {'size': 10}
+    },
+    'plot_bgcolor': 'rgba(0,0,0,0)',
+    'paper_bgcolor': 'rgba(0,0,0,0)'
+}
+
+SMALL_MULTIPLES_AXIS = {
+    'showgrid': False,
+    'linecolor': 'black',
+    'linewidth': 1,
+    'showline': True,
+    'showspikes': False
+}
+
+@functools.lru_cache(maxsize=None)
+def small_multiples_layout():
+    """ The shared-x layout for all of METRICS, with this page's axis styling. """
+    axis_styles = {}
+    for row in range(1, len(METRICS) + 1):
+        xaxis, yaxis = figures.axes(row)
+        axis_styles['xaxis' + xaxis[1:]] = SMALL_MULTIPLES_AXIS
+        axis_styles['yaxis' + yaxis[1:]] = dict(SMALL_MULTIPLES_AXIS, zeroline=False)
+    axis_styles['xaxis' + figures.axes(len(METRICS))[0][1:]] = dict(SMALL_MULTIPLES_AXIS, title={'text': "Date"})
+    return figures.shared_x_layout(METRICS, figures.merge(SMALL_MULTIPLES_LAYOUT, axis_styles))
+
+def create_small_multiples(df):
+    layout = small_multiples_layout()
+    traces = []
+    for row, metric in enumerate(METRICS, start=1):
+        xaxis, yaxis = figures.axes(row)
+        missing_mask = df[metric].isna()
+        values = df[metric].fillna(df[metric].mean())
+
+        traces.append(figures.scatter(
+            x=df["Scan Date"],
+            y=values,
+            mode='lines+markers',
+            line=dict(width=2, color='#1f77b4'),
+            marker=dict(size=6, color='#1f77b4'),
+            name='Actual Data',
+            legendgroup='actual',
+            showlegend=row == 1,
+            xaxis=xaxis,
+            yaxis=yaxis
+        ))
+
+        # Highlight filled values
+        if missing_mask.any():
+            traces.append(figures.scatter(
+                x=df.loc[missing_mask, "Scan Date"],
+                y=values[missing_mask],
+                mode='markers',
+                marker=dict(color='red', symbol='x', size=10),
+                name='Filled Data (Mean)',
+                legendgroup='filled',
+                showlegend=not any(trace.get('legendgroup') == 'filled' for trace in traces),
+                xaxis=xaxis,
+                yaxis=yaxis
+            ))
+
+    return figures.figure(traces, layout)
 
 # Layout
-layout = html.Div([
-    html.H2("Composition Indices Analysis", 
-            style={'textAlign': 'center', 'marginBottom': '20px'}),
+def layout():
+    patients = store.snapshot().derived["composition_index"].patients()
+    return html.Div([
+        html.H2("Composition Indices Analysis", 
+                style={'textAlign': 'center', 'marginBottom': '20px'}),
 
-    # Patient selector in a card
-    html.Div([
+        # Patient selector in a card
         html.Div([
-            html.Label("Select Patient:", 
-                      style={'marginBottom': '10px', 'display': 'block', 'fontWeight': 'bold'}),
-            dcc.RadioItems(
-                id='patient-selector',
-                options=[{'label': name, 'value': name} 
-                        for name in sorted(df["Patient Name"].unique())],
-                value=sorted(df["Patient Name"].unique())[0] if not df.empty else None,
-                style={'display': 'flex', 'flexDirection': 'column', 'gap': '10px'}
-            )
-        ], style={
-            'backgroundColor': 'white',
-            'padding': '20px',
-            'borderRadius': '8px',
-            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
-            'marginBottom': '20px'
-        })
-    ], style={'width': '300px', 'margin': '0 auto'}),
-
-    # Graphs container with fixed height and scrolling
-    html.Div(
-        id='graphs-container',
-        style={
-            'display': 'grid',
-            'gridTemplateColumns': 'repeat(auto-fit, minmax(350px, 1fr))',
-            'gap': '20px',
-            'padding': '20px',
-            'maxHeight': 'calc(100vh - 250px)',
-            'overflowY': 'auto',
-            'overflowX': 'hidden'
-        }
-    )
-])
+            html.Div([
+                html.Label("Select Patient:", 
+                          style={'marginBottom': '10px', 'display': 'block', 'fontWeight': 'bold'}),
+                dcc.RadioItems(
+                    id='patient-selector',
+                    options=[{'label': name, 'value': name} for name in patients],
+                    value=patients[0] if patients else None,
+                    style={'display': 'flex', 'flexDirection': 'column', 'gap': '10px'}
+                ),
+                html.Label("View:",
+                          style={'margin': '20px 0 10px 0', 'display': 'block', 'fontWeight': 'bold'}),
+                dcc.RadioItems(
+                    id='composition-view-mode',
+                    options=[{'label': 'Single figure', 'value': 'combined'},
+                             {'label': 'Separate graphs', 'value': 'grid'}],
+                    value='combined',
+                    style={'display': 'flex', 'flexDirection': 'column', 'gap': '10px'}
+                )
+            ], style={
+                'backgroundColor': 'white',
+                'padding': '20px',
+                'borderRadius': '8px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                'marginBottom': '20px'
+            })
+        ], style={'width': '300px', 'margin': '0 auto'}),
+
+        # Graphs container with fixed height and scrolling
+        html.Div(
+            id='graphs-container',
+            style={
+                'display': 'grid',
+                'gridTemplateColumns': 'repeat(auto-fit, minmax(350px, 1fr))',
+                'gap': '20px',
+                'padding': '20px',
+                'maxHeight': 'calc(100vh - 250px)',
+                'overflowY': 'auto',
+                'overflowX': 'hidden'
+            }
+        )
+    ])
 
 
 @callback(
     Output('graphs-container', 'children'),
-    Input('patient-selector', 'value')
+    Input('patient-selector', 'value'),
+    Input('composition-view-mode', 'value')
 )
-def update_graphs(selected_patient):
+def update_graphs(selected_patient, view_mode='combined'):
     if not selected_patient:
         return html.Div("Please select a patient")
 
-    patient_df = df[df["Patient Name"] == selected_patient].sort_values("Scan Date")
+    snapshot = store.snapshot()
+    key = ('dexa-dashboard', selected_patient, view_mode, snapshot.fingerprint)
+    return figure_cache.get_or_build(key, lambda: build_graphs(snapshot, selected_patient, view_mode))
+
+def build_graphs(snapshot, selected_patient, view_mode='combined'):
+    patient_df = snapshot.derived["composition_index"].patient(selected_patient)
     
     if patient_df.empty:
         return html.Div("No data available for selected patient")
 
+    if view_mode == 'combined':
+        return [
+            html.Div([
+                dcc.Graph(
+                    figure=create_small_multiples(patient_df),
+                    config={'displayModeBar': False},
+                    style={'background': 'white'}
+                )
+            ], style={
+                'gridColumn': '1 / -1',
+                'borderRadius': '8px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                'padding': '15px',
+                'background': 'white'
+            })
+        ]
+
     # Return an empty list first to clear the container
     return [
         [], # Clear the container before adding new graphs
@@ -1,9 +1,11 @@
 from dash import dcc, html, Input, Output, callback, register_page
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
 import warnings
+from datetime import date
+
+from dexa import figures, store
+from dexa.figure_cache import figure_cache
+from dexa import patient_index  # noqa: F401 - registers the patient indexes with the store
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
@@ -11,83 +13,96 @@ warnings.filterwarnings('ignore')
 # Register as home page
 register_page(__name__, path="/", order=1)
 
-# GitHub raw URLs for the CSVs (replace <username> and <repo> with your actual details)
-MASTER_CSV_URL = "https://raw.githubusercontent.com/rigg-alex/DEXA_Dashboard/main/Data/master_dexa_data.csv"
-COMPOSITION_CSV_URL = "https://raw.githubusercontent.com/rigg-alex/DEXA_Dashboard/main/Data/composition_indices.csv"
-
-def load_data():
-    master_df = pd.read_csv(MASTER_CSV_URL)
-    master_df["Scan Date"] = pd.to_datetime(master_df["Scan Date"], format="%d-%m-%Y")
-    
-    composition_df = pd.read_csv(COMPOSITION_CSV_URL)
-    composition_df["Scan Date"] = pd.to_datetime(composition_df["Scan Date"], dayfirst=True)
-    
-    return master_df.sort_values('Scan Date'), composition_df.sort_values('Scan Date')
-
 def get_trend_symbol(current, previous):
     return "↑" if current > previous else "↓" if current < previous else "→"
 
-master_df, composition_df = load_data()
+# Static figure layouts, built once
+MAIN_TRENDS_LAYOUT = {
+    'title': {'text': "Weight and Lean Mass Trends"},
+    'height': 400,
+    'showlegend': True
+}
+
+VISCERAL_TRACE = {
+    'hovertemplate': 'Scan Date=%{x}<br>Visceral Fat Area (cm²)=%{y}<extra></extra>',
+    'legendgroup': '',
+    'line': {'color': '#636efa', 'dash': 'solid'},
+    'marker': {'symbol': 'circle'},
+    'mode': 'lines',
+    'name': '',
+    'orientation': 'v',
+    'showlegend': False,
+    'xaxis': 'x',
+    'yaxis': 'y'
+}
+
+VISCERAL_LAYOUT = {
+    'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': 'Scan Date'}},
+    'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': 'Visceral Fat Area (cm²)'}},
+    'legend': {'tracegroupgap': 0},
+    'title': {'text': "Visceral Fat Area Trend"}
+}
 
 # Layout
-layout = html.Div([
-    html.H2("DEXA Analysis Overview", style={'textAlign': 'center', 'marginBottom': '20px'}),
+def layout():
+    patients = store.snapshot().derived["master_index"].patients()
+    return html.Div([
+        html.H2("DEXA Analysis Overview", style={'textAlign': 'center', 'marginBottom': '20px'}),
     
-    # Patient selector
-    html.Div([
-        html.Label("Select Patient:"),
-        dcc.Dropdown(
-            id='patient-selector',
-            options=[{'label': name, 'value': name} 
-                    for name in sorted(master_df["Patient Name"].unique())],
-            value=sorted(master_df["Patient Name"].unique())[0],
-            clearable=False
-        )
-    ], style={'width': '300px', 'margin': '0 auto 30px auto'}),
-    
-    # Stats Cards in a grid
-    html.Div([
-        # Latest Scan Card
+        # Patient selector
         html.Div([
-            html.H4("Latest DEXA Scan", style={'marginBottom': '10px', 'textAlign': 'center'}),
-            html.Div(id='latest-scan-info', style={'textAlign': 'center'})
-        ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
-        
-        # Current Ratios Card
+            html.Label("Select Patient:"),
+            dcc.Dropdown(
+                id='patient-selector',
+                options=[{'label': name, 'value': name} for name in patients],
+                value=patients[0],
+                clearable=False
+            )
+        ], style={'width': '300px', 'margin': '0 auto 30px auto'}),
+    
+        # Stats Cards in a grid
         html.Div([
-            html.H4("Current Ratios", style={'marginBottom': '10px', 'textAlign': 'center'}),
-            html.Div(id='ratios-info', style={'textAlign': 'center'})
-        ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
+            # Latest Scan Card
+            html.Div([
+                html.H4("Latest DEXA Scan", style={'marginBottom': '10px', 'textAlign': 'center'}),
+                html.Div(id='latest-scan-info', style={'textAlign': 'center'})
+            ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
         
-        # Current Body Composition Card
-        html.Div([
-            html.H4("Current Body Composition", style={'marginBottom': '10px', 'textAlign': 'center'}),
-            html.Div(id='composition-info', style={'textAlign': 'center'})
-        ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
+            # Current Ratios Card
+            html.Div([
+                html.H4("Current Ratios", style={'marginBottom': '10px', 'textAlign': 'center'}),
+                html.Div(id='ratios-info', style={'textAlign': 'center'})
+            ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
+        
+            # Current Body Composition Card
+            html.Div([
+                html.H4("Current Body Composition", style={'marginBottom': '10px', 'textAlign': 'center'}),
+                html.Div(id='composition-info', style={'textAlign': 'center'})
+            ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
         
-        # Records Card
+            # Records Card
+            html.Div([
+                html.H4("Personal Records", style={'marginBottom': '10px', 'textAlign': 'center'}),
+                html.Div(id='records-info', style={'textAlign': 'center'})
+            ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
+        ], style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr', 'gap': '20px', 'marginBottom': '30px'}),
+    
+        # Main Graph
         html.Div([
-            html.H4("Personal Records", style={'marginBottom': '10px', 'textAlign': 'center'}),
-            html.Div(id='records-info', style={'textAlign': 'center'})
-        ], style={'backgroundColor': 'white', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
-    ], style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr', 'gap': '20px', 'marginBottom': '30px'}),
+            dcc.Graph(id='main-trends-graph')
+        ], style={'marginBottom': '30px'}),
     
-    # Main Graph
-    html.Div([
-        dcc.Graph(id='main-trends-graph')
-    ], style={'marginBottom': '30px'}),
-    
-    # Bottom Graphs
-    html.Div([
+        # Bottom Graphs
         html.Div([
-            dcc.Graph(id='visceral-fat-graph')
-        ], style={'width': '48%', 'display': 'inline-block'}),
+            html.Div([
+                dcc.Graph(id='visceral-fat-graph')
+            ], style={'width': '48%', 'display': 'inline-block'}),
         
-        html.Div([
-            dcc.Graph(id='body-composition-graph')
-        ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%'})
+            html.Div([
+                dcc.Graph(id='body-composition-graph')
+            ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%'})
+        ])
     ])
-])
 
 @callback(
     [Output('latest-scan-info', 'children'),
@@ -100,10 +115,14 @@ layout = html.Div([
     Input('patient-selector', 'value')
 )
 def update_page_content(selected_patient):
-    patient_master_df = master_df[master_df['Patient Name'] == selected_patient]
-    patient_composition_df = composition_df[composition_df['Patient Name'] == selected_patient]
-    
-    total_df = patient_master_df[patient_master_df['Body Part'] == 'Total'].sort_values('Scan Date')
+    snapshot = store.snapshot()
+    # "Days since last scan" changes daily, so today's date is part of the key
+    key = ('overview', selected_patient, date.today().isoformat(), snapshot.fingerprint)
+    return figure_cache.get_or_build(key, lambda: build_page_content(snapshot, selected_patient))
+
+def build_page_content(snapshot, selected_patient):
+    patient_composition_df = snapshot.derived["composition_index"].patient(selected_patient)
+    total_df = snapshot.derived["master_index"].part(selected_patient, 'Total')
     latest_date = total_df['Scan Date'].max()
     
     # Latest scan info
@@ -145,29 +164,28 @@ def update_page_content(selected_patient):
     ]
     
     # Main trends graph
-    main_fig = make_subplots(specs=[[{"secondary_y": True}]])
-    main_fig.add_trace(go.Scatter(x=total_df['Scan Date'], y=total_df['Total Mass (kg)'],
-                                  name="Total Weight", line=dict(color='#2C3E50', width=3)),
-                       secondary_y=False)
-    main_fig.add_trace(go.Scatter(x=total_df['Scan Date'], y=total_df['Lean (g)']/1000,
-                                  name="Lean Mass", line=dict(color='#E74C3C', width=3)),
-                       secondary_y=True)
-    main_fig.update_layout(
-        title="Weight and Lean Mass Trends",
-        height=400,
-        template="plotly_white",
-        showlegend=True,
+    main_fig = figures.figure(
+        [figures.scatter(x=total_df['Scan Date'], y=total_df['Total Mass (kg)'],
+                         name="Total Weight", line=dict(color='#2C3E50', width=3), xaxis='x', yaxis='y'),
+         figures.scatter(x=total_df['Scan Date'], y=total_df['Lean (g)']/1000,
+                         name="Lean Mass", line=dict(color='#E74C3C', width=3), xaxis='x', yaxis='y2')],
+        figures.secondary_y_layout(MAIN_TRENDS_LAYOUT),
+        template_name="plotly_white"
     )
     
-    # Visceral fat graph
-    visceral_fig = px.line(patient_composition_df, x='Scan Date', y='Visceral Fat Area (cm²)',
-                          title="Visceral Fat Area Trend")
+    # Visceral fat graph (same figure px.line builds)
+    visceral_fig = figures.figure(
+        [figures.scatter(x=patient_composition_df['Scan Date'], y=patient_composition_df['Visceral Fat Area (cm²)'],
+                         **VISCERAL_TRACE)],
+        VISCERAL_LAYOUT
+    )
     
     # Body composition graph
-    comp_fig = go.Figure()
-    comp_fig.add_trace(go.Scatter(x=patient_composition_df['Scan Date'], 
-                                  y=patient_composition_df['Total Body Fat (%)'], name="Fat %"))
-    comp_fig.add_trace(go.Scatter(x=patient_composition_df['Scan Date'], 
-                                  y=patient_composition_df['Total Lean Body (%)'], name="Lean %"))
+    comp_fig = figures.figure([
+        figures.scatter(x=patient_composition_df['Scan Date'], 
+                        y=patient_composition_df['Total Body Fat (%)'], name="Fat %"),
+        figures.scatter(x=patient_composition_df['Scan Date'], 
+                        y=patient_composition_df['Total Lean Body (%)'], name="Lean %")
+    ])
     
     return latest_scan, ratios_info, composition_info, records_info, main_fig, visceral_fig, comp_fig